@@ -0,0 +1,195 @@
+# Approximate engine.  Evaluates sums and success counts of pools too large
+#  to be worth convolving or sampling, analytically: an Edgeworth expansion
+#  around the normal distribution built from the exact cumulants of the dice.
+
+import math
+
+import numpy as np
+
+from . import sim_config as cfg
+from . import sim_backend
+from . import sim_exact
+
+# Berry-Esseen constant for sums of independent, not identically distributed
+#  variables (Shevtsova, 2010)
+BERRY_ESSEEN_CONSTANT = 0.5600
+
+
+def has_approximate_form(config):
+    """
+    Returns True if the pool in config can be approximated: its outcome must
+    be a sum of independent per-die values, which is the case for exactly
+    the pools that have an exact form.
+    """
+    return sim_exact.has_exact_form(config)
+
+
+def die_cumulants(die_type, config):
+    """
+    Returns an array of the first four cumulants of the contribution of one
+    die of die_type to the outcome of the pool in config, followed by its
+    third absolute central moment.  Plain (and rerolled) dice are uniform
+    over n consecutive faces, and successes are Bernoulli(p), both of whose
+    cumulants have closed forms; exploding and custom dice take theirs from
+    the moments of their value distribution.
+    Requires: sim_exact.die_value_pmf()
+    """
+    offset, pmf = sim_exact.die_value_pmf(die_type, config)
+    values = np.arange(offset, offset + len(pmf))
+    uniform = not (
+        die_type in config["explode"] or sim_backend.is_custom_die(die_type)
+    )
+
+    if config["mode"] == "Successes":
+        succeeds = values >= config["success_threshold"]
+        if uniform:
+            p = np.count_nonzero(succeeds) / len(pmf)
+        else:
+            p = float(pmf[succeeds].sum())
+        q = 1 - p
+        return np.array(
+            [
+                p,
+                p * q,
+                p * q * (q - p),
+                p * q * (1 - 6 * p * q),
+                p * q * (p * p + q * q),
+            ]
+        )
+
+    if uniform:
+        n = len(pmf)
+        mean = offset + (n - 1) / 2
+        deviations = np.abs(values - mean)
+        return np.array(
+            [
+                mean,
+                (n * n - 1) / 12,
+                0.0,
+                -(n * n - 1) * (n * n + 1) / 120,
+                float(deviations**3 @ pmf),
+            ]
+        )
+
+    mean = float(values @ pmf)
+    deviations = values - mean
+    moments = [float(deviations**k @ pmf) for k in (2, 3, 4)]
+    return np.array(
+        [
+            mean,
+            moments[0],
+            moments[1],
+            moments[2] - 3 * moments[0] ** 2,
+            float(np.abs(deviations) ** 3 @ pmf),
+        ]
+    )
+
+
+def outcome_lattice(config):
+    """
+    Returns a tuple (span, residue) such that every outcome of the pool in
+    config is residue plus a multiple of span.  Sums of dice whose values
+    all differ by multiples of some span above 1 (e.g. custom dice with
+    faces 0, 5 and 10) only land on every span-th integer; successes are
+    counted one by one, so have a span of 1.
+    Requires: sim_exact.die_value_pmf()
+    """
+    if config["mode"] != "Sum":
+        return 1, 0
+    span = 0
+    residue = 0
+    for die_type, die_amt in config["dice"].items():
+        offset, pmf = sim_exact.die_value_pmf(die_type, config)
+        values = offset + np.flatnonzero(pmf)
+        span = math.gcd(span, *(int(v) for v in values - values[0]))
+        residue += die_amt * int(values[0])
+    # Dice that always show the same value leave no span at all
+    span = max(span, 1)
+    return span, residue % span
+
+
+def edgeworth_pmf(outcomes, cumulants):
+    """
+    Returns the Edgeworth expansion of the probabilities of the integer
+    outcomes of a sum with the given first four cumulants, to the terms in
+    the skewness g1 and excess kurtosis g2 (Hermite polynomials He_k of the
+    standardized outcome z):
+    phi(z) / sigma * (1 + g1 / 6 He3 + g2 / 24 He4 + g1^2 / 72 He6).
+    The expansion can dip below zero far out in the tails; those outcomes
+    are clipped to zero.
+    """
+    mean, variance, third, fourth = cumulants
+    sigma = math.sqrt(variance)
+    z = (outcomes - mean) / sigma
+    skewness = third / sigma**3
+    kurtosis = fourth / sigma**4
+    z2 = z * z
+    he3 = z * (z2 - 3)
+    he4 = z2 * (z2 - 6) + 3
+    he6 = z2 * (z2 * (z2 - 15) + 45) - 15
+    density = np.exp(-z2 / 2) / (sigma * math.sqrt(2 * math.pi))
+    density *= 1 + skewness / 6 * he3 + kurtosis / 24 * he4 + skewness**2 / 72 * he6
+    return np.maximum(density, 0)
+
+
+def approximate_distribution(config):
+    """
+    Approximates the outcome distribution of the pool in config, for which
+    has_approximate_form() holds, and returns it as a SimResult holding
+    probabilities.  The cumulants of the sum are the sums of those of its
+    dice, so the work doesn't grow with the number of dice; only outcomes
+    within APPROX_SIGMAS standard deviations of the mean are evaluated, and
+    the probabilities are normalized over them.  Sums that only land on the
+    lattice of outcome_lattice() are evaluated on it alone, each outcome
+    taking the density of the span around it.  Success counts after drops
+    are mapped from the approximated successes of all the dice.
+    The result's metadata holds the "normal_error_bound": the Berry-Esseen
+    bound on the largest error of the plain normal approximation's
+    cumulative probabilities, C * sum(rho_i) / sigma^3.  It is a yardstick,
+    not a bound on the returned distribution: the Edgeworth terms, clipping
+    and renormalization usually err far less, but carry no proven bound.
+    Requires: die_cumulants(), outcome_lattice(), edgeworth_pmf(),
+              sim_exact.drop_successes()
+    """
+    cumulants = np.zeros(5)
+    for die_type, die_amt in config["dice"].items():
+        cumulants += die_amt * die_cumulants(die_type, config)
+    mean, variance = cumulants[0], cumulants[1]
+    min_outcome, max_outcome = sim_backend.outcome_bounds(config)
+
+    if config["mode"] == "Successes" and config["num_drops"] > 0:
+        # Successes of all the dice, before drops
+        low, high = 0, sum(config["dice"].values())
+    else:
+        low, high = min_outcome, max_outcome
+    # Variances within float error of zero are of pools that always roll the
+    #  same, e.g. exploding dice that always succeed
+    if variance > 1e-12:
+        spread = cfg.APPROX_SIGMAS * math.sqrt(variance)
+        low = max(low, math.floor(mean - spread))
+        high = min(high, math.ceil(mean + spread))
+        outcomes = np.arange(low, high + 1)
+        span, residue = outcome_lattice(config)
+        pmf = span * edgeworth_pmf(outcomes, cumulants[:4])
+        pmf[(outcomes - residue) % span != 0] = 0
+        normal_error_bound = min(
+            1.0, BERRY_ESSEEN_CONSTANT * cumulants[4] / variance**1.5
+        )
+    else:
+        low = high = round(mean)
+        pmf = np.ones(1)
+        normal_error_bound = 0.0
+    pmf /= pmf.sum()
+
+    if config["mode"] == "Successes" and config["num_drops"] > 0:
+        full = np.zeros(sum(config["dice"].values()) + 1)
+        full[low : high + 1] = pmf
+        kept = sim_exact.drop_successes(config, full)
+        nonzero = np.flatnonzero(kept)
+        low, high = int(nonzero[0]), int(nonzero[-1])
+        pmf = kept[low : high + 1]
+
+    result = sim_backend.SimResult(config, low, pmf)
+    result.metadata["engine"] = "Approximate"
+    result.metadata["normal_error_bound"] = normal_error_bound
+    return result
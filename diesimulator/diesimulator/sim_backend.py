@@ -2,10 +2,47 @@
 #  and aggregating results for use by plotter.
 
 import math
+import multiprocessing
+import os
 import random as rand
+import secrets
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
 
 from . import sim_config as cfg
 
+# Sobol sequence direction number parameters (Joe & Kuo) for dimensions 2 and
+#  up, as tuples (s, a, m): degree s and coefficients a of the primitive
+#  polynomial, and initial direction numbers m; dimension 1 is van der Corput.
+#  Dice past the last dimension here are padded with pseudorandom uniforms.
+SOBOL_DIRECTIONS = [
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+    (6, 19, (1, 1, 1, 15, 7, 5)),
+    (6, 22, (1, 3, 1, 15, 13, 25)),
+    (6, 25, (1, 1, 5, 5, 19, 61)),
+    (7, 1, (1, 3, 7, 11, 23, 15, 103)),
+    (7, 4, (1, 3, 7, 13, 13, 15, 69)),
+]
+
+# Bits of precision of generated Sobol points
+SOBOL_BITS = 32
+
 
 class Simulator:
     # Dictionary where keys are types of dice and vals are number of that die
@@ -13,7 +50,8 @@ class Simulator:
     dice = {}
 
     # Operation mode
-    #  available modes {'Sum', 'Successes'}
+    #  available modes {'Sum', 'Successes', 'Highest', 'Lowest'}
+    #  Highest and Lowest are the value of the highest or lowest kept die
     mode = "Sum"
 
     # Die roll must be >= this number to be counted as a success, min 1
@@ -27,9 +65,39 @@ class Simulator:
     # Reroll all dice equal to or below this number
     reroll_threshold = 0
 
+    # Die types that explode, i.e. roll again and add on their highest face
+    explode_dice = []
+    # Maximum number of times a single die may explode in one roll
+    explode_depth = cfg.EXPLODE_DEFAULT_DEPTH
+
+    # Definitions of the custom die types known by name, as dicts of their
+    #  'faces' and the 'weights' of each; dice keyed by name are custom dice
+    custom_dice = dict(cfg.CUSTOM_DICE)
+
     # Simulation trials to run
     num_trials = 60000
 
+    # Random number generator backend used to run simulations
+    #  available backends {'stdlib', 'PCG64', 'Philox', 'SFC64'}
+    rng_backend = "PCG64"
+    # Seed for the random number generator; None draws a fresh seed each run
+    #  (which is then recorded in the run's result, so it can be reproduced)
+    seed = None
+
+    # Sampling scheme used to run simulations
+    #  available samplers {'Plain', 'Antithetic', 'Stratified', 'Sobol'}
+    #  all but 'Plain' are variance-reduction schemes run vectorized
+    sampler = "Plain"
+
+    # Whether runs of pools the approximate engine handles (sums and success
+    #  counts of independent dice) use its quick analytic approximation
+    #  instead of the engine the planner picks
+    approximate = False
+
+    # Addresses ('host:port') of distributed workers; plain runs are split
+    #  across them when any are listed
+    workers = list(cfg.DISTRIBUTED_WORKERS)
+
     # The confidence level for MoE calculations
     #  must be one of the confidence interval values in cfg file!
     CI_level = 90
@@ -38,6 +106,21 @@ class Simulator:
     #  for any given simulation run
     freq = {}
 
+    # SimResult holding the raw tallies of the last simulation run
+    result = None
+
+    # SimResults of every metric of the pool of the last plain simulation
+    #  run, all tallied from the same rolls, keyed by metric_key(); lets the
+    #  mode and success threshold be switched without running again
+    metrics = {}
+
+    # If an outcome's probability is at least this number of times smaller
+    #  than the most likely outcome's, leave it out of the sanitized results
+    cutoff_sensitivity = cfg.CUTOFF_SENSITIVITY
+    # Probability mass left out of the sanitized results from each tail,
+    #  as a tuple (below the most likely outcome, above it)
+    trimmed_mass = (0, 0)
+
     @classmethod
     def modify_dice(cls, die_type, operation, n=1):
         """
@@ -75,6 +158,34 @@ class Simulator:
         for i in to_delete:
             cls.dice.pop(i)
 
+    @classmethod
+    def get_config(cls):
+        """
+        Returns a snapshot of the current dice pool configuration as a dict,
+        decoupled from the Simulator's attributes.  Engines that evaluate
+        pools other than the one currently set up (e.g. comparisons) take
+        configurations in this form.
+        """
+        num_drops = cls.num_drops
+        # Number of drops spinner keeps its value when drops are disabled
+        if cls.mode_drop == "Do not drop":
+            num_drops = 0
+
+        return {
+            "dice": dict(cls.dice),
+            "mode": cls.mode,
+            "success_threshold": cls.success_threshold,
+            "mode_drop": cls.mode_drop,
+            "num_drops": num_drops,
+            "reroll_threshold": cls.reroll_threshold,
+            # Only die types actually in the pool are kept, in sorted order
+            "explode": sorted(d for d in cls.explode_dice if d in cls.dice),
+            "explode_depth": cls.explode_depth,
+            "custom_dice": {
+                d: cls.custom_dice[d] for d in cls.dice if is_custom_die(d)
+            },
+        }
+
     @classmethod
     def clear_die_pool(cls):
         """
@@ -82,6 +193,7 @@ class Simulator:
         to dice pool (drops, success and reroll threshold)
         """
         cls.dice.clear()
+        cls.explode_dice.clear()
         cls.success_threshold = 1
         cls.num_drops = 0
         cls.reroll_threshold = 0
@@ -126,6 +238,28 @@ class Simulator:
         # Display MoE to the nearest tenth of a percentage point
         return round(moe, 1)
 
+    @classmethod
+    def calculate_empirical_MoE(cls):
+        """
+        Calculates the margin of error of the last simulation run in
+        percentage points from the standard errors its sampler reported,
+        taking the widest over all outcomes, at the current CI level.
+        Exact results have none.  Returns None if the last run did not
+        report standard errors.
+        """
+        if cls.result is None:
+            return None
+        if cls.result.num_trials is None:
+            return 0.0
+        if "std_error" not in cls.result.metadata:
+            return None
+
+        moe = cls.result.metadata["std_error"].max()
+        moe = moe * 100 * cfg.ZSTAR_VALS[cls.CI_level]
+
+        # Display MoE to the nearest tenth of a percentage point
+        return round(moe, 1)
+
     @classmethod
     def generate_dice_str_from_pool(cls):
         """
@@ -137,14 +271,36 @@ class Simulator:
         # Removes leading '+'
         return dice_str[1:]
 
+    @classmethod
+    def roll_die(cls, die_type):
+        """
+        Rolls a single die of die_type, rerolling until above the reroll
+        threshold in the current Simulator configuration, and returns the value.
+        Custom dice land on one of their faces with the chance of its weight,
+        and are never rerolled.
+        Necessary for: perform_roll()
+        """
+        if is_custom_die(die_type):
+            spec = cls.custom_dice[die_type]
+            return rand.choices(spec["faces"], spec["weights"])[0]
+
+        while True:
+            # +1 here since dice values are in form [1, n], not [1, n)
+            next_result = rand.randrange(1, die_type + 1)
+            # Strict inequality as reroll treshold defined as the highest
+            #  value that needs to be rerolled
+            if next_result > cls.reroll_threshold:
+                return next_result
+
     @classmethod
     def perform_roll(cls):
         """
-        Performs a single roll with current dice in dictionary, rerolling and
-                dropping dice as applicable based on current Simulator attributes, then
-                returns a list of the die outcomes.
-        Requires: drop_dice()
-        Necessary for: perform_sim()
+        Performs a single roll with current dice in dictionary, rerolling,
+        exploding and dropping dice as applicable based on current Simulator
+        attributes, then returns a list of the die outcomes.
+        An exploded die counts as one die whose value is its running total.
+        Requires: roll_die(), drop_dice()
+        Necessary for: perform_sim_loop()
         """
         single_roll = []
         next_result = 0
@@ -152,13 +308,17 @@ class Simulator:
         # Performs roll and rerolls dice until above reroll threshold
         for die_type, die_amt in cls.dice.items():
             for _ in range(die_amt):
-                while True:
-                    # +1 here since dice values are in form [1, n], not [1, n)
-                    next_result = rand.randrange(1, die_type + 1)
-                    # Strict inequality as reroll treshold defined as the highest
-                    #  value that needs to be rerolled
-                    if next_result > cls.reroll_threshold:
-                        break
+                next_result = cls.roll_die(die_type)
+
+                # Exploding dice roll again and add while on their highest face
+                if die_type in cls.explode_dice:
+                    explosion = next_result
+                    for _ in range(cls.explode_depth):
+                        if explosion != die_type:
+                            break
+                        explosion = cls.roll_die(die_type)
+                        next_result += explosion
+
                 single_roll.append(next_result)
 
         # Drops appropriate number of dice
@@ -171,7 +331,7 @@ class Simulator:
         """
         Returns the number of successes in roll based on the success threshold
         in the current Simulator configuration.
-        Necessary for: perform_sim()
+        Necessary for: perform_sim_loop()
         """
         successes = 0
         for outcome in roll:
@@ -179,16 +339,113 @@ class Simulator:
                 successes += 1
         return successes
 
+    @classmethod
+    def new_rng(cls):
+        """
+        Returns a tuple (rng, seed) of a generator from the Simulator's RNG
+        backend and the seed it was created with: the Simulator's seed if set,
+        otherwise a freshly drawn one, so that every run can be reproduced.
+        Requires: make_rng()
+        """
+        seed = cls.seed
+        if seed is None:
+            seed = secrets.randbits(32)
+        return make_rng(cls.rng_backend, seed), seed
+
     @classmethod
     def perform_sim(cls):
         """
-        Performs a simulation run of number of trials stored in Simulator,
-        tallying outcome frequencies to Simulator's frequency dict.
-        Requires: perform_roll(), get_successes()
+        Performs a vectorized simulation run of number of trials stored in
+        Simulator with the Simulator's sampler and RNG backend, keeping the
+        raw tallies as a SimResult in Simulator's result.  The backend and seed
+        used are recorded in the result's metadata.  Plain runs are sampled in
+        count_parts() seeded parts, so they come out the same whether large
+        runs spread them over up to PARALLEL_WORKERS processes, one per CPU,
+        or other runs sample them here, and tally every metric at once into
+        Simulator's metrics unless the dice show more than METRICS_MAX_VALUES
+        values.  Runs of the other samplers tally only the metric shown.
+        Requires: new_rng(), sample_with(), parallel_workers(), sample_parallel(),
+                  die_value_range(), sample_metrics_parallel(),
+                  sample_metrics_parts(), sample_parts()
         """
-        rand.seed()
-        # Resets frequency dictionary from any past simulation run(s)
+        # Resets frequency dictionary and metrics from any past simulation run(s)
         cls.freq.clear()
+        cls.metrics = {}
+
+        rng, seed = cls.new_rng()
+        config = cls.get_config()
+        num_workers = parallel_workers(cls.sampler, cls.num_trials)
+        low, high = die_value_range(config)
+        if cls.sampler != "Plain":
+            cls.result = sample_with(config, cls.num_trials, cls.sampler, rng)
+        elif high - low < cfg.METRICS_MAX_VALUES:
+            if num_workers > 1:
+                cls.metrics = sample_metrics_parallel(
+                    config, cls.num_trials, num_workers, cls.rng_backend, seed
+                )
+            else:
+                cls.metrics = sample_metrics_parts(
+                    config, cls.num_trials, cls.rng_backend, seed
+                )
+            for result in cls.metrics.values():
+                result.metadata["rng"] = cls.rng_backend
+                result.metadata["seed"] = seed
+            cls.result = cls.metrics[metric_key(canonical_config(config))]
+        elif num_workers > 1:
+            cls.result = sample_parallel(
+                config, cls.num_trials, num_workers, cls.rng_backend, seed
+            )
+        else:
+            cls.result = sample_parts(config, cls.num_trials, cls.rng_backend, seed)
+        cls.result.metadata["rng"] = cls.rng_backend
+        cls.result.metadata["seed"] = seed
+
+    @classmethod
+    def switch_metric(cls):
+        """
+        Makes the metrics result of the Simulator's current mode and success
+        threshold the current result, if the last run tallied it for the
+        current pool, so that switching either needs no new run.
+        Returns True if the result was switched.
+        Requires: metric_key()
+        """
+        if not cls.metrics or not cls.dice:
+            return False
+        config = canonical_config(cls.get_config())
+        result = cls.metrics.get(metric_key(config))
+        if result is None or result is cls.result or result.config != config:
+            return False
+        cls.result = result
+        return True
+
+    @classmethod
+    def result_outdated(cls):
+        """
+        Returns True if the Simulator's result is of other pool settings
+        than the current ones, e.g. of another mode after a run that only
+        tallied the metric it showed (exact, approximate, distributed and
+        variance-reduction runs), so that plotting them takes a new run.
+        Requires: canonical_config()
+        """
+        if cls.result is None or not cls.dice:
+            return False
+        try:
+            config = canonical_config(cls.get_config())
+        except ValueError:
+            return False
+        return config != canonical_config(cls.result.config)
+
+    @classmethod
+    def perform_sim_loop(cls, seed=None):
+        """
+        Performs a simulation run of number of trials stored in Simulator
+        one roll at a time on the stdlib random module seeded with seed,
+        and returns the tallies as a SimResult.  This is the original engine,
+        kept as a plain reference for the vectorized ones.
+        Requires: perform_roll(), get_successes()
+        """
+        rand.seed(seed)
+        freq = {}
         single_roll = []
 
         # Using this range instead of (0, t) for accurate simulation count
@@ -199,34 +456,1585 @@ class Simulator:
                 outcome = sum(single_roll)
             elif cls.mode == "Successes":
                 outcome = cls.get_successes(single_roll)
+            elif cls.mode == "Highest":
+                outcome = max(single_roll)
+            elif cls.mode == "Lowest":
+                outcome = min(single_roll)
 
-            if outcome in cls.freq:
-                cls.freq[outcome] += 1
+            if outcome in freq:
+                freq[outcome] += 1
             else:
                 # Create entry outcome if outcome not yet recorded in dictionary
-                cls.freq[outcome] = 1
+                freq[outcome] = 1
+
+        result = histogram_from_freq(cls.get_config(), freq)
+        result.metadata["engine"] = "Monte Carlo"
+        result.metadata["sampler"] = "Loop"
+        result.metadata["rng"] = "stdlib"
+        result.metadata["seed"] = seed
+        return result
 
     @classmethod
     def sanitize_outcomes(cls):
         """
-        Modifies frequency dictionary:
-        - changes values from counts to percents.
-        - removes outcomes if associated probability is below cutoff threshold
-          calculated by config's cutoff sensitivity.
+        Rebuilds frequency dictionary as a view over the raw result of the
+        last run, which is left untouched so that it can be sanitized again
+        (e.g. with a different cutoff) without re-running the simulation:
+        - values are percents.
+        - outcomes are left out if associated probability is below cutoff
+          threshold calculated by Simulator's cutoff sensitivity; the mass
+          left out from each tail is stored in trimmed_mass.
         """
-        to_delete = []
+        probabilities = cls.result.probabilities()
 
-        # Pruning data values based on cutoff threshold
-        cutoff_threshold = max(cls.freq.values()) / cfg.CUTOFF_SENSITIVITY
-        for outcome, frequency in cls.freq.items():
-            if frequency < cutoff_threshold:
-                to_delete.append(outcome)
+        # Masks outcomes to keep based on cutoff threshold
+        cutoff_threshold = probabilities.max() / cls.cutoff_sensitivity
+        kept = (probabilities >= cutoff_threshold) & (probabilities > 0)
 
-        for outcome in to_delete:
-            cls.freq.pop(outcome)
+        # Tails are split at the most likely outcome
+        peak = np.argmax(probabilities)
+        trimmed = np.where(kept, 0, probabilities)
+        cls.trimmed_mass = (float(trimmed[:peak].sum()), float(trimmed[peak:].sum()))
 
         # Convert to percentages, round to avoid floating point inccuracies
-        for outcome in cls.freq:
-            cls.freq[outcome] = round(
-                cls.freq[outcome] / cls.num_trials * 100, cfg.ROUNDING_PREC
+        percents = np.round(probabilities * 100, cfg.ROUNDING_PREC)
+        cls.freq.clear()
+        for i in np.flatnonzero(kept):
+            cls.freq[int(cls.result.min_outcome + i)] = float(percents[i])
+
+
+def is_custom_die(die_type):
+    """
+    Returns True if die_type names a custom die, defined by its faces and
+    their weights in a configuration's custom_dice, rather than being the
+    number of faces of a standard die numbered from 1.
+    """
+    return isinstance(die_type, str)
+
+
+def parse_die_type(die_type):
+    """
+    Returns die_type as a die type: an int for standard dice, which may be
+    given as digit strings (JSON object keys always are), and a str name for
+    custom ones.
+    """
+    if isinstance(die_type, str) and not die_type.isdigit():
+        return die_type
+    return int(die_type)
+
+
+def die_sort_key(die_type):
+    """
+    Returns the key dice pools are ordered by: standard dice by number of
+    faces, then custom dice by name.
+    """
+    if is_custom_die(die_type):
+        return 1, 0, die_type
+    return 0, die_type, ""
+
+
+def custom_die_spec(faces, weights=None):
+    """
+    Returns the canonical definition of a custom die that lands on each value
+    in faces with the chance of its relative weight in weights (all faces
+    equally likely if None): a dict of its distinct faces in ascending order,
+    as 'faces', and the total weight of each, as 'weights'.  Repeated faces,
+    e.g. the 2s and 3s of a 2,2,3,3,4,6 die, are merged.
+    Raises ValueError if faces aren't integers or weights aren't positive.
+    """
+    if weights is None:
+        weights = [1] * len(faces)
+    try:
+        if any(isinstance(face, float) and not face.is_integer() for face in faces):
+            raise ValueError
+        faces = [int(face) for face in faces]
+        weights = [float(weight) for weight in weights]
+    except (TypeError, ValueError):
+        raise ValueError("Custom die faces must be integers and weights numbers")
+    if not faces or len(weights) != len(faces):
+        raise ValueError("Custom dice need at least one face, and a weight for each")
+    if not all(0 < weight < math.inf for weight in weights):
+        raise ValueError("Custom die weights must be positive")
+
+    totals = {}
+    for face, weight in zip(faces, weights):
+        totals[face] = totals.get(face, 0) + weight
+    return {"faces": sorted(totals), "weights": [totals[f] for f in sorted(totals)]}
+
+
+def canonical_config(config):
+    """
+    Returns a validated copy of the pool configuration config in canonical
+    form: dice keyed by int in ascending order followed by custom dice in
+    name order, every field present (missing ones take the Simulator
+    defaults), settings that don't apply zeroed and only the custom die
+    definitions the pool uses kept, in canonical form, so that
+    configurations describing the same pool compare equal.  Rerolls and
+    explosions only apply to standard dice.
+    Raises ValueError if config does not describe a valid pool.
+    Requires: parse_die_type(), die_sort_key(), custom_die_spec()
+    """
+    canonical = {
+        "dice": {},
+        "mode": "Sum",
+        "success_threshold": 1,
+        "mode_drop": "Do not drop",
+        "num_drops": 0,
+        "reroll_threshold": 0,
+        "explode": [],
+        "explode_depth": cfg.EXPLODE_DEFAULT_DEPTH,
+        "custom_dice": {},
+    }
+    unknown = set(config) - set(canonical)
+    if unknown:
+        raise ValueError(f"Unknown configuration fields {sorted(unknown)}")
+    canonical.update(config)
+
+    try:
+        dice = {
+            parse_die_type(die_type): int(die_amt)
+            for die_type, die_amt in config.get("dice", {}).items()
+        }
+        canonical["dice"] = {
+            die_type: dice[die_type] for die_type in sorted(dice, key=die_sort_key)
+        }
+        for field in ["success_threshold", "num_drops", "reroll_threshold"]:
+            canonical[field] = int(canonical[field])
+        canonical["explode_depth"] = int(canonical["explode_depth"])
+        canonical["explode"] = sorted(
+            {int(d) for d in canonical["explode"] if int(d) in canonical["dice"]}
+        )
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError("Configuration fields must be integers where numeric")
+
+    dice = canonical["dice"]
+    standard = [die_type for die_type in dice if not is_custom_die(die_type)]
+    if not dice or min(standard, default=1) < 1 or min(dice.values()) < 1:
+        raise ValueError("Pool must contain at least one die, all with >= 1 face")
+    definitions = config.get("custom_dice", {})
+    canonical["custom_dice"] = {}
+    for die_type in dice:
+        if not is_custom_die(die_type):
+            continue
+        spec = definitions.get(die_type)
+        if not isinstance(spec, dict) or "faces" not in spec:
+            raise ValueError(f"Custom die {die_type} has no definition")
+        canonical["custom_dice"][die_type] = custom_die_spec(
+            spec["faces"], spec.get("weights")
+        )
+    if canonical["mode"] not in ("Sum", "Successes", "Highest", "Lowest"):
+        raise ValueError(f"Unknown mode {canonical['mode']}")
+    if canonical["mode_drop"] not in ("Do not drop", "Drop lowest", "Drop highest"):
+        raise ValueError(f"Unknown drop mode {canonical['mode_drop']}")
+    if not 0 <= canonical["reroll_threshold"] < min(standard, default=1):
+        raise ValueError("Reroll threshold must be in [0, smallest standard die)")
+    if not 0 <= canonical["num_drops"] < sum(dice.values()):
+        raise ValueError("Number of drops must be in [0, number of dice)")
+    if not 1 <= canonical["explode_depth"] <= cfg.EXPLODE_MAX_DEPTH:
+        raise ValueError(f"Explode depth must be in [1, {cfg.EXPLODE_MAX_DEPTH}]")
+
+    # Settings that don't apply are zeroed, as get_config() does
+    if canonical["mode_drop"] == "Do not drop":
+        canonical["num_drops"] = 0
+    if canonical["mode"] != "Successes":
+        canonical["success_threshold"] = 1
+    return canonical
+
+
+def metric_key(config):
+    """
+    Returns the key of the metric the canonical pool configuration config
+    reduces rolls to in Simulator's metrics, a tuple (mode, success_threshold).
+    """
+    return config["mode"], config["success_threshold"]
+
+
+class SimResult:
+    """
+    Raw outcome histogram for one dice pool configuration, stored as a dense
+    array indexed from the smallest possible outcome so that it can be
+    merged, sliced and reduced with NumPy rather than walked as a dict.
+    For sampled runs, counts holds integer tallies over num_trials trials;
+    for exact computations, num_trials is None and counts holds probabilities.
+    """
+
+    def __init__(self, config, min_outcome, counts, num_trials=None):
+        self.config = config
+        self.min_outcome = min_outcome
+        self.counts = counts
+        self.num_trials = num_trials
+        # Information about how the result was produced, e.g. engine used
+        self.metadata = {}
+
+    def outcomes(self):
+        """
+        Returns an array of the outcomes each entry of counts corresponds to.
+        """
+        return np.arange(self.min_outcome, self.min_outcome + len(self.counts))
+
+    def probabilities(self):
+        """
+        Returns an array of the probability of each outcome, in [0, 1].
+        """
+        if self.num_trials is None:
+            return self.counts
+        return self.counts / self.num_trials
+
+    def to_freq(self):
+        """
+        Returns a dict of outcomes and their probabilities in percent,
+        omitting outcomes that never occurred; the same form that
+        Simulator.freq takes after sanitization.
+        """
+        percents = np.round(self.probabilities() * 100, cfg.ROUNDING_PREC)
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            int(self.min_outcome + i): float(percents[i]) for i in nonzero
+        }
+
+    def mean(self):
+        """
+        Returns the mean outcome of the distribution.
+        """
+        return float(np.dot(self.outcomes(), self.probabilities()))
+
+    def std(self):
+        """
+        Returns the standard deviation of the distribution.
+        """
+        deviations = self.outcomes() - self.mean()
+        return math.sqrt(np.dot(deviations**2, self.probabilities()))
+
+    def confidence_intervals(self, ci_level, method="Wilson"):
+        """
+        Returns a tuple (lower, upper) of arrays of the bounds of the
+        ci_level % confidence interval of each outcome's probability,
+        computed for all outcomes in one vectorized pass over counts.
+        method is one of {'Wilson', 'Clopper-Pearson'} for plain sampling.
+        Variance-reduction samplers don't produce binomial counts, so their
+        intervals are normal intervals from their reported standard errors;
+        exact results have intervals of zero width.
+        Requires: wilson_intervals(), clopper_pearson_intervals()
+        """
+        probabilities = self.probabilities()
+        if self.num_trials is None:
+            return probabilities, probabilities
+
+        zstar = cfg.ZSTAR_VALS[ci_level]
+        if self.metadata.get("sampler", "Plain") != "Plain":
+            half_width = zstar * self.metadata["std_error"]
+            return (
+                np.clip(probabilities - half_width, 0, 1),
+                np.clip(probabilities + half_width, 0, 1),
             )
+
+        if (
+            method == "Clopper-Pearson"
+            and self.num_trials <= cfg.CLOPPER_PEARSON_MAX_TRIALS
+        ):
+            return clopper_pearson_intervals(self.counts, self.num_trials, ci_level)
+        return wilson_intervals(self.counts, self.num_trials, zstar)
+
+    def quartiles(self):
+        """
+        Returns a list of the outcomes located at the three quartiles
+        (Q1, M, Q3), using the same convention as Plotter.calc_quartiles(),
+        i.e. the first outcome whose cumulative probability exceeds each step.
+        Cumulative probabilities within float error of a step (e.g. exactly
+        0.75) don't exceed it.
+        """
+        cdf = np.cumsum(self.probabilities())
+        steps = np.array([0.25, 0.5, 0.75]) + 1e-9
+        indices = np.searchsorted(cdf, steps, side="right")
+        indices = np.minimum(indices, len(cdf) - 1)
+        return [int(self.min_outcome + i) for i in indices]
+
+
+class StdlibGenerator:
+    """
+    Adapter exposing a stdlib random.Random through the part of NumPy's
+    Generator interface the engines use (random() and integers()), so that
+    the stdlib generator can be selected, and benchmarked, like any other.
+    Values are drawn one at a time, as the stdlib generator only can.
+    """
+
+    def __init__(self, seed=None):
+        self.random_state = rand.Random(seed)
+
+    def random(self, size=None, out=None):
+        if out is not None:
+            size = out.shape
+        if size is None:
+            return self.random_state.random()
+        draws = [self.random_state.random() for _ in range(int(np.prod(size)))]
+        if out is None:
+            return np.array(draws).reshape(size)
+        out[...] = np.array(draws).reshape(size)
+        return out
+
+    def integers(self, low, high=None, size=None, dtype=np.int64):
+        if high is None:
+            low, high = 0, low
+        if size is None:
+            return self.random_state.randrange(low, high)
+        draws = [
+            self.random_state.randrange(low, high) for _ in range(int(np.prod(size)))
+        ]
+        return np.array(draws, dtype=dtype).reshape(size)
+
+
+def make_rng(backend, seed=None):
+    """
+    Returns a random number generator of the named backend, one of
+    {'stdlib', 'PCG64', 'Philox', 'SFC64'}, seeded with seed.
+    NumPy backends are Generators over the matching bit generator.
+    """
+    if backend == "stdlib":
+        return StdlibGenerator(seed)
+
+    bit_generators = {
+        "PCG64": np.random.PCG64,
+        "Philox": np.random.Philox,
+        "SFC64": np.random.SFC64,
+    }
+    return np.random.Generator(bit_generators[backend](seed))
+
+
+def benchmark_rngs(config, num_trials, sampler="Plain", seed=0):
+    """
+    Times a simulation run of num_trials trials of the pool in config on
+    every RNG backend, all seeded with seed.
+    Returns a dict of backends and the run time on each, in seconds.
+    Requires: make_rng(), sample_with()
+    """
+    timings = {}
+    for backend in ["stdlib", "PCG64", "Philox", "SFC64"]:
+        rng = make_rng(backend, seed)
+        start = time.perf_counter()
+        sample_with(config, num_trials, sampler, rng)
+        timings[backend] = time.perf_counter() - start
+    return timings
+
+
+def wilson_intervals(counts, num_trials, zstar):
+    """
+    Returns a tuple (lower, upper) of arrays of Wilson score interval bounds
+    for the probabilities of outcomes seen counts times in num_trials trials,
+    with critical value zstar.  Unlike the normal approximation, the
+    intervals narrow correctly for rare outcomes and never leave [0, 1].
+    Necessary for: SimResult.confidence_intervals()
+    """
+    p_hat = counts / num_trials
+    z_sq_n = zstar**2 / num_trials
+    center = (p_hat + z_sq_n / 2) / (1 + z_sq_n)
+    half_width = (
+        zstar
+        * np.sqrt(p_hat * (1 - p_hat) / num_trials + z_sq_n / (4 * num_trials))
+        / (1 + z_sq_n)
+    )
+    return np.clip(center - half_width, 0, 1), np.clip(center + half_width, 0, 1)
+
+
+def log_beta(a, b):
+    """
+    Returns an array of the natural log of the beta function B(a, b)
+    for arrays a and b.
+    Necessary for: regularized_beta()
+    """
+    lgamma = np.frompyfunc(math.lgamma, 1, 1)
+    return (lgamma(a) + lgamma(b) - lgamma(a + b)).astype(float)
+
+
+def beta_continued_fraction(x, a, b, max_iterations=300):
+    """
+    Evaluates the continued fraction for the incomplete beta function
+    (modified Lentz's method) elementwise over arrays x, a and b, stepping all
+    elements in lockstep until every one has converged.
+    Necessary for: regularized_beta()
+    """
+    tiny = 1e-300
+    c = np.ones_like(x)
+    d = 1 - (a + b) * x / (a + 1)
+    d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+    fraction = d
+    for m in range(1, max_iterations + 1):
+        for numerator in (
+            m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+            -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1)),
+        ):
+            d = 1 + numerator * d
+            d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+            c = 1 + numerator / c
+            c = np.where(np.abs(c) < tiny, tiny, c)
+            delta = d * c
+            fraction = fraction * delta
+        if np.all(np.abs(delta - 1) < 1e-12):
+            break
+    return fraction
+
+
+def regularized_beta(x, a, b):
+    """
+    Returns an array of the regularized incomplete beta function I_x(a, b)
+    evaluated elementwise over arrays x, a and b, with x in [0, 1].
+    Requires: log_beta(), beta_continued_fraction()
+    Necessary for: beta_quantile()
+    """
+    x = np.clip(x, 0, 1)
+    # Continued fraction converges quickly below the mean, so evaluate
+    #  I_(1 - x)(b, a) = 1 - I_x(a, b) instead above it
+    flip = x > (a + 1) / (a + b + 2)
+    x_eval = np.where(flip, 1 - x, x)
+    a_eval = np.where(flip, b, a)
+    b_eval = np.where(flip, a, b)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        front = np.exp(
+            a_eval * np.log(x_eval)
+            + b_eval * np.log1p(-x_eval)
+            - log_beta(a_eval, b_eval)
+        )
+        value = front * beta_continued_fraction(x_eval, a_eval, b_eval) / a_eval
+    value = np.where(x_eval <= 0, 0, np.nan_to_num(value))
+    return np.where(flip, 1 - value, value)
+
+
+def beta_quantile(q, a, b, iterations=45):
+    """
+    Returns an array of the q-quantiles of beta distributions with
+    parameters from arrays a and b, found by bisection on all elements at once.
+    Requires: regularized_beta()
+    Necessary for: clopper_pearson_intervals()
+    """
+    low = np.zeros(np.broadcast(a, b).shape)
+    high = np.ones_like(low)
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        below = regularized_beta(mid, a, b) < q
+        low = np.where(below, mid, low)
+        high = np.where(below, high, mid)
+    return (low + high) / 2
+
+
+def clopper_pearson_intervals(counts, num_trials, ci_level):
+    """
+    Returns a tuple (lower, upper) of arrays of Clopper-Pearson ("exact")
+    interval bounds for the probabilities of outcomes seen counts times in
+    num_trials trials, at ci_level % confidence, from beta quantiles.
+    Requires: beta_quantile()
+    Necessary for: SimResult.confidence_intervals()
+    """
+    counts = np.asarray(counts, dtype=float)
+    alpha = 1 - ci_level / 100
+    # Outcomes never (always) seen have lower (upper) bounds pinned at 0 (1);
+    #  their beta parameters are clamped to stay valid and then overridden
+    lower = beta_quantile(
+        alpha / 2, np.maximum(counts, 1), num_trials - counts + 1
+    )
+    upper = beta_quantile(
+        1 - alpha / 2, counts + 1, np.maximum(num_trials - counts, 1)
+    )
+    lower = np.where(counts == 0, 0, lower)
+    upper = np.where(counts == num_trials, 1, upper)
+    return lower, upper
+
+
+def get_die_faces(die_type, reroll_threshold=0):
+    """
+    Returns an array of the values a die of die_type can land on once
+    all values at or below reroll_threshold have been rerolled.
+    Rerolling until above the threshold is equivalent to drawing uniformly
+    from the remaining faces, which is what lets rerolls be sampled in bulk.
+    """
+    return np.arange(reroll_threshold + 1, die_type + 1)
+
+
+def custom_die_pmf(die_type, config):
+    """
+    Returns a tuple (values, probabilities) of arrays of the distinct values
+    a custom die of die_type in the pool in config lands on, in ascending
+    order, and the chance of each.
+    """
+    spec = config["custom_dice"][die_type]
+    weights = np.array(spec["weights"], dtype=np.float64)
+    return np.array(spec["faces"], dtype=np.int64), weights / weights.sum()
+
+
+def die_faces(die_type, config):
+    """
+    Returns an array of the distinct values a die of die_type in the pool in
+    config can land on before explosions, in ascending order: the faces
+    left after rerolls for standard dice, the faces defined for custom ones.
+    Requires: get_die_faces(), custom_die_pmf()
+    """
+    if is_custom_die(die_type):
+        return custom_die_pmf(die_type, config)[0]
+    return get_die_faces(die_type, config["reroll_threshold"])
+
+
+def top_face(config):
+    """
+    Returns the highest face any die of the pool in config can land on
+    before explosions; success thresholds range from 1 up to it.
+    """
+    return max(int(die_faces(die_type, config)[-1]) for die_type in config["dice"])
+
+
+def alias_table(probabilities):
+    """
+    Returns a tuple (cutoffs, aliases) of arrays making up Walker's alias
+    table of the distribution probabilities over n outcomes, built by Vose's
+    method: every column i of the table holds outcome i with chance
+    cutoffs[i] and outcome aliases[i] otherwise, and columns are equally
+    likely, so any distribution is sampled with one uniform and O(1) work
+    per draw.
+    Necessary for: RollBuffers
+    """
+    n = len(probabilities)
+    scaled = np.asarray(probabilities, dtype=np.float64) * n
+    cutoffs = np.ones(n)
+    aliases = np.arange(n)
+    small = [i for i in range(n) if scaled[i] < 1]
+    large = [i for i in range(n) if scaled[i] >= 1]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        cutoffs[less] = scaled[less]
+        aliases[less] = more
+        # The column of less is topped up from more
+        scaled[more] -= 1 - scaled[less]
+        if scaled[more] < 1:
+            small.append(more)
+        else:
+            large.append(more)
+    # Columns left in either list are full, up to rounding
+    return cutoffs, aliases
+
+
+def alias_roll(table, uniforms, out):
+    """
+    Maps the 2-d array uniforms in [0, 1) onto values of a custom die with
+    alias table table, a tuple (values, cutoffs, aliases), writing them into
+    out: u picks column i = floor(u * n) of the n columns, and the fraction
+    of u * n past i picks the column's own value if below cutoffs[i], its
+    alias otherwise.
+    Necessary for: RollBuffers.roll_dice()
+    """
+    values, cutoffs, aliases = table
+    scaled = uniforms * len(values)
+    columns = scaled.astype(np.int64)
+    # Guards against u * n rounding up to n for u just below 1
+    np.minimum(columns, len(values) - 1, out=columns)
+    scaled -= columns
+    out[:] = values[np.where(scaled < cutoffs[columns], columns, aliases[columns])]
+
+
+def roll_dtype(config):
+    """
+    Returns the narrower of int32 and int64 that holds every die value the
+    pool in config can roll, so that roll buffers take as little memory
+    as they can.
+    Requires: die_faces()
+    """
+    top = 0
+    for die_type in config["dice"]:
+        faces = die_faces(die_type, config)
+        num_rolls = 1
+        if die_type in config["explode"]:
+            num_rolls += config["explode_depth"]
+        top = max(top, max(-int(faces[0]), int(faces[-1])) * num_rolls)
+    return np.int32 if top < 2**31 else np.int64
+
+
+def chunk_size(config, dtype=np.int64, width=None, extra_bytes=0):
+    """
+    Returns the number of trials of the pool in config sampled per chunk so
+    that the working arrays of a chunk stay within SAMPLE_MEMORY_CAP bytes.
+    Per trial these are a uniform (float64) for each of width columns
+    (the pool's dice unless given), a die value (dtype) per die plus as
+    much again for the temporaries NumPy makes of them (explosion indices,
+    success flags), three 8-byte temporaries per custom die for its alias
+    lookups, the trial's outcome (int64), and extra_bytes for whatever
+    arrays the caller works through per trial of the chunk.
+    """
+    total_dice = sum(config["dice"].values())
+    custom_dice = sum(
+        die_amt
+        for die_type, die_amt in config["dice"].items()
+        if is_custom_die(die_type)
+    )
+    width = width or total_dice
+    bytes_per_trial = 8 * width + 2 * np.dtype(dtype).itemsize * total_dice + 8
+    bytes_per_trial += 24 * custom_dice + extra_bytes
+    return max(1, cfg.SAMPLE_MEMORY_CAP // bytes_per_trial)
+
+
+def explode_rolls(config, faces, rolls, rng):
+    """
+    Explodes the dice in the 2-d array rolls in place: each die on its
+    highest face rolls again and adds, up to the configured depth.
+    Every pass only draws for, and touches, the dice still exploding.
+    rolls may be a view, e.g. one die type's columns of a roll buffer.
+    Necessary for: RollBuffers.roll()
+    """
+    rows, cols = np.nonzero(rolls == faces[-1])
+    for _ in range(config["explode_depth"]):
+        if not rows.size:
+            break
+        explosions = faces[rng.integers(0, len(faces), rows.size)]
+        rolls[rows, cols] += explosions
+        still_exploding = explosions == faces[-1]
+        rows, cols = rows[still_exploding], cols[still_exploding]
+
+
+class RollBuffers:
+    """
+    Working arrays for sampling a pool chunk by chunk.  They are allocated
+    once, for one chunk of chunk_size() trials (or fewer, if the run needs
+    fewer), and every chunk is drawn and rolled into them in place, so that
+    runs of any number of trials sample in constant memory.  Callers that
+    work through arrays of their own per trial of a chunk pass their size,
+    in bytes per trial, as extra_bytes, so the chunk leaves room for them.
+    """
+
+    def __init__(self, config, num_trials, width=None, extra_bytes=0):
+        self.config = config
+        self.width = width or sum(config["dice"].values())
+        dtype = roll_dtype(config)
+        self.chunk = min(
+            num_trials, chunk_size(config, dtype, self.width, extra_bytes)
+        )
+
+        self.uniforms = np.empty((self.chunk, self.width))
+        self.rolls = np.empty((self.chunk, sum(config["dice"].values())), dtype)
+        self.outcomes = np.empty(self.chunk, dtype=np.int64)
+
+        # Alias tables of the custom die types, as (values, cutoffs, aliases)
+        self.alias_tables = {}
+        for die_type in config["dice"]:
+            if is_custom_die(die_type):
+                values, probabilities = custom_die_pmf(die_type, config)
+                self.alias_tables[die_type] = (values, *alias_table(probabilities))
+
+    def chunks(self, num_trials):
+        """
+        Yields tuples (start, size) of the chunks num_trials trials split into.
+        """
+        for start in range(0, num_trials, self.chunk):
+            yield start, min(self.chunk, num_trials - start)
+
+    def draw_uniforms(self, rng, size):
+        """
+        Fills the first size rows of the uniform buffer from rng and returns
+        them.  Pools drawing uniforms of the same width from copies of one
+        generator see the same uniforms, row for row.
+        """
+        uniforms = self.uniforms[:size]
+        rng.random(out=uniforms)
+        return uniforms
+
+    def roll_dice(self, uniforms, rng):
+        """
+        Maps a (trials x width) array of uniforms in [0, 1) onto die values
+        in the roll buffer, one column per die in the order of config's dice
+        dictionary, uniform u picking face floor(u * n) of the n faces left
+        after rerolls; custom dice look u up in their alias tables instead.
+        Columns past the pool's dice are unused.  Exploding dice draw their
+        extra rolls from rng.
+        Returns the (trials x dice) rolls, in the roll buffer.
+        Requires: alias_roll(), explode_rolls()
+        """
+        size = len(uniforms)
+        rolls = self.rolls[:size]
+        col = 0
+        for die_type, die_amt in self.config["dice"].items():
+            die_rolls = rolls[:, col : col + die_amt]
+            if is_custom_die(die_type):
+                alias_roll(
+                    self.alias_tables[die_type],
+                    uniforms[:, col : col + die_amt],
+                    die_rolls,
+                )
+                col += die_amt
+                continue
+
+            faces = get_die_faces(die_type, self.config["reroll_threshold"])
+            np.multiply(
+                uniforms[:, col : col + die_amt],
+                len(faces),
+                out=die_rolls,
+                casting="unsafe",
+            )
+            # Guards against u * n rounding up to n for u just below 1
+            np.minimum(die_rolls, len(faces) - 1, out=die_rolls)
+            # Faces left after rerolls are consecutive
+            die_rolls += int(faces[0])
+            if die_type in self.config["explode"]:
+                explode_rolls(self.config, faces, die_rolls, rng)
+            col += die_amt
+        return rolls
+
+    def roll(self, uniforms, rng):
+        """
+        Rolls the dice for a (trials x width) array of uniforms as
+        roll_dice() does and reduces every trial to its outcome.
+        Returns the outcome of each trial, in the outcome buffer.
+        Requires: roll_dice(), reduce_rolls()
+        """
+        rolls = self.roll_dice(uniforms, rng)
+        return reduce_rolls(self.config, rolls, out=self.outcomes[: len(uniforms)])
+
+
+def child_rng(rng):
+    """
+    Returns a new generator of the same backend as rng, seeded from it, whose
+    stream is independent of rng's.
+    """
+    seed = int(rng.integers(0, 2**32))
+    if isinstance(rng, StdlibGenerator):
+        return StdlibGenerator(seed)
+    return np.random.Generator(type(rng.bit_generator)(seed))
+
+
+def drop_rolls(config, rolls):
+    """
+    Drops dice from each row of the (trials x dice) matrix rolls as given by
+    config, sorting rolls in place to do so if any are dropped.
+    Returns a view of the kept dice.
+    Necessary for: reduce_rolls(), sample_metrics()
+    """
+    num_drops = config["num_drops"]
+    if num_drops > 0:
+        rolls.sort(axis=1)
+        if config["mode_drop"] == "Drop lowest":
+            rolls = rolls[:, num_drops:]
+        elif config["mode_drop"] == "Drop highest":
+            rolls = rolls[:, : rolls.shape[1] - num_drops]
+    return rolls
+
+
+def reduce_rolls(config, rolls, out=None):
+    """
+    Drops dice from each row of the (trials x dice) matrix rolls as given by
+    config, sorting rolls in place to do so, then reduces each row to its
+    outcome (sum, successes, or highest or lowest kept die), written into
+    out if given.
+    Returns an array of outcomes, one per trial.
+    Requires: drop_rolls()
+    Necessary for: RollBuffers.roll(), outcome_bounds()
+    """
+    rolls = drop_rolls(config, rolls)
+
+    if config["mode"] == "Successes":
+        return np.greater_equal(rolls, config["success_threshold"]).sum(
+            axis=1, out=out
+        )
+    if config["mode"] == "Highest":
+        return rolls.max(axis=1, out=out)
+    if config["mode"] == "Lowest":
+        return rolls.min(axis=1, out=out)
+    return rolls.sum(axis=1, dtype=np.int64, out=out)
+
+
+def outcome_bounds(config):
+    """
+    Returns a tuple (min, max) of the smallest and largest possible outcomes
+    for the pool in config.  Outcomes are monotone in every die, so these are
+    the outcomes of every die landing on its lowest and on its highest value.
+    Requires: die_faces(), reduce_rolls()
+    """
+    lowest = []
+    highest = []
+    for die_type, die_amt in config["dice"].items():
+        faces = die_faces(die_type, config)
+        # Exploding dice top out after exploding as many times as allowed
+        num_rolls = 1
+        if die_type in config["explode"]:
+            num_rolls += config["explode_depth"]
+        lowest += [faces[0]] * die_amt
+        highest += [faces[-1] * num_rolls] * die_amt
+
+    bounds = reduce_rolls(config, np.array([lowest, highest]))
+    return int(bounds[0]), int(bounds[1])
+
+
+def binomial_std_error(probabilities, num_trials):
+    """
+    Returns an array of the standard errors of outcome probabilities
+    estimated from num_trials i.i.d. trials, sqrt(p * (1 - p) / n).
+    """
+    return np.sqrt(probabilities * (1 - probabilities) / num_trials)
+
+
+def histogram_from_freq(config, freq):
+    """
+    Packs a dict of outcomes and their (unsanitized) counts, as tallied by
+    Simulator.perform_sim(), into a SimResult for the pool in config.
+    """
+    min_outcome, max_outcome = outcome_bounds(config)
+    counts = np.zeros(max_outcome - min_outcome + 1, dtype=np.int64)
+    for outcome, count in freq.items():
+        counts[outcome - min_outcome] = count
+    return SimResult(config, min_outcome, counts, int(counts.sum()))
+
+
+def sample_pool(config, num_trials, rng=None, uniform_rng=None, width=None):
+    """
+    Vectorized Monte Carlo run of num_trials trials for the pool in config,
+    sampled chunk by chunk through one set of RollBuffers.  Uniforms are
+    drawn from uniform_rng (rng unless given), width columns per trial (the
+    pool's dice unless given), so pools sampled from copies of one generator
+    at a common width are evaluated on common random numbers.  Explosions
+    are always drawn from rng.
+    Returns a SimResult.
+    Requires: RollBuffers, binomial_std_error()
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if uniform_rng is None:
+        uniform_rng = rng
+    min_outcome, max_outcome = outcome_bounds(config)
+    counts = np.zeros(max_outcome - min_outcome + 1, dtype=np.int64)
+
+    buffers = RollBuffers(config, num_trials, width)
+    for _, size in buffers.chunks(num_trials):
+        outcomes = buffers.roll(buffers.draw_uniforms(uniform_rng, size), rng)
+        outcomes -= min_outcome
+        counts += np.bincount(outcomes, minlength=len(counts))
+
+    return plain_result(config, min_outcome, counts, num_trials)
+
+
+def plain_result(config, min_outcome, counts, num_trials):
+    """
+    Packs the counts of a plain Monte Carlo run of num_trials trials into a
+    SimResult, with the binomial standard error of each outcome.
+    Requires: binomial_std_error()
+    Necessary for: sample_pool(), tally_metrics(), sample_parts(),
+                   sample_parallel()
+    """
+    result = SimResult(config, min_outcome, counts, num_trials)
+    result.metadata["engine"] = "Monte Carlo"
+    result.metadata["sampler"] = "Plain"
+    result.metadata["std_error"] = binomial_std_error(
+        result.probabilities(), num_trials
+    )
+    result.metadata["mean_std_error"] = result.std() / math.sqrt(num_trials)
+    return result
+
+
+def die_value_range(config):
+    """
+    Returns a tuple (low, high) of the lowest and highest value any single
+    die of the pool in config can show, after rerolls and explosions.
+    """
+    low = min(die_faces(d, config)[0] for d in config["dice"])
+    high = max(
+        die_faces(die_type, config)[-1]
+        * (1 + config["explode_depth"] * (die_type in config["explode"]))
+        for die_type in config["dice"]
+    )
+    return int(low), int(high)
+
+
+def sample_metrics(config, num_trials, rng=None):
+    """
+    Plain Monte Carlo run of num_trials trials for the pool in config that
+    tallies every metric of the pool from the same rolls, in one pass over
+    each chunk; see tally_metrics().
+    Returns a dict of SimResults keyed by metric_key().
+    Requires: tally_metrics()
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    return tally_metrics(config, [(num_trials, rng)])
+
+
+def sample_metrics_parts(config, num_trials, rng_backend="PCG64", seed=0):
+    """
+    Counterpart of sample_metrics() for a run sampled in the parts of
+    sample_parts(), whose tallies of the pool's own metric are exactly those
+    of sample_parts() and sample_parallel() with the same seed.
+    Returns a dict of SimResults keyed by metric_key().
+    Requires: part_streams(), tally_metrics()
+    """
+    return tally_metrics(config, part_streams(num_trials, rng_backend, seed))
+
+
+def part_streams(num_trials, rng_backend="PCG64", seed=0, parts=None):
+    """
+    Returns the parts of a sample_parts() run of num_trials trials, those in
+    parts if given and all of them otherwise, as tally_metrics() streams.
+    Requires: count_parts(), part_trials(), spawn_seed()
+    Necessary for: sample_metrics_parts(), metric_part_tallies()
+    """
+    num_parts = count_parts(num_trials)
+    if parts is None:
+        parts = range(num_parts)
+    return [
+        (
+            part_trials(num_trials, num_parts, part),
+            make_rng(rng_backend, spawn_seed(seed, part)),
+        )
+        for part in parts
+    ]
+
+
+def tally_metrics(config, streams):
+    """
+    Plain Monte Carlo run for the pool in config that tallies every metric
+    of the pool from the same rolls: the sum, the successes at every
+    threshold from 1 to the highest face of any die, and the highest and
+    lowest kept die.  streams is a list of tuples (num_trials, rng), each
+    sampled chunk by chunk as sample_pool() would, so every stream's rolls
+    are those sample_pool() makes of it.
+    Returns a dict of SimResults keyed by metric_key().
+    Requires: tally_kept_dice(), metrics_from_tallies()
+    Necessary for: sample_metrics(), sample_metrics_parts()
+    """
+    config = canonical_config(config)
+    num_trials = sum(trials for trials, _ in streams)
+    return metrics_from_tallies(config, tally_kept_dice(config, streams), num_trials)
+
+
+def kept_dice_size(config):
+    """
+    Returns the length of the flat tallies tally_kept_dice() makes of the
+    pool in config.
+    Requires: die_value_range()
+    """
+    num_kept = sum(config["dice"].values()) - config["num_drops"]
+    low, high = die_value_range(config)
+    sum_min, sum_max = outcome_bounds(dict(config, mode="Sum"))
+    return sum_max - sum_min + 1 + num_kept * (high - low + 1)
+
+
+def tally_kept_dice(config, streams):
+    """
+    Samples the streams of tally_metrics() for the canonical pool in config
+    and returns one flat int64 array of their tallies: the sums of the kept
+    dice, followed by a row per kept die, from the lowest, of the values it
+    showed.  Each chunk's kept dice are sorted once and the values in every
+    sorted column tallied.  Tallies of streams sampled apart add up to those
+    of sampling them together.
+    Requires: RollBuffers, drop_rolls(), die_value_range(), kept_dice_size()
+    Necessary for: tally_metrics(), metric_part_tallies()
+    """
+    num_kept = sum(config["dice"].values()) - config["num_drops"]
+    low, high = die_value_range(config)
+    sum_min, sum_max = outcome_bounds(dict(config, mode="Sum"))
+
+    tallies = np.zeros(kept_dice_size(config), dtype=np.int64)
+    sum_counts = tallies[: sum_max - sum_min + 1]
+    # column_counts[j, v]: trials whose j-th lowest kept die shows low + v
+    column_counts = tallies[len(sum_counts) :].reshape(num_kept, high - low + 1)
+    buffers = RollBuffers(config, max(trials for trials, _ in streams))
+    for stream_trials, rng in streams:
+        for _, size in buffers.chunks(stream_trials):
+            rolls = buffers.roll_dice(buffers.draw_uniforms(rng, size), rng)
+            kept = drop_rolls(config, rolls)
+            # drop_rolls() only sorts if dice are dropped
+            if config["num_drops"] == 0:
+                kept.sort(axis=1)
+
+            sums = kept.sum(axis=1, dtype=np.int64)
+            sums -= sum_min
+            sum_counts += np.bincount(sums, minlength=len(sum_counts))
+            for j in range(num_kept):
+                column_counts[j] += np.bincount(
+                    kept[:, j] - low, minlength=column_counts.shape[1]
+                )
+    return tallies
+
+
+def metrics_from_tallies(config, tallies, num_trials):
+    """
+    Returns a dict of SimResults, keyed by metric_key(), of every metric of
+    the canonical pool in config from the flat tallies of tally_kept_dice()
+    over num_trials trials.  The lowest and highest kept die are the first
+    and last column, and a roll has at least s successes at threshold t
+    exactly when its s-th highest kept die shows at least t, so every
+    distribution of successes follows from suffix sums of the column tallies.
+    Requires: die_value_range(), top_face(), plain_result()
+    Necessary for: tally_metrics(), sample_metrics_parallel()
+    """
+    num_kept = sum(config["dice"].values()) - config["num_drops"]
+    low, high = die_value_range(config)
+    sum_min, sum_max = outcome_bounds(dict(config, mode="Sum"))
+    sum_counts = tallies[: sum_max - sum_min + 1]
+    column_counts = tallies[len(sum_counts) :].reshape(num_kept, high - low + 1)
+
+    # Tallies of every metric keyed as metric_key(), with their first outcome
+    metric_tallies = {
+        ("Sum", 1): (sum_min, sum_counts),
+        ("Lowest", 1): (low, column_counts[0]),
+        ("Highest", 1): (low, column_counts[-1]),
+    }
+
+    # at_least[j, v]: trials whose j-th lowest kept die shows at least low + v,
+    #  with a column past the highest value for thresholds above it
+    at_least = np.zeros((num_kept, column_counts.shape[1] + 1), dtype=np.int64)
+    at_least[:, :-1] = np.cumsum(column_counts[:, ::-1], axis=1)[:, ::-1]
+    for threshold in range(1, max(top_face(config), 1) + 1):
+        value = min(max(threshold - low, 0), column_counts.shape[1])
+        # Trials with at least s successes, for s in [0, num_kept + 1]
+        successes = np.zeros(num_kept + 2, dtype=np.int64)
+        successes[0] = num_trials
+        successes[1:-1] = at_least[::-1, value]
+        metric_tallies[("Successes", threshold)] = (
+            0,
+            successes[:-1] - successes[1:],
+        )
+
+    metrics = {}
+    for (mode, threshold), (offset, counts) in metric_tallies.items():
+        metric = canonical_config(
+            dict(config, mode=mode, success_threshold=threshold)
+        )
+        min_outcome, max_outcome = outcome_bounds(metric)
+        counts = counts[min_outcome - offset : max_outcome - offset + 1].copy()
+        metrics[metric_key(metric)] = plain_result(
+            metric, min_outcome, counts, num_trials
+        )
+    return metrics
+
+
+def estimated_result(config, min_outcome, probabilities, num_trials, sampler):
+    """
+    Packs probabilities estimated by a variance-reduction sampler from
+    num_trials trials into a SimResult; counts are the equivalent
+    (fractional) number of occurrences of each outcome.
+    Necessary for: sample_antithetic(), sample_stratified(), sample_sobol()
+    """
+    result = SimResult(config, min_outcome, probabilities * num_trials, num_trials)
+    result.metadata["engine"] = "Monte Carlo"
+    result.metadata["sampler"] = sampler
+    return result
+
+
+def sample_antithetic(config, num_trials, rng=None):
+    """
+    Monte Carlo run pairing every roll with its antithetic roll, each die
+    showing the mirror face (u -> 1 - u).  Mirrored rolls are negatively
+    correlated, so the average of a pair varies less than two independent
+    rolls.  Standard errors come from the spread of the pair averages.
+    Pairs are sampled chunk by chunk, mirroring each chunk in place.  Runs
+    too short for 2 pairs are plain runs instead.
+    Returns a SimResult.
+    Requires: RollBuffers, estimated_result(), sample_pool()
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if num_trials < 4:
+        return sample_pool(config, num_trials, rng)
+    min_outcome, max_outcome = outcome_bounds(config)
+    num_outcomes = max_outcome - min_outcome + 1
+    num_pairs = num_trials // 2
+
+    buffers = RollBuffers(config, num_pairs)
+    first = np.empty(buffers.chunk, dtype=np.int64)
+    first_counts = np.zeros(num_outcomes, dtype=np.int64)
+    second_counts = np.zeros(num_outcomes, dtype=np.int64)
+    both_counts = np.zeros(num_outcomes, dtype=np.int64)
+    pair_sum = 0
+    pair_sum_squares = 0.0
+    for _, size in buffers.chunks(num_pairs):
+        uniforms = buffers.draw_uniforms(rng, size)
+        chunk_first = first[:size]
+        np.subtract(buffers.roll(uniforms, rng), min_outcome, out=chunk_first)
+        np.subtract(1, uniforms, out=uniforms)
+        second = buffers.roll(uniforms, rng)
+        second -= min_outcome
+
+        first_counts += np.bincount(chunk_first, minlength=num_outcomes)
+        second_counts += np.bincount(second, minlength=num_outcomes)
+        both_counts += np.bincount(
+            chunk_first[chunk_first == second], minlength=num_outcomes
+        )
+        # Pair totals, in place of the second outcomes
+        second += chunk_first
+        pair_sum += int(second.sum())
+        pair_sum_squares += float(np.dot(second, second.astype(np.float64)))
+
+    # Pair average of the indicator of each outcome is (I1 + I2) / 2, whose
+    #  square averages to (I1 + I2 + 2 * I1 * I2) / 4 over the pairs
+    probabilities = (first_counts + second_counts) / (2 * num_pairs)
+    second_moment = (first_counts + second_counts + 2 * both_counts) / (4 * num_pairs)
+    variance = np.maximum(second_moment - probabilities**2, 0)
+
+    result = estimated_result(
+        config, min_outcome, probabilities, 2 * num_pairs, "Antithetic"
+    )
+    result.metadata["std_error"] = np.sqrt(variance / (num_pairs - 1))
+    # Pair averages are half the pair totals
+    pair_variance = (pair_sum_squares - pair_sum**2 / num_pairs) / (num_pairs - 1)
+    result.metadata["mean_std_error"] = math.sqrt(
+        max(pair_variance, 0) / 4 / num_pairs
+    )
+    return result
+
+
+def sample_stratified(config, num_trials, rng=None):
+    """
+    Monte Carlo run stratified on the face of the first die: each of its
+    faces (for a custom die, each column of its alias table) is forced on an
+    equal share of the trials (proportional allocation) rather than left to
+    chance, removing the variance due to that die.
+    Standard errors combine the within-stratum variances, which come from
+    one histogram per stratum, tallied chunk by chunk.  Runs too short to
+    put 2 trials in every stratum, or of pools whose histograms would take
+    more than SAMPLE_MEMORY_CAP bytes, are plain runs instead.
+    Returns a SimResult.
+    Requires: RollBuffers, estimated_result(), sample_pool()
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    min_outcome, max_outcome = outcome_bounds(config)
+    num_outcomes = max_outcome - min_outcome + 1
+
+    first_die_type = next(iter(config["dice"]))
+    num_strata = len(die_faces(first_die_type, config))
+    if (
+        num_trials < 2 * num_strata
+        or 8 * num_strata * num_outcomes > cfg.SAMPLE_MEMORY_CAP
+    ):
+        return sample_pool(config, num_trials, rng)
+    per_stratum = num_trials // num_strata
+    num_rows = num_strata * per_stratum
+
+    buffers = RollBuffers(config, num_rows)
+    row_index = np.arange(buffers.chunk)
+    strata = np.empty(buffers.chunk, dtype=np.int64)
+    stratum_counts = np.zeros(num_strata * num_outcomes, dtype=np.int64)
+    for start, size in buffers.chunks(num_rows):
+        # Trials are assigned to strata in consecutive runs of per_stratum
+        chunk_strata = strata[:size]
+        np.add(row_index[:size], start, out=chunk_strata)
+        chunk_strata //= per_stratum
+
+        uniforms = buffers.draw_uniforms(rng, size)
+        # Squeezes the first die's uniform into the slice mapping to its stratum
+        uniforms[:, 0] += chunk_strata
+        uniforms[:, 0] /= num_strata
+        outcomes = buffers.roll(uniforms, rng)
+        outcomes -= min_outcome
+
+        # One histogram row per stratum from a single bincount on combined indices
+        chunk_strata *= num_outcomes
+        chunk_strata += outcomes
+        stratum_counts += np.bincount(
+            chunk_strata, minlength=num_strata * num_outcomes
+        )
+    stratum_probabilities = (
+        stratum_counts.reshape(num_strata, num_outcomes) / per_stratum
+    )
+
+    # Strata are equally likely, so estimates are the plain stratum averages
+    probabilities = stratum_probabilities.mean(axis=0)
+    stratum_variance = stratum_probabilities * (1 - stratum_probabilities)
+
+    result = estimated_result(
+        config, min_outcome, probabilities, num_rows, "Stratified"
+    )
+    result.metadata["std_error"] = np.sqrt(
+        stratum_variance.sum(axis=0) / (num_strata**2 * (per_stratum - 1))
+    )
+    offsets = np.arange(num_outcomes)
+    stratum_means = stratum_probabilities @ offsets
+    stratum_outcome_variance = (
+        (stratum_probabilities @ offsets**2 - stratum_means**2)
+        * per_stratum
+        / (per_stratum - 1)
+    )
+    result.metadata["mean_std_error"] = float(
+        np.sqrt(stratum_outcome_variance.sum() / (num_strata**2 * per_stratum))
+    )
+    return result
+
+
+def sobol_direction_numbers(dims):
+    """
+    Returns a (dims x SOBOL_BITS) uint32 array of Sobol direction numbers,
+    row j holding v_1 ... v_bits of dimension j + 1, scaled to SOBOL_BITS.
+    Necessary for: sobol_scrambling()
+    """
+    directions = np.zeros((dims, SOBOL_BITS), dtype=np.uint32)
+    # First dimension is the van der Corput sequence, v_k = 1 / 2^k
+    directions[0] = [1 << (SOBOL_BITS - k) for k in range(1, SOBOL_BITS + 1)]
+
+    for j in range(1, dims):
+        s, a, m = SOBOL_DIRECTIONS[j - 1]
+        v = [m[k] << (SOBOL_BITS - k - 1) for k in range(s)]
+        # Recurrence from the primitive polynomial's coefficients
+        for k in range(s, SOBOL_BITS):
+            new_v = v[k - s] ^ (v[k - s] >> s)
+            for i in range(1, s):
+                if (a >> (s - 1 - i)) & 1:
+                    new_v ^= v[k - i]
+            v.append(new_v)
+        directions[j] = v
+    return directions
+
+
+def bit_parity(x):
+    """
+    Returns the parity (0 or 1) of the set bits of each uint32 in array x.
+    Necessary for: scramble_direction_numbers()
+    """
+    x = x ^ (x >> 16)
+    x ^= x >> 8
+    x ^= x >> 4
+    x ^= x >> 2
+    x ^= x >> 1
+    return x & 1
+
+
+def scramble_direction_numbers(directions, rng):
+    """
+    Returns a random linear matrix scrambling of the direction numbers:
+    each dimension's digits are mixed by a random lower-triangular binary
+    matrix with unit diagonal, which keeps the Sobol net structure
+    while making the point set random.
+    Requires: bit_parity()
+    Necessary for: sobol_scrambling()
+    """
+    dims = directions.shape[0]
+    scrambled = np.zeros_like(directions)
+    # Digit i (counted from the most significant) of the output is the parity
+    #  of the input's digits i and a random selection of more significant ones
+    for i in range(SOBOL_BITS):
+        digit_bit = np.uint32(1 << (SOBOL_BITS - 1 - i))
+        more_significant = np.uint32(((1 << i) - 1) << (SOBOL_BITS - i))
+        masks = rng.integers(0, 1 << SOBOL_BITS, dims, dtype=np.uint32)
+        masks = (masks & more_significant) | digit_bit
+        parity = bit_parity(directions & masks[:, None])
+        scrambled |= parity.astype(np.uint32) * digit_bit
+    return scrambled
+
+
+def sobol_scrambling(dims, rng):
+    """
+    Returns a tuple (directions, shift) randomizing one Sobol point set in
+    dims dimensions, or as many as SOBOL_DIRECTIONS covers: linearly
+    scrambled direction numbers, plus a random digital shift so that every
+    point is uniformly distributed on its own.
+    Requires: sobol_direction_numbers(), scramble_direction_numbers()
+    """
+    sobol_dims = min(dims, len(SOBOL_DIRECTIONS) + 1)
+    directions = scramble_direction_numbers(sobol_direction_numbers(sobol_dims), rng)
+    shift = rng.integers(0, 1 << SOBOL_BITS, sobol_dims, dtype=np.uint32)
+    return directions, shift
+
+
+def sobol_points(directions, shift, start, out):
+    """
+    Writes points start, start + 1, ... of the Sobol point set randomized by
+    directions and shift into the rows of out, a (points x dims) float
+    array, as uniforms in [0, 1).  Any block of the set can be generated
+    on its own, which is what lets a point set be sampled chunk by chunk.
+    """
+    num_points = out.shape[0]
+    # Point i is the XOR of the direction numbers of the set bits of i;
+    #  one vectorized pass per bit rather than one step per point
+    index = np.arange(start, start + num_points)
+    points = np.zeros(out.shape, dtype=np.uint32)
+    for bit in range(max(start + num_points - 1, 1).bit_length()):
+        has_bit = ((index >> bit) & 1).astype(bool)
+        points[has_bit] ^= directions[:, bit]
+
+    points ^= shift
+    np.multiply(points, 1 / float(1 << SOBOL_BITS), out=out)
+
+
+def sample_sobol(config, num_trials, rng=None):
+    """
+    Randomized quasi-Monte Carlo run: trials are split into independently
+    scrambled Sobol point sets, one dimension per die, which cover the space
+    of rolls far more evenly than random points.  Standard errors come from
+    the spread of the estimates between the replicates.  Dice past the
+    dimensions in SOBOL_DIRECTIONS are padded with uniforms from rng.  Runs
+    too short for a trial per replicate are plain runs instead.
+    Returns a SimResult.
+    Requires: sobol_scrambling(), sobol_points(), RollBuffers,
+              estimated_result(), sample_pool()
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if num_trials < cfg.QMC_REPLICATES:
+        return sample_pool(config, num_trials, rng)
+    min_outcome, max_outcome = outcome_bounds(config)
+    num_outcomes = max_outcome - min_outcome + 1
+    total_dice = sum(config["dice"].values())
+
+    num_replicates = cfg.QMC_REPLICATES
+    per_replicate = num_trials // num_replicates
+
+    buffers = RollBuffers(config, per_replicate)
+    replicate_probabilities = np.zeros((num_replicates, num_outcomes))
+    for r in range(num_replicates):
+        directions, shift = sobol_scrambling(total_dice, rng)
+        sobol_dims = len(shift)
+        counts = np.zeros(num_outcomes, dtype=np.int64)
+        for start, size in buffers.chunks(per_replicate):
+            uniforms = buffers.uniforms[:size]
+            sobol_points(directions, shift, start, uniforms[:, :sobol_dims])
+            if total_dice > sobol_dims:
+                uniforms[:, sobol_dims:] = rng.random((size, total_dice - sobol_dims))
+            outcomes = buffers.roll(uniforms, rng)
+            outcomes -= min_outcome
+            counts += np.bincount(outcomes, minlength=num_outcomes)
+        replicate_probabilities[r] = counts / per_replicate
+    replicate_means = replicate_probabilities @ np.arange(num_outcomes)
+
+    result = estimated_result(
+        config,
+        min_outcome,
+        replicate_probabilities.mean(axis=0),
+        num_replicates * per_replicate,
+        "Sobol",
+    )
+    result.metadata["std_error"] = np.std(
+        replicate_probabilities, axis=0, ddof=1
+    ) / math.sqrt(num_replicates)
+    result.metadata["mean_std_error"] = float(
+        np.std(replicate_means, ddof=1) / math.sqrt(num_replicates)
+    )
+    return result
+
+
+def sample_with(config, num_trials, sampler="Plain", rng=None):
+    """
+    Runs a vectorized Monte Carlo simulation of the pool in config using the
+    named sampler, one of {'Plain', 'Antithetic', 'Stratified', 'Sobol'}.
+    Returns a SimResult whose metadata holds the standard error of every
+    outcome's probability ("std_error") and of the mean ("mean_std_error").
+    """
+    if sampler == "Antithetic":
+        return sample_antithetic(config, num_trials, rng)
+    if sampler == "Stratified":
+        return sample_stratified(config, num_trials, rng)
+    if sampler == "Sobol":
+        return sample_sobol(config, num_trials, rng)
+    return sample_pool(config, num_trials, rng)
+
+
+def spawn_seed(seed, index):
+    """
+    Returns the seed of part number index of a run seeded with seed.  Seeds
+    are spawned from one SeedSequence, so the parts are independent and the
+    run as a whole depends only on its seed.
+    """
+    sequence = np.random.SeedSequence(seed, spawn_key=(index,))
+    return int(sequence.generate_state(1)[0])
+
+
+def count_parts(num_trials):
+    """
+    Returns the number of parts a plain run of num_trials trials is split
+    into: PARALLEL_PARTS, or more if parts would otherwise hold over
+    PARALLEL_PART_TRIALS trials, but never so many that a part is empty.
+    It depends on num_trials alone, so that a run samples the same parts
+    however many processes they are spread over.
+    """
+    num_parts = max(
+        cfg.PARALLEL_PARTS, math.ceil(num_trials / cfg.PARALLEL_PART_TRIALS)
+    )
+    return max(1, min(num_parts, num_trials))
+
+
+def part_trials(num_trials, num_parts, part):
+    """
+    Returns the number of trials of part number part of a run of num_trials
+    trials split into num_parts parts, spread as evenly as possible.
+    """
+    return (num_trials + part) // num_parts
+
+
+def sample_parts(config, num_trials, rng_backend="PCG64", seed=0, parts=None):
+    """
+    Plain Monte Carlo run of num_trials trials for the pool in config, split
+    into count_parts() parts: part i holds part_trials() trials and is
+    sampled from a generator of rng_backend seeded with spawn_seed(seed, i).
+    Only the part numbers in parts are sampled if given, all of them
+    otherwise, so parts spread over several processes add up to the run.
+    Returns a SimResult of the trials sampled.
+    Requires: count_parts(), part_trials(), spawn_seed(), sample_pool()
+    """
+    num_parts = count_parts(num_trials)
+    if parts is None:
+        parts = range(num_parts)
+    min_outcome, max_outcome = outcome_bounds(config)
+    counts = np.zeros(max_outcome - min_outcome + 1, dtype=np.int64)
+    sampled = 0
+    for part in parts:
+        trials = part_trials(num_trials, num_parts, part)
+        rng = make_rng(rng_backend, spawn_seed(seed, part))
+        counts += sample_pool(config, trials, rng).counts
+        sampled += trials
+    return plain_result(config, min_outcome, counts, sampled)
+
+
+def parallel_workers(sampler, num_trials):
+    """
+    Returns the number of worker processes a run of num_trials trials with
+    sampler is split across by Simulator.perform_sim(); 1 means it isn't.
+    Only plain runs of at least PARALLEL_MIN_TRIALS trials are split, over
+    at most PARALLEL_WORKERS processes and one per CPU, and only where
+    worker processes can be forked.  How many there are doesn't change the
+    run's tallies, only how fast they come.
+    """
+    num_workers = min(cfg.PARALLEL_WORKERS, os.cpu_count() or 1)
+    if (
+        sampler != "Plain"
+        or num_trials < cfg.PARALLEL_MIN_TRIALS
+        or "fork" not in multiprocessing.get_all_start_methods()
+    ):
+        return 1
+    return num_workers
+
+
+def part_counts(config, num_trials, rng_backend, seed, parts):
+    """
+    Returns the outcome tallies of the parts in parts of a sample_parts()
+    run of num_trials trials of the pool in config.
+    Requires: sample_parts()
+    Necessary for: sample_parallel()
+    """
+    return sample_parts(config, num_trials, rng_backend, seed, parts).counts
+
+
+def metric_part_tallies(config, num_trials, rng_backend, seed, parts):
+    """
+    Returns the tally_kept_dice() tallies of the parts in parts of a
+    sample_metrics_parts() run of num_trials trials of the canonical pool in
+    config.
+    Requires: part_streams(), tally_kept_dice()
+    Necessary for: sample_metrics_parallel()
+    """
+    return tally_kept_dice(config, part_streams(num_trials, rng_backend, seed, parts))
+
+
+def accumulate_shared(
+    shm_name, shape, worker, tally, config, num_trials, rng_backend, seed
+):
+    """
+    Worker process body of fork_tallies(): tallies every shape[0]-th part of
+    a run of num_trials trials of the pool in config, starting from part
+    number worker, with tally(config, num_trials, rng_backend, seed, parts)
+    and adds them into row worker of the (workers x tallies) int64 array in
+    shared memory block shm_name.  Each worker owns its row, so no locking
+    is needed.
+    Necessary for: fork_tallies()
+    """
+    block = shared_memory.SharedMemory(name=shm_name)
+    try:
+        tallies = np.ndarray(shape, dtype=np.int64, buffer=block.buf)
+        parts = range(worker, count_parts(num_trials), shape[0])
+        tallies[worker] += tally(config, num_trials, rng_backend, seed, parts)
+        # The view must go before the block it looks into can be closed
+        del tallies
+    finally:
+        block.close()
+
+
+def fork_tallies(tally, size, num_workers, config, num_trials, rng_backend, seed):
+    """
+    Deals the count_parts() parts of a run of num_trials trials of the pool
+    in config out across num_workers forked processes, each tallying its
+    parts with tally() (see accumulate_shared()) into its own row of one
+    shared-memory int64 array of size tallies per row.  The parent reads
+    the rows in place once the workers have joined, so no results are
+    pickled or sent back.
+    Returns the tallies of every part, added up.
+    Requires: accumulate_shared()
+    Necessary for: sample_parallel(), sample_metrics_parallel()
+    """
+    shape = (num_workers, size)
+    block = shared_memory.SharedMemory(create=True, size=8 * shape[0] * shape[1])
+    try:
+        tallies = np.ndarray(shape, dtype=np.int64, buffer=block.buf)
+        tallies[:] = 0
+
+        context = multiprocessing.get_context("fork")
+        workers = []
+        for worker in range(num_workers):
+            process = context.Process(
+                target=accumulate_shared,
+                args=(
+                    block.name,
+                    shape,
+                    worker,
+                    tally,
+                    config,
+                    num_trials,
+                    rng_backend,
+                    seed,
+                ),
+            )
+            process.start()
+            workers.append(process)
+        for process in workers:
+            process.join()
+        if any(process.exitcode != 0 for process in workers):
+            raise RuntimeError("A simulation worker process failed")
+
+        total = tallies.sum(axis=0)
+        del tallies
+    finally:
+        block.close()
+        block.unlink()
+    return total
+
+
+def sample_parallel(config, num_trials, num_workers, rng_backend="PCG64", seed=0):
+    """
+    Plain Monte Carlo run of num_trials trials for the pool in config, its
+    sample_parts() parts dealt out across num_workers forked processes (no
+    more than there are parts), so its tallies are those of sample_parts()
+    with the same seed.  Workers tally straight into one shared-memory
+    histogram sized from outcome_bounds(); see fork_tallies().
+    Returns a SimResult.
+    Requires: fork_tallies(), part_counts(), count_parts(), plain_result()
+    """
+    num_workers = min(num_workers, count_parts(num_trials))
+    min_outcome, max_outcome = outcome_bounds(config)
+    counts = fork_tallies(
+        part_counts,
+        max_outcome - min_outcome + 1,
+        num_workers,
+        config,
+        num_trials,
+        rng_backend,
+        seed,
+    )
+    result = plain_result(config, min_outcome, counts, num_trials)
+    result.metadata["workers"] = num_workers
+    return result
+
+
+def sample_metrics_parallel(
+    config, num_trials, num_workers, rng_backend="PCG64", seed=0
+):
+    """
+    Counterpart of sample_metrics_parts() whose parts are dealt out across
+    num_workers forked processes as sample_parallel() deals them, so its
+    tallies are those of sample_metrics_parts() with the same seed, and
+    those of the pool's own metric those of sample_parallel().
+    Returns a dict of SimResults keyed by metric_key().
+    Requires: fork_tallies(), metric_part_tallies(), kept_dice_size(),
+              metrics_from_tallies()
+    """
+    config = canonical_config(config)
+    num_workers = min(num_workers, count_parts(num_trials))
+    tallies = fork_tallies(
+        metric_part_tallies,
+        kept_dice_size(config),
+        num_workers,
+        config,
+        num_trials,
+        rng_backend,
+        seed,
+    )
+    metrics = metrics_from_tallies(config, tallies, num_trials)
+    for result in metrics.values():
+        result.metadata["workers"] = num_workers
+    return metrics
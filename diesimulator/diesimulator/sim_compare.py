@@ -0,0 +1,93 @@
+# Comparison workspace.  Holds several dice pool configurations and evaluates
+#  them together in one job, sharing work between pools where possible.
+
+import copy
+
+from . import sim_backend
+from . import sim_exact
+from . import sim_planner
+
+sim = sim_backend.Simulator
+
+
+class Comparison:
+    # List of pool configurations to compare, as returned by get_config()
+    pools = []
+
+    # Results of the last comparison run, in the same order as pools
+    results = []
+
+    # Seed the random number generator of the last comparison run was
+    #  created with, if created here rather than passed in
+    seed = None
+
+    # How the pools are drawn against each other
+    #  available styles {'Step', 'CDF'}
+    plot_style = "Step"
+
+    @classmethod
+    def add_current_pool(cls):
+        """
+        Adds a snapshot of the Simulator's current configuration to the
+        comparison, unless there are no dice in the pool or an identical
+        configuration is already present.
+        Returns True if the pool was added, False otherwise.
+        """
+        config = sim.get_config()
+        if not config["dice"] or config in cls.pools:
+            return False
+        cls.pools.append(config)
+        return True
+
+    @classmethod
+    def clear_pools(cls):
+        """
+        Empties the comparison of pools and results.
+        """
+        cls.pools.clear()
+        cls.results.clear()
+
+    @classmethod
+    def run(cls, num_trials, rng=None):
+        """
+        Evaluates every pool in the comparison and stores results:
+        - pools the planner finds cheaper to compute exactly are, sharing
+          common die-type groups through the process-wide convolution cache
+        - all other pools are sampled on common random numbers, the same
+          uniforms sized for the largest of them, using num_trials trials
+        If no rng is passed in, one is created from Simulator's RNG settings.
+        Requires: sim_planner.Planner, sim_exact.exact_distribution(),
+                  sim_backend.sample_pool()
+        """
+        cls.results.clear()
+        cls.seed = None
+        if rng is None:
+            rng, cls.seed = sim.new_rng()
+
+        exact = [
+            sim_planner.Planner.prefers_exact(config, num_trials)
+            for config in cls.pools
+        ]
+        sampled_pools = [
+            config for config, is_exact in zip(cls.pools, exact) if not is_exact
+        ]
+
+        # Sampled pools each draw their uniforms, as wide as the largest of
+        #  them, from a copy of one generator, so all see the same uniforms
+        uniform_rng = sim_backend.child_rng(rng)
+        width = None
+        if sampled_pools:
+            width = max(sum(config["dice"].values()) for config in sampled_pools)
+
+        for config, is_exact in zip(cls.pools, exact):
+            if is_exact:
+                result = sim_exact.exact_distribution(config)
+            else:
+                result = sim_backend.sample_pool(
+                    config,
+                    num_trials,
+                    rng=rng,
+                    uniform_rng=copy.deepcopy(uniform_rng),
+                    width=width,
+                )
+            cls.results.append(result)
@@ -17,6 +17,124 @@ CUTOFF_SENSITIVITY = 120
 #  inaccuracies in representation
 ROUNDING_PREC = 6
 
+# Default and largest allowed number of times a single exploding die may
+#  explode (roll again and add on its highest face) in one roll
+EXPLODE_DEFAULT_DEPTH = 3
+EXPLODE_MAX_DEPTH = 20
+
+# Custom die types known by name in dice strings (e.g. 4dF for Fudge dice),
+#  each defined by its face values and the relative weight of each face
+CUSTOM_DICE = {"F": {"faces": [-1, 0, 1], "weights": [1, 1, 1]}}
+
+# Number of independently scrambled replicates the Sobol sampler splits its
+#  trials into; the spread between replicates gives its standard error
+QMC_REPLICATES = 8
+
+# Largest number of trials Clopper-Pearson intervals are computed for;
+#  past this they are indistinguishable from (and far slower than) Wilson
+#  intervals, which are used instead
+CLOPPER_PEARSON_MAX_TRIALS = 1000000
+
+# Largest amount of memory, in bytes, the process-wide cache of exact
+#  per-die-type distributions may hold before evicting least recently used
+CONVOLUTION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Most memory, in bytes, the working arrays of one chunk of sampled trials
+#  may take; runs are sampled in chunks sized to fit, whatever their length
+SAMPLE_MEMORY_CAP = 64 * 1024 * 1024
+
+# Largest number of distinct values the dice of a pool may show for plain
+#  runs to tally every metric (sum, successes at every threshold, highest
+#  and lowest die) at once; runs of pools of bigger dice tally only the one
+#  shown, so switching mode or threshold means running again
+METRICS_MAX_VALUES = 1000
+
+# Number of trials of the workloads the engine planner times on startup to
+#  calibrate its cost estimates to this machine
+PLANNER_CALIBRATION_TRIALS = 100000
+
+# Largest state table, in bytes, the exact engine may build for pools that
+#  sum dice after drops; larger pools are always sampled
+PLANNER_EXACT_MAX_BYTES = 256 * 1024 * 1024
+
+# Most worker processes plain Monte Carlo runs are split across (never more
+#  than there are CPUs), and the fewest trials a run needs before it is worth
+#  starting them; workers tally into one shared-memory histogram.  Workers
+#  are forked, so runs stay in one process where fork isn't available
+PARALLEL_WORKERS = 4
+PARALLEL_MIN_TRIALS = 2000000
+
+# Parts every plain Monte Carlo run is split into, each seeded from the run's
+#  seed and its part number, and the most trials a part may hold before runs
+#  are split into more; a run's tallies then depend only on its seed and its
+#  number of trials, not on how many processes its parts are spread over
+PARALLEL_PARTS = 16
+PARALLEL_PART_TRIALS = 10000000
+
+# Addresses ('host:port') of the workers plain Monte Carlo runs are split
+#  across when any are listed, on this machine or others; see sim_distributed
+DISTRIBUTED_WORKERS = []
+
+# Address a distributed worker listens on by default; workers serve anyone
+#  who connects, so they have to be given a --host to be reachable from
+#  other machines
+DISTRIBUTED_HOST = "127.0.0.1"
+DISTRIBUTED_PORT = 8766
+
+# Most trials a distributed worker samples for one part; parts asked for with
+#  more are rejected, so no coordinator can tie a worker up for long.  Runs'
+#  parts never hold more than PARALLEL_PART_TRIALS
+DISTRIBUTED_PART_TRIALS = PARALLEL_PART_TRIALS
+
+# Seconds a distributed worker may take to connect or to return a part before
+#  it is given up on and its part handed to another
+DISTRIBUTED_TIMEOUT = 120
+
+# Address the local simulation service listens on by default
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+
+# Number of worker processes the simulation service runs engines in; bounds
+#  how many batches are computed at once across all requests
+SERVICE_MAX_WORKERS = 4
+
+# Number of trials in each batch the simulation service splits sampled
+#  requests into; a refined result is streamed back after every batch
+SERVICE_BATCH_TRIALS = 250000
+
+# Largest number of trials the simulation service accepts in one request
+SERVICE_MAX_TRIALS = 100000000
+
+# Grid of pools whose exact distributions are precomputed into the table
+#  file (python -m diesimulator.sim_tables): sums of 1 to TABLE_MAX_DICE dice
+#  of each of TABLE_DIE_TYPES, dropping up to TABLE_MAX_DROPS of the lowest
+#  or highest.  The file is built once per user, as an install step, into
+#  TABLE_FILE; pools off its grid, or every pool until it is built, go to
+#  the engines
+TABLE_DIE_TYPES = (4, 6, 8, 10, 12, 20)
+TABLE_MAX_DICE = 40
+TABLE_MAX_DROPS = 3
+TABLE_FILE = "~/.diesimulator/sim_tables.bin"
+
+# Session file the settings and recent runs are saved to on exit (or from
+#  the Session frame) and restored from on startup, and the number of most
+#  recent runs it keeps
+SESSION_FILE = "~/.diesimulator/session.bin"
+SESSION_MAX_RUNS = 10
+
+# Number of trials of the pilot run tail estimation picks its tilt with, and
+#  the largest tilt (per unit of die value) it may pick; tilts past this make
+#  the extreme faces so likely that nothing would be gained
+TAIL_PILOT_TRIALS = 4000
+TAIL_MAX_TILT = 20.0
+# Fractions of the tilt centering outcomes on the target that tail
+#  estimation tries in its pilot run, keeping the one that estimates best
+TAIL_TILT_FRACTIONS = (0.25, 0.5, 0.75, 1.0)
+
+# Number of standard deviations either side of the mean the approximate
+#  engine evaluates outcomes over; the normal tail beyond 10 is below 1e-23
+APPROX_SIGMAS = 10
+
 ####    VALUES FOR SIMULATOR STUFFS ENDS HERE
 
 ####    ####    ####    ####
@@ -27,6 +145,11 @@ PLT_WIDTH = 9
 PLT_HEIGHT = 5
 PLT_DPI = 100
 
+# Largest amount of memory, in bytes, the cache of rendered plot images may
+#  hold before evicting least recently used; one image at the plot dimensions
+#  above takes PLT_WIDTH * PLT_HEIGHT * PLT_DPI^2 * 4 bytes
+FIGURE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
 # Default label spacing for the actual historgram bars
 #  1 means label each bar, 2 means skip every other one, etc.
 #  this value may get overwritten if there are too many bars on plot
@@ -0,0 +1,94 @@
+# Contest engine.  Evaluates opposed rolls of an attacker pool against a
+#  defender pool: win/tie/loss chances and the margin of victory.
+
+import numpy as np
+
+from . import sim_backend
+from . import sim_exact
+from . import sim_planner
+
+sim = sim_backend.Simulator
+
+
+class Contest:
+    # Pool configurations of each side, as returned by get_config()
+    attacker = None
+    defender = None
+
+    # Margin of victory (attacker outcome minus defender outcome) of the last
+    #  contest run, as a SimResult holding probabilities
+    margin = None
+
+    # Seed the random number generator of the last contest run was
+    #  created with, if created here rather than passed in
+    seed = None
+
+    # Chances of the attacker winning, tying and losing the last contest run
+    p_win = 0
+    p_tie = 0
+    p_loss = 0
+
+    @classmethod
+    def set_side(cls, side):
+        """
+        Sets the attacker or defender, as given by side, to a snapshot of the
+        Simulator's current configuration.
+        Returns True if the side was set, False if the dice pool is empty.
+        """
+        config = sim.get_config()
+        if not config["dice"]:
+            return False
+        if side == "Attacker":
+            cls.attacker = config
+        elif side == "Defender":
+            cls.defender = config
+        return True
+
+    @staticmethod
+    def evaluate_side(config, num_trials, rng):
+        """
+        Returns the outcome distribution of one side of the contest as a
+        SimResult, computed exactly if the planner finds that cheaper than
+        sampling num_trials trials, by sampling otherwise.
+        Necessary for: run()
+        """
+        if sim_planner.Planner.prefers_exact(config, num_trials):
+            return sim_exact.exact_distribution(config)
+        return sim_backend.sample_pool(config, num_trials, rng=rng)
+
+    @classmethod
+    def run(cls, num_trials, rng=None):
+        """
+        Evaluates the contest between attacker and defender.  The margin
+        distribution is the convolution of the attacker's distribution with
+        the defender's reversed, P(A - B = m) = Σ P(A = b + m) * P(B = b).
+        Sides without an exact form are sampled once each and their
+        histograms convolved, which pairs every sampled attacker trial with
+        every sampled defender trial at the cost of one vectorized convolution.
+        If no rng is passed in, one is created from Simulator's RNG settings.
+        Requires: evaluate_side()
+        """
+        cls.seed = None
+        if rng is None:
+            rng, cls.seed = sim.new_rng()
+
+        attack = cls.evaluate_side(cls.attacker, num_trials, rng)
+        defense = cls.evaluate_side(cls.defender, num_trials, rng)
+
+        margin_pmf = np.convolve(attack.probabilities(), defense.probabilities()[::-1])
+        # Smallest margin is the attacker's lowest against the defender's highest
+        max_defense = defense.min_outcome + len(defense.counts) - 1
+        min_margin = attack.min_outcome - max_defense
+
+        cls.margin = sim_backend.SimResult(None, min_margin, margin_pmf)
+        cls.margin.metadata["engine"] = " + ".join(
+            sorted({attack.metadata["engine"], defense.metadata["engine"]})
+        )
+        cls.margin.metadata["num_trials"] = max(
+            attack.num_trials or 0, defense.num_trials or 0
+        )
+
+        outcomes = cls.margin.outcomes()
+        cls.p_win = float(margin_pmf[outcomes > 0].sum())
+        cls.p_tie = float(margin_pmf[outcomes == 0].sum())
+        cls.p_loss = float(margin_pmf[outcomes < 0].sum())
@@ -0,0 +1,432 @@
+# Distributed sampling.  Splits plain Monte Carlo runs across worker
+#  processes on any number of hosts over a small TCP protocol: a coordinator
+#  hands out the parts of a run one at a time, and workers send back the
+#  tallies of each part as a compact count array.
+#
+#  Every message is a preamble of two u32s, the lengths of a JSON header and
+#  of a binary payload, followed by both, little-endian throughout:
+#   coordinator -> worker
+#    {"type": "part", "config", "rng", "seed", "part", "num_trials"}
+#    {"type": "close"}
+#   worker -> coordinator
+#    {"type": "counts", "part", "min_outcome", "dtype"}, payload the part's
+#     counts in dtype, the smallest unsigned one that holds them
+#    {"type": "error", "part", "message"}
+#  Runs are split into the parts of sim_backend.sample_parts(), whose number,
+#  trials and seeds depend only on the run's seed and number of trials, so a
+#  part handed to another worker after its first was lost is sampled exactly
+#  as it would have been, and the counts of a run don't depend on which or
+#  how many workers took part or were lost: they are those of sampling the
+#  run on one machine.
+#
+#  Run a worker with:  python -m diesimulator.sim_distributed worker [--port P]
+#  Workers serve any coordinator that connects, without authentication, so
+#  they only listen on localhost unless given a --host to listen on.
+#  and a run across workers with:
+#   python -m diesimulator.sim_distributed run --workers HOST:PORT ... \
+#       --config '{"dice": {"6": 20}}' --trials N
+
+import argparse
+import collections
+import json
+import multiprocessing
+import selectors
+import socket
+import struct
+import time
+
+import numpy as np
+
+from . import sim_config as cfg
+from . import sim_backend
+from . import sim_session
+
+sim = sim_backend.Simulator
+
+PREAMBLE = struct.Struct("<II")
+
+# Largest JSON header accepted, in bytes
+MAX_HEADER_BYTES = 64 * 1024
+
+
+def parse_address(address):
+    """
+    Returns a tuple (host, port) of a worker address given as 'host:port'.
+    Raises ValueError if address isn't of that form.
+    """
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Worker address {address!r} is not of the form host:port")
+    return host, int(port)
+
+
+def send_message(sock, header, payload=b""):
+    """
+    Sends one message, the dict header as JSON followed by bytes payload.
+    """
+    data = json.dumps(header).encode()
+    sock.sendall(PREAMBLE.pack(len(data), len(payload)) + data + payload)
+
+
+def receive_exactly(sock, size):
+    """
+    Returns the next size bytes read from sock.
+    Raises ConnectionError if the connection closes first.
+    """
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-message")
+        data += chunk
+    return bytes(data)
+
+
+def receive_message(sock):
+    """
+    Returns a tuple (header, payload) of the next message read from sock.
+    Raises ConnectionError if the connection closes first, and ValueError if
+    the message is malformed.
+    Requires: receive_exactly()
+    """
+    header_length, payload_length = PREAMBLE.unpack(
+        receive_exactly(sock, PREAMBLE.size)
+    )
+    if header_length > MAX_HEADER_BYTES:
+        raise ValueError("Message header is too large")
+    header = json.loads(receive_exactly(sock, header_length))
+    if not isinstance(header, dict):
+        raise ValueError("Message header is not a JSON object")
+    return header, receive_exactly(sock, payload_length)
+
+
+def sample_part(header):
+    """
+    Samples the part of a run described by the part message header.
+    Returns a SimResult.
+    Raises ValueError if the header doesn't describe a valid part, or one
+    of more than DISTRIBUTED_PART_TRIALS trials.
+    Requires: sim_backend.canonical_config(), sim_backend.sample_pool()
+    """
+    config = sim_backend.canonical_config(header.get("config", {}))
+    num_trials, seed = header.get("num_trials"), header.get("seed")
+    if not isinstance(num_trials, int) or num_trials < 1:
+        raise ValueError("num_trials must be a positive integer")
+    if num_trials > cfg.DISTRIBUTED_PART_TRIALS:
+        raise ValueError(
+            f"Parts may hold at most {cfg.DISTRIBUTED_PART_TRIALS} trials"
+        )
+    if not isinstance(seed, int) or seed < 0:
+        raise ValueError("seed must be a non-negative integer")
+    try:
+        rng = sim_backend.make_rng(header.get("rng", "PCG64"), seed)
+    except KeyError:
+        raise ValueError(f"Unknown RNG backend {header.get('rng')}")
+    return sim_backend.sample_pool(config, num_trials, rng)
+
+
+def serve_coordinator(conn, max_parts=None):
+    """
+    Samples the parts coordinator connection conn asks for, sending back
+    the counts of each, until it closes or asks to.  If max_parts is set,
+    stops without answering once that many parts have been asked for; a
+    worker that does so is lost to the coordinator, which tests use to
+    exercise reassignment.
+    Returns False if the worker stopped for max_parts, True otherwise.
+    Requires: receive_message(), send_message(), sample_part(),
+              sim_session.compact_counts()
+    """
+    served = 0
+    while True:
+        header, _ = receive_message(conn)
+        if header.get("type") != "part":
+            return True
+        served += 1
+        if max_parts is not None and served > max_parts:
+            return False
+        try:
+            result = sample_part(header)
+        except (ValueError, TypeError, AttributeError) as error:
+            reply = {"type": "error", "part": header.get("part"), "message": str(error)}
+            send_message(conn, reply)
+            continue
+        counts = sim_session.compact_counts(result)
+        reply = {
+            "type": "counts",
+            "part": header.get("part"),
+            "min_outcome": result.min_outcome,
+            "dtype": counts.dtype.str,
+        }
+        send_message(conn, reply, counts.tobytes())
+
+
+def run_worker(host, port, max_parts=None, ready=None):
+    """
+    Listens on host:port and serves the coordinators that connect, one at a
+    time, until interrupted.  Port 0 picks a free port; if ready is given,
+    the port listened on is sent through it, a multiprocessing Connection.
+    With max_parts set, the worker exits once a coordinator has asked it for
+    more than that many parts (see serve_coordinator()).
+    Requires: serve_coordinator()
+    """
+    with socket.create_server((host, port)) as listener:
+        if ready is not None:
+            ready.send(listener.getsockname()[1])
+        while True:
+            conn, _ = listener.accept()
+            with conn:
+                try:
+                    if not serve_coordinator(conn, max_parts):
+                        return
+                except (OSError, ValueError):
+                    # The coordinator went away or spoke nonsense; wait for
+                    #  the next one
+                    pass
+
+
+def start_local_workers(num_workers, max_parts=None):
+    """
+    Starts num_workers forked worker processes listening on free ports of
+    localhost, for trying distributed runs on one machine.  max_parts, if
+    set, applies to every worker started.
+    Returns a tuple (processes, addresses) of the worker processes and
+    their 'host:port' addresses; stop them with stop_local_workers().
+    Requires: run_worker()
+    """
+    context = multiprocessing.get_context("fork")
+    processes, addresses = [], []
+    for _ in range(num_workers):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=run_worker, args=("127.0.0.1", 0, max_parts, sender), daemon=True
+        )
+        process.start()
+        processes.append(process)
+        addresses.append(f"127.0.0.1:{receiver.recv()}")
+        receiver.close()
+    return processes, addresses
+
+
+def stop_local_workers(processes):
+    """
+    Stops worker processes started by start_local_workers().
+    """
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def unpack_counts(header, payload, held, min_outcome, num_outcomes):
+    """
+    Returns a tuple (offset, counts) of the counts a worker sent back in the
+    counts message header and payload, and where they start in a histogram
+    of num_outcomes outcomes from min_outcome.  held is the (part, trials,
+    deadline) the worker has in hand, or None.
+    Raises ValueError if the reply isn't for the part the worker holds, or
+    its counts don't fit the histogram or add up to the part's trials.
+    Necessary for: sample_distributed()
+    """
+    if held is None or header.get("type") != "counts" or header["part"] != held[0]:
+        raise ValueError("Worker replied out of turn")
+    counts = np.frombuffer(payload, dtype=np.dtype(header["dtype"]))
+    offset = header["min_outcome"] - min_outcome
+    if counts.dtype.kind != "u" or offset < 0 or offset + len(counts) > num_outcomes:
+        raise ValueError("Worker counts don't fit the outcome bounds")
+    if int(counts.sum(dtype=np.uint64)) != held[1]:
+        raise ValueError("Worker counts don't add up to the part's trials")
+    return offset, counts
+
+
+def sample_distributed(config, num_trials, addresses, rng_backend="PCG64", seed=0):
+    """
+    Plain Monte Carlo run of num_trials trials for the pool in config, its
+    sim_backend.sample_parts() parts spread across the workers at addresses,
+    a list of 'host:port' strings, so its counts are those of sample_parts()
+    with the same seed.  Each worker has one part in hand at a time and is
+    given the next as soon as its counts come back; a worker that can't be
+    reached, disconnects, sends a malformed reply or holds a part past
+    DISTRIBUTED_TIMEOUT seconds is dropped and its part handed to the next
+    free worker.  Counts are merged into an int64 histogram sized
+    from outcome_bounds().
+    Returns a SimResult whose metadata also holds the number of "workers"
+    asked and of "lost_workers".
+    Raises ValueError if a worker rejects the pool, and RuntimeError if
+    every worker is lost before the run is done.
+    Requires: parse_address(), send_message(), receive_message(),
+              unpack_counts(), sim_backend.count_parts(),
+              sim_backend.part_trials(), sim_backend.spawn_seed(),
+              sim_backend.plain_result()
+    """
+    config = sim_backend.canonical_config(config)
+    min_outcome, max_outcome = sim_backend.outcome_bounds(config)
+    counts = np.zeros(max_outcome - min_outcome + 1, dtype=np.int64)
+    num_parts = sim_backend.count_parts(num_trials)
+    pending = collections.deque(range(num_parts))
+    done = 0
+    lost = 0
+
+    selector = selectors.DefaultSelector()
+    # Connected workers and the (part, trials, deadline) each has in hand, or
+    #  None
+    in_hand = {}
+
+    def drop(sock):
+        nonlocal lost
+        held = in_hand.pop(sock)
+        if held is not None:
+            pending.appendleft(held[0])
+        selector.unregister(sock)
+        sock.close()
+        lost += 1
+
+    def assign(sock):
+        if not pending:
+            in_hand[sock] = None
+            return
+        part = pending.popleft()
+        trials = sim_backend.part_trials(num_trials, num_parts, part)
+        in_hand[sock] = part, trials, time.monotonic() + cfg.DISTRIBUTED_TIMEOUT
+        header = {
+            "type": "part",
+            "config": config,
+            "rng": rng_backend,
+            "seed": sim_backend.spawn_seed(seed, part),
+            "part": part,
+            "num_trials": trials,
+        }
+        try:
+            send_message(sock, header)
+        except OSError:
+            drop(sock)
+
+    try:
+        for address in addresses:
+            try:
+                sock = socket.create_connection(
+                    parse_address(address), timeout=cfg.DISTRIBUTED_TIMEOUT
+                )
+            except OSError:
+                lost += 1
+                continue
+            selector.register(sock, selectors.EVENT_READ)
+            assign(sock)
+
+        while done < num_parts:
+            if not in_hand:
+                raise RuntimeError("Every distributed worker was lost")
+            # Idle workers take up parts given back by lost ones
+            for sock, held in list(in_hand.items()):
+                if held is None and pending:
+                    assign(sock)
+
+            for key, _ in selector.select(timeout=1.0):
+                sock = key.fileobj
+                if sock not in in_hand:
+                    continue
+                try:
+                    header, payload = receive_message(sock)
+                except (OSError, ValueError):
+                    drop(sock)
+                    continue
+                if header.get("type") == "error":
+                    message = header.get("message")
+                    raise ValueError(f"Worker rejected the run: {message}")
+                try:
+                    offset, part_counts = unpack_counts(
+                        header, payload, in_hand[sock], min_outcome, len(counts)
+                    )
+                except (ValueError, KeyError, TypeError):
+                    drop(sock)
+                    continue
+                counts[offset : offset + len(part_counts)] += part_counts
+                done += 1
+                assign(sock)
+
+            now = time.monotonic()
+            for sock, held in list(in_hand.items()):
+                if held is not None and now > held[2]:
+                    drop(sock)
+    finally:
+        for sock in list(in_hand):
+            try:
+                send_message(sock, {"type": "close"})
+            except OSError:
+                pass
+            sock.close()
+        selector.close()
+
+    result = sim_backend.plain_result(config, min_outcome, counts, num_trials)
+    result.metadata["workers"] = len(addresses)
+    result.metadata["lost_workers"] = lost
+    return result
+
+
+def perform_sim():
+    """
+    Distributed counterpart of Simulator.perform_sim(): performs a plain
+    simulation run of the number of trials stored in Simulator across the
+    Simulator's workers, keeping the tallies as a SimResult in Simulator's
+    result with the RNG backend and seed used in its metadata.
+    Raises ValueError or RuntimeError as sample_distributed() does.
+    Requires: sample_distributed()
+    """
+    sim.freq.clear()
+    sim.metrics = {}
+
+    _, seed = sim.new_rng()
+    sim.result = sample_distributed(
+        sim.get_config(), sim.num_trials, sim.workers, sim.rng_backend, seed
+    )
+    sim.result.metadata["rng"] = sim.rng_backend
+    sim.result.metadata["seed"] = seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributed dice simulation")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker = commands.add_parser("worker", help="serve parts of runs to coordinators")
+    worker.add_argument(
+        "--host",
+        default=cfg.DISTRIBUTED_HOST,
+        help="address to listen on; workers don't authenticate coordinators,"
+        " so only listen beyond localhost (e.g. 0.0.0.0) on trusted networks",
+    )
+    worker.add_argument("--port", type=int, default=cfg.DISTRIBUTED_PORT)
+
+    run = commands.add_parser("run", help="split a run across workers")
+    run.add_argument("--workers", nargs="+", required=True, metavar="HOST:PORT")
+    run.add_argument("--config", required=True, help="pool configuration as JSON")
+    run.add_argument("--trials", type=int, default=10000000)
+    run.add_argument("--rng", default="PCG64")
+    run.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        print(f"Serving simulation parts on {args.host}:{args.port}")
+        try:
+            run_worker(args.host, args.port)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    result = sample_distributed(
+        json.loads(args.config), args.trials, args.workers, args.rng, args.seed
+    )
+    print(
+        json.dumps(
+            {
+                "config": result.config,
+                "min_outcome": int(result.min_outcome),
+                "counts": result.counts.tolist(),
+                "mean": result.mean(),
+                "std": result.std(),
+                "lost_workers": result.metadata["lost_workers"],
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
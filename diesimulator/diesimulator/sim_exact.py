@@ -0,0 +1,486 @@
+# Exact engine.  Computes outcome distributions of dice pools analytically by
+#  convolving per-die probability mass functions, without any sampling.
+
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from . import sim_config as cfg
+from . import sim_backend
+from . import sim_tables
+
+
+class ConvolutionCache:
+    # Cached distributions of groups of identical dice, as (offset, pmf)
+    #  tuples keyed by die_group_key(), ordered from least to most recently used
+    entries = OrderedDict()
+
+    # Memory held by the cached pmf arrays, and the most it may hold
+    size_bytes = 0
+    max_bytes = cfg.CONVOLUTION_CACHE_MAX_BYTES
+
+    # Lookup statistics since the cache was last cleared
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    @classmethod
+    def get(cls, key):
+        """
+        Returns the cached (offset, pmf) tuple for key, marking it as most
+        recently used, or None if key is not cached.
+        """
+        entry = cls.entries.get(key)
+        if entry is None:
+            cls.misses += 1
+            return None
+        cls.hits += 1
+        cls.entries.move_to_end(key)
+        return entry
+
+    @classmethod
+    def put(cls, key, entry):
+        """
+        Caches the (offset, pmf) tuple entry under key, then evicts least
+        recently used entries until the cache is back within its memory bound.
+        The pmf is made read-only, as it is shared by everyone who looks it up.
+        """
+        if key in cls.entries:
+            return
+        entry[1].setflags(write=False)
+        cls.entries[key] = entry
+        cls.size_bytes += entry[1].nbytes
+
+        # Never evicts the entry just added, even if it alone is over the bound
+        while cls.size_bytes > cls.max_bytes and len(cls.entries) > 1:
+            _, (_, evicted_pmf) = cls.entries.popitem(last=False)
+            cls.size_bytes -= evicted_pmf.nbytes
+            cls.evictions += 1
+
+    @classmethod
+    def clear(cls):
+        """
+        Empties the cache and resets its statistics.
+        """
+        cls.entries.clear()
+        cls.size_bytes = 0
+        cls.hits = 0
+        cls.misses = 0
+        cls.evictions = 0
+
+    @classmethod
+    def stats(cls):
+        """
+        Returns a dict of the cache's hit/miss statistics and memory use.
+        """
+        lookups = cls.hits + cls.misses
+        return {
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "hit_rate": cls.hits / lookups if lookups else 0,
+            "evictions": cls.evictions,
+            "entries": len(cls.entries),
+            "size_bytes": cls.size_bytes,
+            "max_bytes": cls.max_bytes,
+        }
+
+
+def has_exact_form(config):
+    """
+    Returns True if the pool in config can be evaluated by convolution alone,
+    i.e. every die contributes to the outcome independently of the others.
+    Dropping dice couples them together, except when counting successes,
+    where the dropped dice are always the failures (or successes) first.
+    Pools without this form need drop_distribution()'s state space, or
+    for the highest or lowest kept die, order_statistic_distribution().
+    """
+    if not config["dice"] or config["mode"] not in ("Sum", "Successes"):
+        return False
+    return config["num_drops"] == 0 or config["mode"] == "Successes"
+
+
+def die_value_pmf(die_type, config):
+    """
+    Returns a tuple (offset, pmf) of the value of a single die of die_type,
+    uniform over the faces left after rerolls, or for custom dice over their
+    faces as weighted.  Exploding dice follow a geometric series truncated at
+    the configured depth: the chance of j explosions followed by any other
+    face is p^(j + 1), p being the chance of any one face, and the roll after
+    the last allowed explosion is kept as is.
+    pmf[i] is the probability of the die showing offset + i.
+    Necessary for: die_pmf()
+    """
+    if sim_backend.is_custom_die(die_type):
+        values, probabilities = sim_backend.custom_die_pmf(die_type, config)
+        pmf = np.zeros(values[-1] - values[0] + 1)
+        pmf[values - values[0]] = probabilities
+        return int(values[0]), pmf
+
+    faces = sim_backend.get_die_faces(die_type, config["reroll_threshold"])
+    p_face = 1 / len(faces)
+    if die_type not in config["explode"]:
+        return int(faces[0]), np.full(len(faces), p_face)
+
+    depth = config["explode_depth"]
+    top = faces[-1]
+    pmf = np.zeros(top * (depth + 1) - faces[0] + 1)
+    for j in range(depth + 1):
+        # Only the roll after the last allowed explosion may show the top face
+        last_faces = faces if j == depth else faces[:-1]
+        pmf[j * top + last_faces - faces[0]] = p_face ** (j + 1)
+    return int(faces[0]), pmf
+
+
+def truncated_mass(config):
+    """
+    Returns the probability that at least one exploding die in the pool would
+    have exploded beyond the configured depth, i.e. the probability mass cut
+    off by truncating the geometric series.  This bounds the total variation
+    distance between the depth-limited and the unlimited distributions.
+    """
+    p_within_depth = 1.0
+    for die_type in config["explode"]:
+        faces = sim_backend.get_die_faces(die_type, config["reroll_threshold"])
+        p_past_depth = (1 / len(faces)) ** (config["explode_depth"] + 1)
+        p_within_depth *= (1 - p_past_depth) ** config["dice"][die_type]
+    return 1 - p_within_depth
+
+
+def die_pmf(die_type, config):
+    """
+    Returns a tuple (offset, pmf) describing what a single die of die_type
+    contributes to the outcome of the pool in config:
+    - Sum: the value of the die
+    - Successes: 1 with the chance of a value at or above the threshold, else 0
+    pmf[i] is the probability of contributing offset + i.
+    Requires: die_value_pmf()
+    """
+    offset, pmf = die_value_pmf(die_type, config)
+
+    if config["mode"] == "Successes":
+        values = np.arange(offset, offset + len(pmf))
+        p_success = pmf[values >= config["success_threshold"]].sum()
+        return 0, np.array([1 - p_success, p_success])
+    return offset, pmf
+
+
+def die_group_key(die_type, die_amt, config):
+    """
+    Returns a hashable key identifying the distribution of die_amt dice of
+    die_type under config; pools sharing a key share the same convolution.
+    """
+    key = (config["mode"], die_type, die_amt, config["reroll_threshold"])
+    # Custom dice are named per pool, so are told apart by their definitions
+    if sim_backend.is_custom_die(die_type):
+        spec = config["custom_dice"][die_type]
+        key += (tuple(spec["faces"]), tuple(spec["weights"]))
+    if config["mode"] == "Successes":
+        key += (config["success_threshold"],)
+    if die_type in config["explode"]:
+        key += ("Explode", config["explode_depth"])
+    return key
+
+
+def die_group_pmf(die_type, die_amt, config):
+    """
+    Returns a tuple (offset, pmf) for the combined contribution of die_amt
+    dice of die_type, looked up in or added to the ConvolutionCache.
+    Built by binary exponentiation: the distributions of 1, 2, 4, 8, ...
+    dice are each one squaring of the last, and die_amt dice are the
+    convolution of the powers of two summing to it, so k dice take
+    O(log k) convolutions.  Those powers of two are cached too, which is
+    what lets e.g. 10d6, 12d6 and 14d6 share most of their work.
+    Requires: die_pmf()
+    """
+    key = die_group_key(die_type, die_amt, config)
+    entry = ConvolutionCache.get(key)
+    if entry is not None:
+        return entry
+
+    if die_amt == 1:
+        entry = die_pmf(die_type, config)
+    elif die_amt % 2 == 0:
+        # Squaring step; half the dice convolved with themselves
+        half_offset, half_pmf = die_group_pmf(die_type, die_amt // 2, config)
+        entry = (2 * half_offset, np.convolve(half_pmf, half_pmf))
+    else:
+        # Largest power of two below die_amt, plus the remaining dice
+        power = 1 << (die_amt.bit_length() - 1)
+        power_offset, power_pmf = die_group_pmf(die_type, power, config)
+        rest_offset, rest_pmf = die_group_pmf(die_type, die_amt - power, config)
+        entry = (power_offset + rest_offset, np.convolve(power_pmf, rest_pmf))
+
+    ConvolutionCache.put(key, entry)
+    return entry
+
+
+def pool_pmf(config):
+    """
+    Returns a tuple (offset, pmf) of the combined contribution of every die
+    in the pool in config, ignoring drops.  The pool is assembled from
+    per-die-type distributions in the process-wide ConvolutionCache, so pools
+    evaluated one after another (e.g. 3d6 and 3d6+2d8) share their common work.
+    Requires: die_group_pmf()
+    """
+    offset = 0
+    pmf = np.ones(1)
+    for die_type, die_amt in config["dice"].items():
+        group_offset, group_pmf = die_group_pmf(die_type, die_amt, config)
+
+        offset += group_offset
+        pmf = np.convolve(pmf, group_pmf)
+    return offset, pmf
+
+
+def drop_successes(config, pmf):
+    """
+    Returns the distribution of successes kept after drops, given the pmf of
+    successes S among all n dice of the pool in config.  Failures are lower
+    than successes, so dropping the lowest d dice drops failures first and
+    keeps S - max(0, d - (n - S)); dropping the highest keeps max(0, S - d).
+    """
+    num_dice = len(pmf) - 1
+    num_drops = config["num_drops"]
+    successes = np.arange(num_dice + 1)
+    if config["mode_drop"] == "Drop lowest":
+        kept = successes - np.maximum(0, num_drops - (num_dice - successes))
+    else:
+        kept = np.maximum(0, successes - num_drops)
+    return np.bincount(kept, weights=pmf, minlength=num_dice + 1)
+
+
+def kept_sum_offset(config):
+    """
+    Returns the smallest sum the state spaces of drop_distribution() and
+    identical_drop_distribution() track for the pool in config, which drops
+    dice.  Their sums are indexed from 0, so when dice can show negative
+    values (e.g. Fudge dice) every value is counted from the lowest one,
+    which shifts every kept sum by the same amount and leaves which dice
+    are dropped as it was.
+    """
+    lowest = min(0, sim_backend.die_value_range(config)[0])
+    return lowest * (sum(config["dice"].values()) - config["num_drops"])
+
+
+def drop_state_space(config):
+    """
+    Returns a tuple (num_states, num_values, length) sizing the computation
+    drop_distribution() performs for the pool in config: the most states it
+    tracks (multisets of num_drops die values), the number of distinct die
+    values, and the length of each state's distribution over kept sums.
+    """
+    values = set()
+    for die_type in config["dice"]:
+        offset, pmf = die_value_pmf(die_type, config)
+        values.update((offset + np.flatnonzero(pmf)).tolist())
+
+    num_values = len(values)
+    num_states = math.comb(num_values + config["num_drops"] - 1, config["num_drops"])
+    length = sim_backend.outcome_bounds(config)[1] - kept_sum_offset(config) + 1
+    return num_states, num_values, length
+
+
+def drop_distribution(config):
+    """
+    Returns a tuple (offset, pmf) of the sum of the dice kept in the pool in
+    config, which drops dice; pmf is indexed from a sum of offset, that of
+    kept_sum_offset().  Dice are added one at a time to a state space whose
+    states are the num_drops most extreme values so far (the candidates for
+    dropping), each state holding the distribution of the sum of the dice
+    already known to be kept.  Adding a die to a state either makes it one
+    of the extremes, or pushes the least extreme of them out and into the
+    kept sum.  Transitions that push out
+    the same value shift their source rows equally, so they are applied
+    together as one np.add.at() over the state table.
+    Requires: kept_sum_offset()
+    Necessary for: exact_distribution()
+    """
+    num_drops = config["num_drops"]
+    drop_lowest = config["mode_drop"] == "Drop lowest"
+    offset = kept_sum_offset(config)
+    lowest = min(0, sim_backend.die_value_range(config)[0])
+    length = sim_backend.outcome_bounds(config)[1] - offset + 1
+
+    # Maps each state (sorted tuple of extreme values) to its row in table
+    states = {(): 0}
+    table = np.zeros((1, length))
+    table[0, 0] = 1
+    for die_type, die_amt in config["dice"].items():
+        value_offset, value_pmf = die_value_pmf(die_type, config)
+        values = (value_offset - lowest + np.flatnonzero(value_pmf)).tolist()
+        chances = value_pmf[value_pmf > 0].tolist()
+
+        for _ in range(die_amt):
+            new_states = {}
+            # Transitions grouped by the value they push into the kept sum,
+            #  as lists of source rows, destination rows and chances
+            moves = {}
+            for extremes, row in states.items():
+                for value, chance in zip(values, chances):
+                    held = sorted(extremes + (value,))
+                    kept = 0
+                    if len(held) > num_drops:
+                        kept = held.pop() if drop_lowest else held.pop(0)
+                    dest = new_states.setdefault(tuple(held), len(new_states))
+                    rows, dests, weights = moves.setdefault(kept, ([], [], []))
+                    rows.append(row)
+                    dests.append(dest)
+                    weights.append(chance)
+
+            new_table = np.zeros((len(new_states), length))
+            for kept, (rows, dests, weights) in moves.items():
+                shifted = table[rows, : length - kept] * np.array(weights)[:, None]
+                np.add.at(new_table[:, kept:], dests, shifted)
+            states, table = new_states, new_table
+
+    return offset, table.sum(axis=0)
+
+
+def identical_drop_distribution(config):
+    """
+    Returns a tuple (offset, pmf) of the sum of the dice kept in the pool in
+    config, which holds dice of one type and drops dice; pmf is indexed from
+    a sum of offset, that of kept_sum_offset().  Values are handed out in
+    the order dice are dropped in (lowest first when dropping the lowest),
+    so after m dice have their values exactly min(m, num_drops) of them are
+    dropped, and the state space is just m, each state holding the
+    distribution of the kept sum.  c of the
+    remaining n - m dice taking the next value v has chance C(n - m, c) p^c,
+    the rest taking later values; products of these make up the multinomial.
+    Far cheaper than drop_distribution() for the pools it applies to,
+    O(values * n^2) shifts rather than O(n * states * values).
+    Requires: kept_sum_offset()
+    Necessary for: exact_distribution()
+    """
+    (die_type, num_dice), = config["dice"].items()
+    num_drops = config["num_drops"]
+    offset = kept_sum_offset(config)
+    length = sim_backend.outcome_bounds(config)[1] - offset + 1
+
+    value_offset, value_pmf = die_value_pmf(die_type, config)
+    # Values are counted from the lowest if negative, as kept_sum_offset() is
+    lowest = min(0, value_offset)
+    values = (value_offset - lowest + np.flatnonzero(value_pmf)).tolist()
+    chances = value_pmf[value_pmf > 0].tolist()
+    if config["mode_drop"] == "Drop highest":
+        values.reverse()
+        chances.reverse()
+
+    table = np.zeros((num_dice + 1, length))
+    table[0, 0] = 1
+    for value, chance in zip(values, chances):
+        new_table = np.zeros_like(table)
+        for assigned in range(num_dice + 1):
+            if not table[assigned].any():
+                continue
+            remaining = num_dice - assigned
+            for taking in range(remaining + 1):
+                weight = math.comb(remaining, taking) * chance**taking
+                dropped = min(taking, max(0, num_drops - assigned))
+                shift = (taking - dropped) * value
+                new_table[assigned + taking, shift:] += (
+                    weight * table[assigned, : length - shift]
+                )
+        table = new_table
+    return offset, table[num_dice]
+
+
+def order_rank(config):
+    """
+    Returns the rank, counting from 1 for the lowest, among all dice of the
+    pool in config of the die the Highest or Lowest mode reports: the
+    highest or lowest of the dice kept after drops.
+    """
+    num_drops = config["num_drops"]
+    if config["mode"] == "Highest":
+        if config["mode_drop"] == "Drop highest":
+            return sum(config["dice"].values()) - num_drops
+        return sum(config["dice"].values())
+    if config["mode_drop"] == "Drop lowest":
+        return 1 + num_drops
+    return 1
+
+
+def order_statistic_distribution(config):
+    """
+    Returns a tuple (offset, pmf) of the value of the die of rank
+    order_rank() in the pool in config.  That die shows at most v exactly
+    when at least rank dice do; the number of dice that do is a sum of
+    independent binomials, one per die type, so its distribution is their
+    convolution, computed for every value v at once.
+    pmf[i] is the probability of the die showing offset + i.
+    Requires: die_value_pmf(), order_rank()
+    """
+    value_pmfs = [
+        (die_amt, die_value_pmf(die_type, config))
+        for die_type, die_amt in config["dice"].items()
+    ]
+    low, high = sim_backend.die_value_range(config)
+    values = np.arange(low, high + 1)
+
+    # at_most[v, c]: chance that exactly c dice show at most low + v
+    at_most = np.ones((len(values), 1))
+    for die_amt, (offset, pmf) in value_pmfs:
+        cdf = np.concatenate(([0], np.minimum(np.cumsum(pmf), 1)))
+        p = cdf[np.clip(values - offset + 1, 0, len(pmf))][:, np.newaxis]
+        k = np.arange(die_amt + 1)
+        binomial = np.array([math.comb(die_amt, i) for i in k]) * (
+            p**k * (1 - p) ** (die_amt - k)
+        )
+
+        combined = np.zeros((len(values), at_most.shape[1] + die_amt))
+        for i in k:
+            combined[:, i : i + at_most.shape[1]] += at_most * binomial[:, i : i + 1]
+        at_most = combined
+
+    cdf = at_most[:, order_rank(config) :].sum(axis=1)
+    return low, np.diff(cdf, prepend=0)
+
+
+def compute_distribution(config):
+    """
+    Computes the exact outcome distribution of the pool in config and returns
+    it as a SimResult holding probabilities.  The highest or lowest kept die
+    is an order statistic of the dice; pools with an exact form are
+    convolved; pools summing dice of one type after drops go through the
+    state space of identical_drop_distribution(), and pools of mixed types
+    through that of drop_distribution(), whose cost grows quickly with the
+    number of drops and faces (see drop_state_space()).
+    Requires: order_statistic_distribution(), pool_pmf(), drop_successes(),
+              identical_drop_distribution(), drop_distribution()
+    """
+    if config["mode"] in ("Highest", "Lowest"):
+        offset, pmf = order_statistic_distribution(config)
+    elif has_exact_form(config):
+        offset, pmf = pool_pmf(config)
+        if config["num_drops"] > 0:
+            pmf = drop_successes(config, pmf)
+    elif len(config["dice"]) == 1:
+        offset, pmf = identical_drop_distribution(config)
+    else:
+        offset, pmf = drop_distribution(config)
+
+    # Trims to the outcome range sampled results use, so the two line up;
+    #  only outcomes of zero probability (e.g. impossible failures) are lost
+    min_outcome, max_outcome = sim_backend.outcome_bounds(config)
+    pmf = pmf[min_outcome - offset : max_outcome - offset + 1]
+
+    result = sim_backend.SimResult(config, min_outcome, pmf)
+    result.metadata["engine"] = "Exact"
+    if config["explode"]:
+        result.metadata["truncated_mass"] = truncated_mass(config)
+    return result
+
+
+def exact_distribution(config):
+    """
+    Returns the exact outcome distribution of the pool in config as a
+    SimResult holding probabilities: looked up in the precomputed tables
+    when the pool is on their grid, computed otherwise.
+    Requires: sim_tables.DistributionTables, compute_distribution()
+    """
+    result = sim_tables.DistributionTables.lookup(config)
+    if result is None:
+        result = compute_distribution(config)
+    return result
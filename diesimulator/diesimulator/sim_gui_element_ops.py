@@ -2,41 +2,148 @@
 
 import PySimpleGUI as sg
 
+from . import sim_config as cfg
+from . import sim_approx
 from . import sim_backend
+from . import sim_compare
+from . import sim_contest
+from . import sim_distributed
+from . import sim_exact
+from . import sim_joint
+from . import sim_planner
 from . import sim_plotter as splot
+from . import sim_session
+from . import sim_sweep
+from . import sim_tail
 
 sim = sim_backend.Simulator
 plotter = splot.Plotter
+planner = sim_planner.Planner
+comparison = sim_compare.Comparison
+contest = sim_contest.Contest
+joint = sim_joint.Joint
+sweep = sim_sweep.Sweep
+tail = sim_tail.Tail
+session = sim_session.Session
+
+# Numeric bounds last pushed to each spinner, keyed by element key
+#  lets the per-event updaters skip reconfiguring Tk when nothing has changed
+spin_bounds = {}
+
+# Die types and selection last pushed to the explode listbox, same purpose
+explode_listed = ()
+
+# Run labels last pushed to the session's recent runs combobox, same purpose
+session_listed = []
+
+
+def parse_custom_faces(faces_str):
+    """
+    Parses the faces of a custom die written between braces in the manual
+    input field, separated by commas and each optionally given an integer
+    weight after a ':' (e.g. 1,2,3:2 rolls 3s twice as often as the others),
+    and returns the die's definition, or None if faces_str is malformed.
+    Necessary for: parse_input()
+    """
+    faces = []
+    weights = []
+    for entry in faces_str.split(","):
+        face, _, weight = entry.partition(":")
+        try:
+            faces.append(int(face))
+            weights.append(int(weight) if weight else 1)
+        except ValueError:
+            return None
+    try:
+        return sim_backend.custom_die_spec(faces, weights)
+    except ValueError:
+        return None
 
 
 def parse_input(input_str):
     """
-    Parses user input str from manual input field and returns a dice diction
-    in the format (type: number)
+    Parses user input str from manual input field and returns a tuple of
+    a dice dictionary in the format (type: number), a list of the die types
+    marked as exploding with a trailing '!' (e.g. 3d6!) and a dictionary of
+    the definitions of custom dice given by their faces.  Custom dice are
+    either named, if defined in Simulator's custom dice (e.g. 4dF), or
+    written out as their faces between braces, which also names them
+    (e.g. 2d{2,2,3,3,4,6}); they can't explode.
+    Requires: parse_custom_faces()
     Necessary for: man_ops()
     """
     temp_dice = {}
+    exploding = []
+    definitions = {}
     # Split into groups based on the + character
     die_groups = input_str.split("+")
     for group in die_groups:
-        temp = group.split("d")
+        # Exploding die marker, only valid at the very end of a group
+        explodes = group.endswith("!")
+        die_num, _, die_str = group.removesuffix("!").partition("d")
         # Should catch all invalid entries for dice in _d_ format
-        if len(temp) != 2:
-            return {}
-        if not temp[0].isdigit() or not temp[1].isdigit():
-            return {}
-        if int(temp[0]) < 1 or int(temp[1]) < 1:
-            return {}
-        # Otherwise, values are valid; convert to ints and
-        temp[0] = int(temp[0])
-        temp[1] = int(temp[1])
+        if not die_num.isdigit() or int(die_num) < 1:
+            return {}, [], {}
+        if die_str.isdigit() and int(die_str) >= 1:
+            die_type = int(die_str)
+        elif die_str in sim.custom_dice:
+            die_type = die_str
+        elif die_str.startswith("{") and die_str.endswith("}"):
+            die_type = die_str
+            definitions[die_type] = parse_custom_faces(die_str[1:-1])
+            if definitions[die_type] is None:
+                return {}, [], {}
+        else:
+            return {}, [], {}
+        if explodes and sim_backend.is_custom_die(die_type):
+            return {}, [], {}
         # Append or add entries to temp_dice dictionary
         #  append will catch degenerate input, such as 3d6+2d6 (=5d6)
-        if temp[1] in temp_dice:
-            temp_dice[temp[1]] = temp_dice[temp[1]] + temp[0]
+        if die_type in temp_dice:
+            temp_dice[die_type] = temp_dice[die_type] + int(die_num)
         else:
-            temp_dice[temp[1]] = temp[0]
-    return temp_dice
+            temp_dice[die_type] = int(die_num)
+        if explodes and die_type not in exploding:
+            exploding.append(die_type)
+    return temp_dice, exploding, definitions
+
+
+def set_spin_bounds(window, key, lower, upper):
+    """
+    Backs the spinner with key with the numeric bounds [lower, upper] instead
+    of an enumerated list of values, so that the cost of an update does not
+    depend on the size of the range (e.g. a d100000 in the pool).
+    Tk is only reconfigured if the bounds differ from the last ones pushed.
+    Necessary for: element_update_(...) functions below
+    """
+    if spin_bounds.get(key) == (lower, upper):
+        return
+
+    spin_window = window[key]
+    # Tk may snap the displayed value to the new lower bound on reconfigure,
+    #  so hold onto it and restore it afterwards; callers clamp it as needed
+    current_value = spin_window.get()
+    # An empty values option makes Tk fall back to the from/to bounds
+    spin_window.Widget.configure(
+        values="", from_=lower, to=upper, increment=1, format="%.0f"
+    )
+    spin_window.update(value=current_value)
+    spin_bounds[key] = (lower, upper)
+
+
+def clamp_spin_value(window, key, lower, upper):
+    """
+    Clamps the current value of the spinner with key into [lower, upper],
+    writing the clamped value back to the element if it had to change.
+    Returns the clamped value as an int.
+    Necessary for: element_update_(...) functions below
+    """
+    spin_window = window[key]
+    value = int(spin_window.get())
+    clamped = min(max(value, lower), upper)
+    if clamped != value:
+        spin_window.update(value=clamped)
+    return clamped
 
 
 def element_update_successes(window, values):
@@ -64,21 +171,22 @@ def element_update_successes(window, values):
         mst_window.update(disabled=False)
 
         # In other words, this is the largest value that can occur on any single
-        #  die in the pool
-        biggest_die = max(sim.dice)
+        #  die in the pool (at least 1, should every face of it be below that)
+        biggest_die = max(sim_backend.top_face(sim.get_config()), 1)
         # Range starts at 1 because it makes no sense to ever have
         #  a success threshold of 0
-        mst_window.update(values=list(range(1, biggest_die + 1)))
+        set_spin_bounds(window, "-MODE_SUCCESS_THRESHOLD-", 1, biggest_die)
         # Updates selection for situation where a larger faced die is removed
         #  this also triggers if user inputs value greater than largest die
-        if int(mst_window.get()) > biggest_die:
-            mst_window.update(value=biggest_die)
+        sim.success_threshold = clamp_spin_value(
+            window, "-MODE_SUCCESS_THRESHOLD-", 1, biggest_die
+        )
     else:
         # Disables and resets spinner if dice pool is empty
-        mst_window.update(value=1, values=[1], disabled=True)
+        set_spin_bounds(window, "-MODE_SUCCESS_THRESHOLD-", 1, 1)
+        mst_window.update(value=1, disabled=True)
+        sim.success_threshold = 1
 
-    # Update simulator success threshold from value in spinner
-    sim.success_threshold = int(mst_window.get())
     return 0
 
 
@@ -109,14 +217,11 @@ def element_update_drops(window, values):
 
     # NOT an off-by-one error here; it doesn't make sense to drop all the dice
     #  so the correct interval is [0, total_dice)
-    dn_window.update(values=list(range(0, total_dice)))
+    set_spin_bounds(window, "-DROP_NUM-", 0, total_dice - 1)
 
-    # Updates selection for situation when dice are removed
-    if int(dn_window.get()) >= total_dice:
-        dn_window.update(value=total_dice - 1)
-
-    # Update simulator number of drops from value in spinner
-    sim.num_drops = int(dn_window.get())
+    # Updates selection for situation when dice are removed, and
+    #  update simulator number of drops from value in spinner
+    sim.num_drops = clamp_spin_value(window, "-DROP_NUM-", 0, total_dice - 1)
     return 0
 
 
@@ -128,8 +233,10 @@ def element_update_reroll(window, values):
     # Prevents an annoying error when dice pool is empty,
     #  causing window to report a value of -1
     smallest_die = 1
-    if sim.dice:
-        smallest_die = min(sim.dice)
+    # Only standard dice are rerolled, so only they bound the threshold
+    standard = [d for d in sim.dice if not sim_backend.is_custom_die(d)]
+    if standard:
+        smallest_die = min(standard)
     # Redefinition for convenience
     rt_window = window["-REROLL_THRESHOLD-"]
     rt_str = values["-REROLL_THRESHOLD-"]
@@ -147,14 +254,13 @@ def element_update_reroll(window, values):
     # NOT an off by one error - we want the interval to be [0, smallest_die)
     #  (in other words, not inclusive), since if we have to reroll the largest
     #  value on the smallest die then we'll be rerolling forever
-    rt_window.update(values=list(range(0, smallest_die)))
-
-    # Updates selection for situation where a larger faced die is removed
-    if int(rt_window.get()) >= smallest_die:
-        rt_window.update(value=smallest_die - 1)
+    set_spin_bounds(window, "-REROLL_THRESHOLD-", 0, smallest_die - 1)
 
-    # Update simulator reroll threshold from value in spinner
-    sim.reroll_threshold = int(rt_window.get())
+    # Updates selection for situation where a larger faced die is removed, and
+    #  update simulator reroll threshold from value in spinner
+    sim.reroll_threshold = clamp_spin_value(
+        window, "-REROLL_THRESHOLD-", 0, smallest_die - 1
+    )
     return 0
 
 
@@ -195,11 +301,144 @@ def pool_update(window):
     if sim.dice:
         pool_str = ""
         for die_type, die_num in sim.dice.items():
-            pool_str += f"{die_num} D{die_type}\n"
+            pool_str += f"{die_num} D{die_type}"
+            if die_type in sim.explode_dice:
+                pool_str += " (!)"
+            pool_str += "\n"
         # Clears up a newline at the end of output
         pool_window.update(pool_str[:-1])
 
 
+def format_seconds(seconds):
+    """
+    Formats a duration in seconds for display, in ms below one second.
+    """
+    if seconds < 1:
+        return f"{max(seconds * 1000, 1):.0f} ms"
+    return f"{seconds:.1f} s"
+
+
+def plan_update(window):
+    """
+    Update function for the engine plan text below the run button; should be
+    run once per cycle so that it names the engine the planner would pick
+    for the current configuration, and its estimated run time.
+    Tk is only updated if the text has changed.
+    Requires: format_seconds()
+    """
+    plan_text = ""
+    if sim.approximate and sim_approx.has_approximate_form(sim.get_config()):
+        plan_text = "Approximate"
+    elif sim.dice and sim.num_trials > 0:
+        plan = planner.plan(
+            sim.get_config(), sim.num_trials, sim.sampler, metrics=True
+        )
+        plan_text = f"{plan['engine']}, ~{format_seconds(plan['estimate'])}"
+
+    if window["-ENGAGE_PLAN-"].get() != plan_text:
+        window["-ENGAGE_PLAN-"].update(value=plan_text)
+
+
+def explode_update(window):
+    """
+    Update function for explode listbox element; should be run once per
+    cycle so that it lists exactly the die types in the pool, with those
+    set to explode selected.  Tk is only updated if either has changed.
+    """
+    global explode_listed
+
+    # Only standard dice can explode
+    die_types = sorted(d for d in sim.dice if not sim_backend.is_custom_die(d))
+    # Forget explode settings of die types no longer in the pool
+    sim.explode_dice = [d for d in sim.explode_dice if d in sim.dice]
+    selected = [die_types.index(d) for d in sim.explode_dice]
+
+    if explode_listed != (die_types, selected):
+        window["-EXPLODE_SELECT-"].update(values=die_types, set_to_index=selected)
+        explode_listed = (die_types, selected)
+
+
+def session_update(window):
+    """
+    Update function for the session's recent runs combobox; should be run
+    once per cycle so that it lists the runs of the session, most recent
+    first.  Tk is only updated if the list has changed.
+    """
+    global session_listed
+
+    labels = []
+    for i, run in enumerate(session.runs):
+        trials_str = "Exact"
+        if run["num_trials"] is not None:
+            trials_str = f"{run['num_trials']} Trials"
+        labels.append(
+            f"{i + 1}. {plotter.describe_config(run['config'])}, {trials_str}"
+        )
+
+    if session_listed != labels:
+        window["-SESSION_RECENT-"].update(values=labels)
+        session_listed = labels
+
+
+def metric_update(window):
+    """
+    Update function for the plot; should be run once per cycle, after the
+    mode and success threshold are read from their elements, so that when
+    the last run tallied the metric they now select, the plot switches to it
+    immediately, without running again.  When it didn't, as only plain runs
+    tally every metric, the note below the run button says that the plot is
+    of other settings.  Tk is only updated if the note has changed.
+    Requires: redraw_plot()
+    """
+    if sim.switch_metric():
+        sim.sanitize_outcomes()
+        redraw_plot(window)
+
+    outdated_text = "Run to plot these settings" if sim.result_outdated() else ""
+    if window["-ENGAGE_OUTDATED-"].get() != outdated_text:
+        window["-ENGAGE_OUTDATED-"].update(value=outdated_text)
+
+
+def sync_elements(window):
+    """
+    Pushes all of Simulator's settings to their GUI elements, e.g. after
+    they were restored from a session rather than set through the GUI.
+    Spinner bounds are set before their values, so Tk doesn't clamp them.
+    """
+    if sim.dice:
+        top_face = max(sim_backend.top_face(sim.get_config()), 1)
+        standard = [d for d in sim.dice if not sim_backend.is_custom_die(d)]
+        set_spin_bounds(window, "-MODE_SUCCESS_THRESHOLD-", 1, top_face)
+        set_spin_bounds(window, "-DROP_NUM-", 0, sim.get_total_dice() - 1)
+        set_spin_bounds(window, "-REROLL_THRESHOLD-", 0, min(standard, default=1) - 1)
+
+    window["-MODE_SUM-"].update(value=sim.mode == "Sum")
+    window["-MODE_SUCCESS-"].update(value=sim.mode == "Successes")
+    window["-MODE_HIGHEST-"].update(value=sim.mode == "Highest")
+    window["-MODE_LOWEST-"].update(value=sim.mode == "Lowest")
+    window["-MODE_SUCCESS_THRESHOLD-"].update(
+        value=sim.success_threshold, disabled=sim.mode != "Successes"
+    )
+    window["-DROP_SELECT-"].update(value=sim.mode_drop)
+    window["-DROP_NUM-"].update(
+        value=sim.num_drops, disabled=sim.mode_drop == "Do not drop"
+    )
+    window["-REROLL_SELECT-"].update(value=sim.reroll_threshold > 0)
+    window["-REROLL_THRESHOLD-"].update(
+        value=sim.reroll_threshold, disabled=sim.reroll_threshold == 0
+    )
+    window["-EXPLODE_DEPTH-"].update(value=sim.explode_depth)
+
+    window["-NUM_TRIALS_INPUT-"].update(value=sim.num_trials)
+    window["-NUM_TRIALS_CI-"].update(value=sim.CI_level)
+    window["-NUM_TRIALS_MOE-"].update(value=f"{sim.calculate_MoE()}%")
+    window["-NUM_TRIALS_RNG-"].update(value=sim.rng_backend)
+    window["-NUM_TRIALS_SEED-"].update(value="" if sim.seed is None else sim.seed)
+    window["-NUM_TRIALS_SAMPLER-"].update(value=sim.sampler)
+    window["-NUM_TRIALS_APPROX-"].update(value=sim.approximate)
+    window["-DISPLAY_CUTOFF-"].update(value=sim.cutoff_sensitivity)
+
+
 def man_ops(window, event, values):
     """
     Operations that must be performed for interaction with elements in the
@@ -213,13 +452,15 @@ def man_ops(window, event, values):
 
     if event == "INPUT":
         # Input validation.  Should delete any character that's not
-        #  a numeral, d, +
-        if mi_str and mi_str[-1] not in ("0123456789d+"):
-            mi_window.update(mi_str[:-1])
+        #  a numeral, d, +, !, a letter naming a custom die, or one of {},:-
+        #  writing out the faces of one
+        if mi_str and mi_str[-1] not in ("0123456789d+!{},:-"):
+            if not mi_str[-1].isalpha():
+                mi_window.update(mi_str[:-1])
 
     if event in ["REPLACE", "APPEND"]:
         # Generates new dice dictionary from user input
-        new_dice_dict = parse_input(mi_window.get())
+        new_dice_dict, new_exploding, new_custom = parse_input(mi_window.get())
         # If input is malformed, dice dict should be empty
         if not new_dice_dict:
             sg.popup(
@@ -231,8 +472,12 @@ def man_ops(window, event, values):
             # Replaces or appends to current dice dictionary depending on mode
             if event == "REPLACE":
                 sim.clear_die_pool()
+            sim.custom_dice.update(new_custom)
             for die_type, die_num in new_dice_dict.items():
                 sim.modify_dice(die_type, "+", die_num)
+            for die_type in new_exploding:
+                if die_type not in sim.explode_dice:
+                    sim.explode_dice.append(die_type)
 
 
 def mode_ops(window, event):
@@ -243,16 +488,37 @@ def mode_ops(window, event):
     """
     # Note: success threshold is updated in universal element update,
     #  and not here
-    if event in ["SUM", "SUCCESS"]:
+    if event in ["SUM", "SUCCESS", "HIGHEST", "LOWEST"]:
         # Redefinition for convenience
         mst_window = window["-MODE_SUCCESS_THRESHOLD-"]
-        if event == "SUM":
-            sim.mode = "Sum"
-            mst_window.update(disabled=True, value=1)
-            sim.success_threshold = 1
         if event == "SUCCESS":
             sim.mode = "Successes"
             mst_window.update(disabled=False, value=1)
+        else:
+            sim.mode = {"SUM": "Sum", "HIGHEST": "Highest", "LOWEST": "Lowest"}[event]
+            mst_window.update(disabled=True, value=1)
+            sim.success_threshold = 1
+
+
+def explode_ops(window, event, values):
+    """
+    Operations that must be performed for interaction with elements in the
+    explode frame.  Pass in "sub-event" for any event starting
+    with "EXPLODE" and performs appropriate operations
+    """
+    if event == "SELECT":
+        sim.explode_dice = list(values["-EXPLODE_SELECT-"])
+
+    if event == "DEPTH":
+        # Redefinitions for convenience
+        ed_window = window["-EXPLODE_DEPTH-"]
+        ed_str = str(values["-EXPLODE_DEPTH-"])
+
+        # Resets to last valid depth if input is not an int in range
+        if ed_str.isdigit() and 1 <= int(ed_str) <= cfg.EXPLODE_MAX_DEPTH:
+            sim.explode_depth = int(ed_str)
+        else:
+            ed_window.update(value=sim.explode_depth)
 
 
 def drop_ops(window, mode):
@@ -288,7 +554,7 @@ def reroll_select_ops(window, enabled):
         rt_window.update(disabled=False)
     else:
         rt_window.update(disabled=True, value=0)
-        sim.num_drops = 0
+        sim.reroll_threshold = 0
 
 
 def num_trials_ops(window, event, values):
@@ -323,13 +589,62 @@ def num_trials_ops(window, event, values):
 
     if event == "CI":
         sim.CI_level = int(window["-NUM_TRIALS_CI-"].get())
+        # Error bars depend on CI level
+        if plotter.show_error_bars:
+            redraw_plot(window)
+
+    if event in ["ERROR_BARS", "CI_METHOD"]:
+        plotter.show_error_bars = values["-NUM_TRIALS_ERROR_BARS-"]
+        plotter.ci_method = values["-NUM_TRIALS_CI_METHOD-"]
+        redraw_plot(window)
+
+    if event == "RNG":
+        sim.rng_backend = values["-NUM_TRIALS_RNG-"]
+
+    if event == "SEED":
+        # Input validation - should delete any character that's not
+        #  a numeral; a blank seed means a fresh seed every run
+        seed_str = values["-NUM_TRIALS_SEED-"]
+        if seed_str and seed_str[-1] not in ("0123456789"):
+            seed_str = seed_str[:-1]
+            window["-NUM_TRIALS_SEED-"].update(seed_str)
+        sim.seed = int(seed_str) if seed_str else None
+
+    if event == "APPROX":
+        sim.approximate = values["-NUM_TRIALS_APPROX-"]
+
+    if event == "SAMPLER":
+        sim.sampler = values["-NUM_TRIALS_SAMPLER-"]
+        # Estimate no longer applies to results from a different sampler
+        window["-NUM_TRIALS_MOE-"].update(value=f"{sim.calculate_MoE()}%")
+
+
+def redraw_plot(window):
+    """
+    Regenerates and redraws the plot of the last simulation run from the
+    data already held by Simulator, e.g. after a change in plot settings,
+    without running the simulation again.  Plots of recently drawn results
+    and settings come straight from the figure cache.  Does nothing if there
+    is no data.
+    """
+    if not sim.freq:
+        return
+
+    # clear previous canvas
+    if plotter.fig_agg is not None:
+        plotter.fig_agg.get_tk_widget().forget()
+
+    plotter.fig = plotter.generate_cached_plot()
+    plotter.fig_agg = splot.draw_figure(window["-CANVAS-"].TKCanvas, plotter.fig)
 
 
 def engage_ops(window, input_error_flag):
     """
     Operations that must be performed when the user hits the
     'Run Simulation' button.  Runs simulation and draws graph
-    assuming no errors in input.
+    assuming no errors in input.  The engine is picked by the planner, or is
+    the approximate engine if asked for and the pool allows it; plain runs
+    are sampled across the distributed workers if any are set.
     """
     # Verify no errors in input from earlier
     if input_error_flag:
@@ -353,14 +668,313 @@ def engage_ops(window, input_error_flag):
         if plotter.fig_agg is not None:
             plotter.fig_agg.get_tk_widget().forget()
 
-        sim.perform_sim()
+        # Runs whichever engine the planner expects to finish first, unless
+        #  asked for a quick approximation the pool allows
+        config = sim.get_config()
+        if sim.approximate and sim_approx.has_approximate_form(config):
+            sim.freq.clear()
+            sim.metrics = {}
+            sim.result = sim_approx.approximate_distribution(config)
+        elif planner.prefers_exact(
+            config, sim.num_trials, sim.sampler, metrics=True
+        ):
+            sim.freq.clear()
+            sim.metrics = {}
+            sim.result = sim_exact.exact_distribution(config)
+        elif sim.workers and sim.sampler == "Plain":
+            try:
+                sim_distributed.perform_sim()
+            except (ValueError, RuntimeError) as error:
+                sg.popup(str(error), title="Distributed Run Error")
+                # Puts back the last plot the canvas was cleared of
+                if plotter.fig is not None:
+                    plotter.fig_agg = splot.draw_figure(
+                        window["-CANVAS-"].TKCanvas, plotter.fig
+                    )
+                return
+        else:
+            sim.perform_sim()
         window.refresh()
+
+        # Variance-reduction samplers measure their own margin of error
+        empirical_moe = sim.calculate_empirical_MoE()
+        if empirical_moe is not None:
+            window["-NUM_TRIALS_MOE-"].update(value=f"{empirical_moe}%")
+
+        session.add_result(sim.result)
         sim.sanitize_outcomes()
-        plotter.fig = plotter.generate_plot()
+        plotter.fig = plotter.generate_cached_plot()
 
         plotter.fig_agg = splot.draw_figure(window["-CANVAS-"].TKCanvas, plotter.fig)
 
 
+def display_ops(window, event, values):
+    """
+    Operations that must be performed for interaction with elements in the
+    display frame.  Pass in "sub-event" for any event starting
+    with "DISPLAY" and performs appropriate operations
+    Display settings only change how results are shown, so the last results
+    are redrawn with them immediately rather than re-simulated.
+    """
+    if event == "CUTOFF":
+        sim.cutoff_sensitivity = int(values["-DISPLAY_CUTOFF-"])
+        if sim.result is not None:
+            sim.sanitize_outcomes()
+            redraw_plot(window)
+
+    if event == "PLOT":
+        plotter.plot_mode = values["-DISPLAY_PLOT-"]
+        redraw_plot(window)
+
+
+def compare_ops(window, event, values):
+    """
+    Operations that must be performed for interaction with elements in the
+    comparison frame.  Pass in "sub-event" for any event starting
+    with "COMPARE" and performs appropriate operations
+    """
+    if event == "ADD":
+        if not comparison.add_current_pool():
+            sg.popup(
+                "Dice pool is empty or already in the comparison.",
+                title="Comparison Error",
+            )
+
+    if event == "CLEAR":
+        comparison.clear_pools()
+
+    if event == "STYLE":
+        comparison.plot_style = values["-COMPARE_STYLE-"]
+
+    if event == "RUN":
+        if not comparison.pools:
+            sg.popup(
+                "No pools to compare; comparison aborted.", title="Comparison Error"
+            )
+        elif sim.num_trials < 1:
+            sg.popup(
+                "Non-positive number of trials; comparison aborted.",
+                title="Number of Trials Error",
+            )
+        else:
+            # clear previous canvas
+            if plotter.fig_agg is not None:
+                plotter.fig_agg.get_tk_widget().forget()
+
+            comparison.run(sim.num_trials)
+            plotter.fig = plotter.generate_comparison_plot(
+                comparison.results, comparison.plot_style, comparison.seed
+            )
+
+            plotter.fig_agg = splot.draw_figure(
+                window["-CANVAS-"].TKCanvas, plotter.fig
+            )
+
+    num_pools = len(comparison.pools)
+    window["-COMPARE_COUNT-"].update(value=f"{num_pools} pool{'s' * (num_pools != 1)}")
+
+
+def contest_ops(window, event):
+    """
+    Operations that must be performed for interaction with elements in the
+    opposed roll frame.  Pass in "sub-event" for any event starting
+    with "CONTEST" and performs appropriate operations
+    """
+    if event in ["ATTACKER", "DEFENDER"]:
+        if not contest.set_side(event.capitalize()):
+            sg.popup("No dice in pool; side not set.", title="Dice Pool Error")
+
+    if event == "RUN":
+        if contest.attacker is None or contest.defender is None:
+            sg.popup(
+                "Set both an attacker and a defender pool first.",
+                title="Contest Error",
+            )
+        elif sim.num_trials < 1:
+            sg.popup(
+                "Non-positive number of trials; contest aborted.",
+                title="Number of Trials Error",
+            )
+        else:
+            # clear previous canvas
+            if plotter.fig_agg is not None:
+                plotter.fig_agg.get_tk_widget().forget()
+
+            contest.run(sim.num_trials)
+            plotter.fig = plotter.generate_contest_plot(contest)
+
+            plotter.fig_agg = splot.draw_figure(
+                window["-CANVAS-"].TKCanvas, plotter.fig
+            )
+
+    # Short description of each side, without the mode
+    sides_str = ""
+    for label, config in (("A", contest.attacker), ("D", contest.defender)):
+        side_str = "(none)"
+        if config is not None:
+            side_str = plotter.describe_config(config).split(" of ", 1)[1]
+        sides_str += f"{label}: {side_str}\n"
+    window["-CONTEST_SIDES-"].update(value=sides_str[:-1])
+
+
+def joint_ops(window, event, values):
+    """
+    Operations that must be performed for interaction with elements in the
+    joint distribution frame.  Pass in "sub-event" for any event starting
+    with "JOINT" and performs appropriate operations
+    """
+    if event == "X":
+        joint.x_metric = values["-JOINT_X-"]
+
+    if event == "Y":
+        joint.y_metric = values["-JOINT_Y-"]
+
+    if event == "RUN":
+        if not sim.dice:
+            sg.popup("No dice in pool; joint run aborted.", title="Dice Pool Error")
+        elif sim.num_trials < 1:
+            sg.popup(
+                "Non-positive number of trials; joint run aborted.",
+                title="Number of Trials Error",
+            )
+        else:
+            try:
+                joint.run(sim.num_trials)
+            except ValueError as error:
+                sg.popup(f"{error}; joint run aborted.", title="Joint Error")
+                return
+
+            # clear previous canvas
+            if plotter.fig_agg is not None:
+                plotter.fig_agg.get_tk_widget().forget()
+
+            plotter.fig = plotter.generate_joint_plot(joint)
+
+            plotter.fig_agg = splot.draw_figure(
+                window["-CANVAS-"].TKCanvas, plotter.fig
+            )
+
+
+def sweep_ops(window, event, values):
+    """
+    Operations that must be performed for interaction with elements in the
+    sweep frame.  Pass in "sub-event" for any event starting
+    with "SWEEP" and performs appropriate operations
+    """
+    if event == "PARAM":
+        sweep.parameter = values["-SWEEP_PARAM-"]
+
+    if event == "STYLE":
+        sweep.plot_style = values["-SWEEP_STYLE-"]
+
+    if event == "RUN":
+        if not sim.dice:
+            sg.popup("No dice in pool; sweep aborted.", title="Dice Pool Error")
+        elif sim.num_trials < 1:
+            sg.popup(
+                "Non-positive number of trials; sweep aborted.",
+                title="Number of Trials Error",
+            )
+        else:
+            # clear previous canvas
+            if plotter.fig_agg is not None:
+                plotter.fig_agg.get_tk_widget().forget()
+
+            sweep.run(sim.num_trials)
+            plotter.fig = plotter.generate_sweep_plot(sweep)
+
+            plotter.fig_agg = splot.draw_figure(
+                window["-CANVAS-"].TKCanvas, plotter.fig
+            )
+
+
+def tail_ops(window, event, values):
+    """
+    Operations that must be performed for interaction with elements in the
+    rare outcomes frame.  Pass in "sub-event" for any event starting
+    with "TAIL" and performs appropriate operations
+    """
+    if event == "SIDE":
+        tail.side = values["-TAIL_SIDE-"]
+
+    if event == "TARGET":
+        # Input validation - should delete any character that's not
+        #  a numeral, except a leading minus sign, as pools of Fudge dice or
+        #  custom dice with negative faces can total below zero; a blank
+        #  target (or a lone minus sign) means none entered yet
+        target_str = values["-TAIL_TARGET-"]
+        if target_str and target_str[-1] not in ("0123456789"):
+            if target_str != "-":
+                target_str = target_str[:-1]
+                window["-TAIL_TARGET-"].update(target_str)
+        try:
+            tail.target = int(target_str)
+        except ValueError:
+            tail.target = None
+
+    if event == "RUN":
+        if not sim.dice:
+            sg.popup("No dice in pool; estimate aborted.", title="Dice Pool Error")
+        elif tail.target is None:
+            sg.popup("Enter the outcome the tail starts from.", title="Tail Error")
+        elif sim.num_trials < 2:
+            sg.popup(
+                "Too few trials to estimate an error; estimate aborted.",
+                title="Number of Trials Error",
+            )
+        else:
+            # clear previous canvas
+            if plotter.fig_agg is not None:
+                plotter.fig_agg.get_tk_widget().forget()
+
+            tail.run(sim.num_trials)
+            plotter.fig = plotter.generate_tail_plot(tail)
+
+            plotter.fig_agg = splot.draw_figure(
+                window["-CANVAS-"].TKCanvas, plotter.fig
+            )
+
+
+def restore_run(window, index):
+    """
+    Makes run index of the session the current one: restores its pool
+    settings (and number of trials, if sampled) to Simulator and the GUI and
+    redraws its plot, without running anything.
+    Requires: sync_elements(), redraw_plot()
+    """
+    result = session.result(index)
+    session.restore_config(result.config)
+    if result.num_trials is not None:
+        sim.num_trials = result.num_trials
+    sim.result = result
+    sync_elements(window)
+
+    sim.sanitize_outcomes()
+    redraw_plot(window)
+
+
+def session_ops(window, event, values):
+    """
+    Operations that must be performed for interaction with elements in the
+    session frame.  Pass in "sub-event" for any event starting
+    with "SESSION" and performs appropriate operations
+    Requires: restore_run()
+    """
+    if event == "RECENT":
+        restore_run(window, session_listed.index(values["-SESSION_RECENT-"]))
+
+    if event == "SAVE":
+        try:
+            session.save()
+        except OSError as error:
+            sg.popup(f"Unable to save session: {error}", title="Save Error")
+        else:
+            sg.popup(
+                f"Session saved as {sim_session.session_path()}.",
+                title="Save Successful",
+            )
+
+
 def save_output_ops():
     """
     Operations that must be performed when the user hits the
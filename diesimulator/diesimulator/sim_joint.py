@@ -0,0 +1,250 @@
+# Joint distributions.  Tallies two metrics of the same rolls of a pool into
+#  one 2-D histogram, e.g. the sum against the number of successes, or the
+#  sum of the kept dice against the sum of the dropped ones.
+
+import numpy as np
+
+from . import sim_config as cfg
+from . import sim_backend
+from . import sim_exact
+
+sim = sim_backend.Simulator
+
+# Metrics a roll can be reduced to for a joint distribution; all but the
+#  dropped sum are modes, and all but it only look at the kept dice
+METRICS = ["Sum", "Successes", "Highest", "Lowest", "Dropped sum"]
+
+
+class JointResult:
+    """
+    Raw 2-D outcome histogram of two metrics of one dice pool configuration,
+    stored as a dense array indexed from the smallest value of each metric:
+    counts[i, j] is for rolls whose x metric is min_x + i and whose y metric
+    is min_y + j.  As with SimResult, num_trials is None for exact results,
+    whose counts hold probabilities.
+    """
+
+    def __init__(self, config, metrics, mins, counts, num_trials=None):
+        self.config = config
+        self.metrics = metrics
+        self.min_x, self.min_y = mins
+        self.counts = counts
+        self.num_trials = num_trials
+        self.metadata = {}
+
+    def probabilities(self):
+        """
+        Returns the joint probability of every pair of values, as a 2-D array.
+        """
+        if self.num_trials is None:
+            return self.counts
+        return self.counts / self.num_trials
+
+    def outcomes(self, axis):
+        """
+        Returns an array of the values of the x (axis 0) or y (axis 1) metric.
+        """
+        start = self.min_x if axis == 0 else self.min_y
+        return np.arange(start, start + self.counts.shape[axis])
+
+    def marginal(self, axis):
+        """
+        Returns the distribution of the x (axis 0) or y (axis 1) metric alone
+        as a SimResult, summing the joint histogram over the other.
+        """
+        start = self.min_x if axis == 0 else self.min_y
+        counts = self.counts.sum(axis=1 - axis)
+        return sim_backend.SimResult(self.config, start, counts, self.num_trials)
+
+    def correlation(self):
+        """
+        Returns the correlation coefficient of the two metrics, or 0 if
+        either of them is constant.
+        """
+        probabilities = self.probabilities()
+        x = self.outcomes(0)[:, np.newaxis] - self.marginal(0).mean()
+        y = self.outcomes(1)[np.newaxis, :] - self.marginal(1).mean()
+        covariance = (probabilities * x * y).sum()
+        spread = self.marginal(0).std() * self.marginal(1).std()
+        return float(covariance / spread) if spread > 0 else 0.0
+
+
+def joint_config(config, metrics):
+    """
+    Returns the canonical configuration of the pool in config for a joint
+    run of metrics; its mode is Successes if either metric is, so the success
+    threshold is kept, and Sum otherwise.
+    """
+    mode = "Successes" if "Successes" in metrics else "Sum"
+    return sim_backend.canonical_config(dict(config, mode=mode))
+
+
+def metric_bounds(config, metric):
+    """
+    Returns a tuple (min, max) bounding the values metric can take for the
+    pool in config.  Bounds of the dropped sum are those of the dropped dice
+    all showing the lowest or highest value any die can.
+    """
+    if metric == "Dropped sum":
+        low, high = sim_backend.die_value_range(config)
+        return config["num_drops"] * low, config["num_drops"] * high
+    return sim_backend.outcome_bounds(dict(config, mode=metric))
+
+
+def metric_values(config, metric, rolls):
+    """
+    Reduces each row of the (trials x dice) matrix rolls to the value of
+    metric, sorting rolls in place if any dice are dropped.  Returns an int64
+    array.
+    Necessary for: sample_joint()
+    """
+    if metric == "Dropped sum":
+        rolls.sort(axis=1)
+        num_drops = config["num_drops"]
+        if config["mode_drop"] == "Drop lowest":
+            dropped = rolls[:, :num_drops]
+        else:
+            dropped = rolls[:, rolls.shape[1] - num_drops :]
+        return dropped.sum(axis=1, dtype=np.int64)
+    metric_config = sim_backend.canonical_config(dict(config, mode=metric))
+    return sim_backend.reduce_rolls(metric_config, rolls).astype(np.int64)
+
+
+def trim_result(joint):
+    """
+    Returns JointResult joint with rows and columns of the histogram that
+    hold nothing cut off its edges; metric bounds are often loose.
+    """
+    rows = np.flatnonzero(joint.counts.any(axis=1))
+    cols = np.flatnonzero(joint.counts.any(axis=0))
+    counts = joint.counts[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+    mins = (joint.min_x + rows[0], joint.min_y + cols[0])
+    trimmed = JointResult(joint.config, joint.metrics, mins, counts, joint.num_trials)
+    trimmed.metadata = joint.metadata
+    return trimmed
+
+
+def sample_joint(config, metrics, num_trials, rng=None):
+    """
+    Plain Monte Carlo run of num_trials trials for the pool in config,
+    tallying the pair of metrics of every trial into one JointResult.  Each
+    chunk's pairs are combined into one flat index, x * (y range) + y, and
+    counted with a single bincount, so memory is bounded by the product of
+    the two metrics' ranges.  Raises ValueError if that product would take
+    more than SAMPLE_MEMORY_CAP bytes.
+    Requires: joint_config(), metric_bounds(), metric_values(), trim_result()
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    config = joint_config(config, metrics)
+    (min_x, max_x), (min_y, max_y) = [metric_bounds(config, m) for m in metrics]
+    shape = (max_x - min_x + 1, max_y - min_y + 1)
+    if shape[0] * shape[1] * 8 > cfg.SAMPLE_MEMORY_CAP:
+        raise ValueError("Joint distribution is too large to tally")
+
+    counts = np.zeros(shape[0] * shape[1], dtype=np.int64)
+    buffers = sim_backend.RollBuffers(config, num_trials)
+    for _, size in buffers.chunks(num_trials):
+        rolls = buffers.roll_dice(buffers.draw_uniforms(rng, size), rng)
+        x_values = metric_values(config, metrics[0], rolls)
+        y_values = metric_values(config, metrics[1], rolls)
+        x_values -= min_x
+        x_values *= shape[1]
+        x_values += y_values - min_y
+        counts += np.bincount(x_values, minlength=len(counts))
+
+    joint = JointResult(
+        config, metrics, (min_x, min_y), counts.reshape(shape), num_trials
+    )
+    joint.metadata["engine"] = "Monte Carlo"
+    return trim_result(joint)
+
+
+def has_exact_joint(config, metrics):
+    """
+    Returns True if the joint distribution of metrics for the pool in config
+    can be computed exactly: the sum against the successes, when no dice are
+    dropped, both of which every die adds to independently.
+    """
+    return config["num_drops"] == 0 and sorted(metrics) == ["Successes", "Sum"]
+
+
+def exact_joint(config, metrics):
+    """
+    Computes the exact joint distribution of the sum and the successes of
+    the pool in config, for which has_exact_joint() holds, as a JointResult.
+    Every die's joint pmf of (value, success) is two rows, its values that
+    fail and succeed; dice are added one at a time by 2-D convolution, one
+    1-D convolution per pair of rows.
+    Requires: joint_config(), sim_exact.die_value_pmf(), trim_result()
+    """
+    config = joint_config(config, metrics)
+    threshold = config["success_threshold"]
+    # joint[s]: pmf of the sum of the dice so far with s successes, from offset
+    joint = np.ones((1, 1))
+    offset = 0
+    for die_type, die_amt in config["dice"].items():
+        die_offset, pmf = sim_exact.die_value_pmf(die_type, config)
+        values = np.arange(die_offset, die_offset + len(pmf))
+        die_rows = [
+            np.where(values < threshold, pmf, 0),
+            np.where(values >= threshold, pmf, 0),
+        ]
+        for _ in range(die_amt):
+            combined = np.zeros((joint.shape[0] + 1, joint.shape[1] + len(pmf) - 1))
+            for s, row in enumerate(joint):
+                for success, die_row in enumerate(die_rows):
+                    combined[s + success] += np.convolve(row, die_row)
+            joint = combined
+            offset += die_offset
+
+    # Rows are successes; transposed to (sum, successes), then as asked
+    counts = joint.T
+    mins = (offset, 0)
+    if metrics[0] == "Successes":
+        counts = joint
+        mins = (0, offset)
+    result = JointResult(config, list(metrics), mins, counts)
+    result.metadata["engine"] = "Exact"
+    return trim_result(result)
+
+
+class Joint:
+    # Metrics on the x and y axes of the joint distribution
+    #  available metrics are those in METRICS
+    x_metric = "Sum"
+    y_metric = "Successes"
+
+    # JointResult of the last joint run
+    result = None
+
+    # Seed the random number generator of the last joint run was created
+    #  with, if created here rather than passed in
+    seed = None
+
+    @classmethod
+    def run(cls, num_trials, rng=None):
+        """
+        Evaluates the joint distribution of the x and y metrics for the
+        Simulator's current pool: exactly where has_exact_joint() allows,
+        by sampling num_trials trials otherwise.  If no rng is passed in, one
+        is created from Simulator's RNG settings.
+        Raises ValueError if the metrics are the same, the dropped sum is
+        asked for without drops, or the histogram would be too large.
+        Requires: joint_config(), has_exact_joint(), exact_joint(),
+                  sample_joint()
+        """
+        metrics = [cls.x_metric, cls.y_metric]
+        config = joint_config(sim.get_config(), metrics)
+        if metrics[0] == metrics[1]:
+            raise ValueError("Pick two different metrics")
+        if "Dropped sum" in metrics and config["num_drops"] == 0:
+            raise ValueError("No dice are dropped to sum")
+
+        cls.seed = None
+        if has_exact_joint(config, metrics):
+            cls.result = exact_joint(config, metrics)
+            return
+        if rng is None:
+            rng, cls.seed = sim.new_rng()
+        cls.result = sample_joint(config, metrics, num_trials, rng)
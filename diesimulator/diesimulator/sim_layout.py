@@ -4,6 +4,9 @@ import PySimpleGUI as sg
 
 from . import sim_config as cfg
 from . import sim_backend
+from . import sim_joint
+from . import sim_sweep
+from . import sim_tail
 
 sim = sim_backend.Simulator
 
@@ -178,7 +181,10 @@ dice_frm = sg.Frame(
 man_texthint = sg.Text(
     text="e.g. 1d2+3d4",
     pad=(5, (0, 2)),
-    tooltip="For example, to roll four D6s and five D10s,\n" "type 4d6+5d10",
+    tooltip="For example, to roll four D6s and five D10s,\n"
+    "type 4d6+5d10.  Add a ! after a die, e.g. 4d6!, to make it explode.\n"
+    "Fudge dice are 4dF; write custom faces in braces, e.g. 2d{2,2,3,3,4,6},\n"
+    "and weight a face with a colon, e.g. 1d{1,2,3,4,5,6:3} for a loaded 6.",
 )
 
 man_input = sg.Input(size=17, key="-MAN_INPUT-", enable_events=True)
@@ -253,6 +259,26 @@ mode_success = sg.Radio(
     tooltip="Counts number of successes from a given dice roll.",
 )
 
+mode_highest = sg.Radio(
+    text="Highest",
+    group_id=1,
+    enable_events=True,
+    pad=(5, 0),
+    circle_color="white",
+    key="-MODE_HIGHEST-",
+    tooltip="Takes the highest die kept from a given dice roll.",
+)
+
+mode_lowest = sg.Radio(
+    text="Lowest",
+    group_id=1,
+    enable_events=True,
+    pad=(5, 0),
+    circle_color="white",
+    key="-MODE_LOWEST-",
+    tooltip="Takes the lowest die kept from a given dice roll.",
+)
+
 mode_success_threshold_text = sg.Text(
     "Threshold:",
     pad=((5, 0), 0),
@@ -271,6 +297,8 @@ mode_success_threshold = sg.Spin(
 mode_layout = [
     [mode_sum],
     [mode_success],
+    [mode_highest],
+    [mode_lowest],
     [mode_success_threshold_text],
     [mode_success_threshold],
 ]
@@ -279,6 +307,102 @@ mode_frm = sg.Frame("Mode", mode_layout)
 
 ####    MODE FRAME STUFFS ENDS HERE
 
+####    ####    ####    ####
+####    EXPLODE FRAME STUFFS STARTS HERE
+explode_select = sg.Listbox(
+    [],
+    select_mode=sg.LISTBOX_SELECT_MODE_MULTIPLE,
+    size=(6, 3),
+    key="-EXPLODE_SELECT-",
+    enable_events=True,
+    no_scrollbar=True,
+    tooltip="Selected die types roll again and add whenever they land on\n"
+    "their highest face.  Typing e.g. 3d6! in manual control also works.",
+)
+
+explode_depth = sg.Spin(
+    list(range(1, cfg.EXPLODE_MAX_DEPTH + 1)),
+    initial_value=sim.explode_depth,
+    key="-EXPLODE_DEPTH-",
+    enable_events=True,
+    size=2,
+    tooltip="Maximum number of times a single die may explode.",
+)
+
+explode_layout = [
+    [explode_select],
+    [sg.Text("Max:", pad=((5, 0), 0)), explode_depth],
+]
+
+explode_frm = sg.Frame("Explode", explode_layout)
+
+####    EXPLODE FRAME STUFFS ENDS HERE
+
+####    ####    ####    ####
+####    DISPLAY FRAME STUFFS STARTS HERE
+display_cutoff = sg.Combo(
+    [10, 30, 120, 1000, 10000, 100000],
+    sim.cutoff_sensitivity,
+    size=6,
+    key="-DISPLAY_CUTOFF-",
+    readonly=True,
+    enable_events=True,
+    pad=(5, (0, 5)),
+    tooltip="Outcomes less likely than the most likely outcome by this factor\n"
+    "are left off the plot.  Takes effect immediately, without re-running.",
+)
+
+display_plot = sg.Combo(
+    ["Probability", "CDF", "Survival"],
+    "Probability",
+    size=10,
+    key="-DISPLAY_PLOT-",
+    readonly=True,
+    enable_events=True,
+    pad=(5, (0, 5)),
+    tooltip="Plot the probability of each outcome, the cumulative probability\n"
+    "of rolling at most it (CDF), or the probability of rolling at least it\n"
+    "(Survival).  Takes effect immediately, without re-running.",
+)
+
+display_layout = [
+    [sg.Text("Hide below 1/", pad=((5, 0), (0, 5))), display_cutoff],
+    [sg.Text("Plot:", pad=((5, 0), (0, 5))), display_plot],
+]
+
+display_frm = sg.Frame("Display", display_layout)
+
+####    DISPLAY FRAME STUFFS ENDS HERE
+
+####    ####    ####    ####
+####    SESSION FRAME STUFFS STARTS HERE
+session_recent = sg.Combo(
+    [],
+    size=18,
+    key="-SESSION_RECENT-",
+    readonly=True,
+    enable_events=True,
+    pad=(5, (0, 5)),
+    tooltip="Runs of this and the last session, most recent first.\n"
+    "Picking one restores its settings and plot, without re-running.",
+)
+
+session_save = sg.Button(
+    "Save",
+    key="-SESSION_SAVE-",
+    pad=(5, (0, 5)),
+    tooltip="Save settings and recent runs now; they are also saved on exit.",
+)
+
+session_layout = [
+    [sg.Text("Recent:", pad=((5, 0), (0, 5))), session_save],
+    [session_recent],
+]
+
+session_frm = sg.Frame("Session", session_layout)
+
+####    SESSION FRAME STUFFS ENDS HERE
+
 ####    ####    ####    ####
 ####    REROLL FRAME STUFFS STARTS HERE
 reroll_select = sg.Checkbox(
@@ -289,8 +413,10 @@ reroll_select = sg.Checkbox(
     enable_events=True,
 )
 
+# Spinner values are backed by numeric bounds set at runtime (see
+#  set_spin_bounds() in element ops), so only the initial value is listed here
 reroll_threshold = sg.Spin(
-    list(range(0, 20)),
+    [0],
     0,
     disabled=True,
     key="-REROLL_THRESHOLD-",
@@ -373,6 +499,74 @@ num_trials_CI = sg.Combo(
     pad=((5, 5), 5),
 )
 
+num_trials_sampler = sg.Combo(
+    ["Plain", "Antithetic", "Stratified", "Sobol"],
+    sim.sampler,
+    size=10,
+    key="-NUM_TRIALS_SAMPLER-",
+    readonly=True,
+    enable_events=True,
+    pad=((5, 5), (0, 5)),
+    tooltip="Sampling scheme.  Antithetic, stratified and Sobol (quasi-Monte Carlo)\n"
+    "sampling reach the same precision as plain sampling with fewer trials;\n"
+    "after a run, the MoE shown is the one measured from the run itself.",
+)
+
+num_trials_error_bars = sg.Checkbox(
+    "Error bars",
+    key="-NUM_TRIALS_ERROR_BARS-",
+    checkbox_color="white",
+    enable_events=True,
+    pad=((5, 0), (0, 5)),
+    tooltip="Draw the confidence interval of each data bar on the plot.\n"
+    "Rare outcomes have much tighter intervals than the MoE above.",
+)
+
+num_trials_CI_method = sg.Combo(
+    ["Wilson", "Clopper-Pearson"],
+    "Wilson",
+    size=14,
+    key="-NUM_TRIALS_CI_METHOD-",
+    readonly=True,
+    enable_events=True,
+    pad=((5, 5), (0, 5)),
+    tooltip="Method used to compute each data bar's confidence interval.",
+)
+
+num_trials_approx = sg.Checkbox(
+    "Approximate",
+    default=sim.approximate,
+    key="-NUM_TRIALS_APPROX-",
+    checkbox_color="white",
+    enable_events=True,
+    pad=((5, 0), (0, 5)),
+    tooltip="Approximate sums and success counts analytically instead of\n"
+    "running the simulation; instant even for huge pools, and the plot\n"
+    "title states a bound on the error.",
+)
+
+num_trials_rng = sg.Combo(
+    ["stdlib", "PCG64", "Philox", "SFC64"],
+    sim.rng_backend,
+    size=7,
+    key="-NUM_TRIALS_RNG-",
+    readonly=True,
+    enable_events=True,
+    pad=((5, 5), (0, 5)),
+    tooltip="Random number generator used to run simulations.",
+)
+
+num_trials_seed = sg.Input(
+    size=10,
+    key="-NUM_TRIALS_SEED-",
+    default_text="" if sim.seed is None else sim.seed,
+    pad=((5, 5), (0, 5)),
+    enable_events=True,
+    tooltip="Seed for the random number generator.  Leave blank for a new\n"
+    "seed every run; the seed used is shown in the plot title, and entering\n"
+    "it here (with the same generator) reproduces that run exactly.",
+)
+
 num_trials_layout = [
     [sg.Text("Number of trials:", pad=(5, 0)), num_trials_input, num_trials_commit],
     [
@@ -381,12 +575,215 @@ num_trials_layout = [
         num_trials_CI_text,
         num_trials_CI,
     ],
+    [
+        sg.Text("Sampler:", pad=((5, 0), (0, 5))),
+        num_trials_sampler,
+        num_trials_approx,
+    ],
+    [
+        sg.Text("RNG:", pad=((5, 0), (0, 5))),
+        num_trials_rng,
+        sg.Text("Seed:", pad=((0, 0), (0, 5))),
+        num_trials_seed,
+    ],
+    [num_trials_error_bars, num_trials_CI_method],
 ]
 
 trials_frm = sg.Frame("Trials", num_trials_layout)
 
 ####    TRIALS FRAME STUFFS ENDS HERE
 
+####    ####    ####    ####
+####    COMPARISON FRAME STUFFS STARTS HERE
+compare_add = sg.Button(
+    "Add Pool",
+    key="-COMPARE_ADD-",
+    pad=(5, (3, 5)),
+    tooltip="Add the current dice pool and its settings to the comparison.",
+)
+
+compare_clear = sg.Button("Clear", key="-COMPARE_CLEAR-", pad=(5, (3, 5)))
+
+compare_run = sg.Button(
+    "Compare",
+    key="-COMPARE_RUN-",
+    pad=(5, (3, 5)),
+    tooltip="Evaluate all pools in the comparison and overlay their results.",
+)
+
+compare_count = sg.Text("0 pools", size=7, key="-COMPARE_COUNT-", pad=(5, 0))
+
+compare_style = sg.Combo(
+    ["Step", "CDF"],
+    "Step",
+    size=5,
+    key="-COMPARE_STYLE-",
+    readonly=True,
+    enable_events=True,
+    pad=(5, 0),
+)
+
+compare_layout = [
+    [compare_count, sg.Text("Plot:", pad=(0, 0)), compare_style],
+    [compare_add, compare_clear, compare_run],
+]
+
+compare_frm = sg.Frame("Comparison", compare_layout)
+
+####    COMPARISON FRAME STUFFS ENDS HERE
+
+####    ####    ####    ####
+####    CONTEST FRAME STUFFS STARTS HERE
+contest_attacker = sg.Button(
+    "Attacker",
+    key="-CONTEST_ATTACKER-",
+    pad=(5, (3, 5)),
+    tooltip="Use the current dice pool and its settings as the attacking side.",
+)
+
+contest_defender = sg.Button(
+    "Defender",
+    key="-CONTEST_DEFENDER-",
+    pad=(5, (3, 5)),
+    tooltip="Use the current dice pool and its settings as the defending side.",
+)
+
+contest_run = sg.Button(
+    "Contest",
+    key="-CONTEST_RUN-",
+    pad=(5, (3, 5)),
+    tooltip="Compute chances of the attacker beating, tying and losing to\n"
+    "the defender, and the distribution of the margin of victory.",
+)
+
+contest_sides = sg.Text(
+    "A: (none)\nD: (none)", size=(28, 2), key="-CONTEST_SIDES-", pad=(5, 0)
+)
+
+contest_layout = [
+    [contest_sides],
+    [contest_attacker, contest_defender, contest_run],
+]
+
+contest_frm = sg.Frame("Opposed Roll", contest_layout)
+
+####    CONTEST FRAME STUFFS ENDS HERE
+
+####    ####    ####    ####
+####    JOINT FRAME STUFFS STARTS HERE
+joint_x = sg.Combo(
+    sim_joint.METRICS,
+    sim_joint.Joint.x_metric,
+    size=11,
+    key="-JOINT_X-",
+    readonly=True,
+    enable_events=True,
+    pad=(5, 0),
+)
+
+joint_y = sg.Combo(
+    sim_joint.METRICS,
+    sim_joint.Joint.y_metric,
+    size=11,
+    key="-JOINT_Y-",
+    readonly=True,
+    enable_events=True,
+    pad=(5, 0),
+)
+
+joint_run = sg.Button(
+    "Joint",
+    key="-JOINT_RUN-",
+    pad=(5, (3, 5)),
+    tooltip="Plot how two metrics of the current dice pool vary together,\n"
+    "as a heatmap of the chance of every pair of values.",
+)
+
+joint_layout = [
+    [sg.Text("X:", pad=((5, 0), 0)), joint_x, sg.Text("Y:", pad=(0, 0)), joint_y],
+    [joint_run],
+]
+
+joint_frm = sg.Frame("Joint Distribution", joint_layout)
+
+####    JOINT FRAME STUFFS ENDS HERE
+
+####    ####    ####    ####
+####    SWEEP FRAME STUFFS STARTS HERE
+sweep_param = sg.Combo(
+    sim_sweep.PARAMETERS,
+    sim_sweep.Sweep.parameter,
+    size=9,
+    key="-SWEEP_PARAM-",
+    readonly=True,
+    enable_events=True,
+    pad=(5, 0),
+)
+
+sweep_style = sg.Combo(
+    ["Heatmap", "Small multiples"],
+    sim_sweep.Sweep.plot_style,
+    size=13,
+    key="-SWEEP_STYLE-",
+    readonly=True,
+    enable_events=True,
+    pad=(5, 0),
+)
+
+sweep_run = sg.Button(
+    "Sweep",
+    key="-SWEEP_RUN-",
+    pad=(5, (3, 5)),
+    tooltip="Evaluate the current dice pool at every success threshold or\n"
+    "number of drops at once, from one set of rolls.",
+)
+
+sweep_layout = [
+    [sweep_param, sweep_style],
+    [sweep_run],
+]
+
+sweep_frm = sg.Frame("Sweep", sweep_layout)
+
+####    SWEEP FRAME STUFFS ENDS HERE
+
+####    ####    ####    ####
+####    TAIL FRAME STUFFS STARTS HERE
+tail_side = sg.Combo(
+    sim_tail.SIDES,
+    sim_tail.Tail.side,
+    size=8,
+    key="-TAIL_SIDE-",
+    readonly=True,
+    enable_events=True,
+    pad=(5, 0),
+)
+
+tail_target = sg.Input(
+    size=7,
+    key="-TAIL_TARGET-",
+    pad=(5, 0),
+    enable_events=True,
+    tooltip="Outcome the tail starts from.",
+)
+
+tail_run = sg.Button(
+    "Estimate Tail",
+    key="-TAIL_RUN-",
+    pad=(5, (3, 5)),
+    tooltip="Estimate the chance of outcomes too rare for a plain simulation\n"
+    "to see, by rolling dice weighted towards the tail.",
+)
+
+tail_layout = [
+    [tail_side, tail_target],
+    [tail_run],
+]
+
+tail_frm = sg.Frame("Rare Outcomes", tail_layout)
+
+####    TAIL FRAME STUFFS ENDS HERE
+
 ####    ####    ####    ####
 ####    CREDITS FRAME STUFFS STARTS HERE
 credits_layout = [
@@ -401,11 +798,45 @@ credits_frm = sg.Frame("About", credits_layout)
 ####    ####    ####    ####
 ####    (LEFT) SUBCOLUMNS STUFFS STARTS HERE
 col_L1 = sg.Column(
-    [[reroll_frm, drop_frm], [trials_frm], [credits_frm]], element_justification="left"
+    [
+        [reroll_frm, drop_frm],
+        [trials_frm],
+        [compare_frm],
+        [contest_frm],
+        [joint_frm],
+        [sweep_frm],
+        [tail_frm],
+        [credits_frm],
+    ],
+    element_justification="left",
 )
 
 btn_engage = sg.Button(" Run Simulation ", size=12, key="-ENGAGE-", pad=(5, (10, 2)))
 
+engage_plan = sg.Text(
+    "",
+    size=(20, 1),
+    justification="center",
+    key="-ENGAGE_PLAN-",
+    pad=(5, 0),
+    tooltip=(
+        "Engine the simulation will run on, and a rough estimate of its run"
+        " time, which may be off by a factor of two or three."
+    ),
+)
+
+engage_outdated = sg.Text(
+    "",
+    size=(24, 1),
+    justification="center",
+    key="-ENGAGE_OUTDATED-",
+    pad=(5, 0),
+    tooltip=(
+        "The plot is of other settings than the current ones; only plain runs"
+        " tally every mode and success threshold at once."
+    ),
+)
+
 btn_save_output = sg.Button(
     " Save Output... ", size=12, key="-SAVE_OUTPUT-", pad=(5, (5, 5))
 )
@@ -413,7 +844,17 @@ btn_save_output = sg.Button(
 btn_credits = sg.Button(" Credits ", size=12, key="-CREDITS-", pad=(5, (27, 5)))
 
 col_L2 = sg.Column(
-    [[mode_frm], [btn_engage], [btn_save_output], [btn_credits]],
+    [
+        [mode_frm],
+        [explode_frm],
+        [display_frm],
+        [session_frm],
+        [btn_engage],
+        [engage_plan],
+        [engage_outdated],
+        [btn_save_output],
+        [btn_credits],
+    ],
     element_justification="center",
 )
 
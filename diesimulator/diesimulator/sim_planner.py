@@ -0,0 +1,304 @@
+# Engine planner.  Estimates how long each engine would take to evaluate a
+#  dice pool and picks the cheapest, so callers needn't know which is fastest.
+
+import math
+import time
+
+import numpy as np
+
+from . import sim_config as cfg
+from . import sim_backend
+from . import sim_exact
+from . import sim_tables
+
+SAMPLERS = ["Plain", "Antithetic", "Stratified", "Sobol"]
+
+
+def best_time(task, repeats=3):
+    """
+    Returns the shortest of repeats timings of calling task, in seconds.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        task()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def fit_costs(timings):
+    """
+    Returns a tuple (fixed cost, unit cost) that times a workload of count
+    runs of units units of work, as seconds = fixed * count + unit * units,
+    solved from two timings given as (seconds, count, units) tuples, the
+    second of more units per count.  Neither cost is negative, whatever the
+    noise of the timings: the unit cost is at least half of what the second
+    timing spent per unit.
+    Necessary for: Planner.calibrate()
+    """
+    (seconds_a, count_a, units_a), (seconds_b, count_b, units_b) = timings
+    unit_cost = seconds_b / count_b - seconds_a / count_a
+    unit_cost /= units_b / count_b - units_a / count_a
+    unit_cost = max(unit_cost, seconds_b / units_b / 2)
+    fixed_cost = max(0, seconds_a - unit_cost * units_a) / count_a
+    return fixed_cost, unit_cost
+
+
+def sample_units(config, num_trials):
+    """
+    Returns the work of sampling num_trials trials of the pool in config, in
+    die rolls; exploding dice count double for the scan for explosions.
+    """
+    rolls = sum(config["dice"].values())
+    rolls += sum(config["dice"][die_type] for die_type in config["explode"])
+    return num_trials * rolls
+
+
+def sort_units(config, num_trials):
+    """
+    Returns the work of sorting the rolls of num_trials trials of the pool
+    in config to drop dice, in comparisons; none if no dice are dropped.
+    """
+    num_dice = sum(config["dice"].values())
+    if config["num_drops"] == 0:
+        return 0
+    return num_trials * num_dice * max(1, np.log2(num_dice))
+
+
+def convolution_units(config):
+    """
+    Returns the work of convolving the pool in config, in multiply-adds of
+    np.convolve.  Building a group of dice by binary exponentiation is
+    dominated by its last squaring; groups already in the ConvolutionCache
+    only cost their convolution into the pool.
+    """
+    units = 0
+    length = 1
+    for die_type, die_amt in config["dice"].items():
+        _, pmf = sim_exact.die_pmf(die_type, config)
+        group_length = die_amt * (len(pmf) - 1) + 1
+        key = sim_exact.die_group_key(die_type, die_amt, config)
+        if key not in sim_exact.ConvolutionCache.entries:
+            units += (group_length // 2 + 1) ** 2
+        units += length * group_length
+        length += group_length - 1
+    return units
+
+
+def state_units(config):
+    """
+    Returns the work of the state space of the pool in config, in entries of
+    the state table updated: every die moves every state once per value.
+    The states are multisets of the values of the dice added so far, at
+    most num_drops of them, so they are few for the first dice and for the
+    first die types; counting every die against the full state space
+    overestimates pools of many dice or several types many times over.
+    """
+    num_drops = config["num_drops"]
+    length = sim_exact.drop_state_space(config)[2]
+    seen = set()
+    added = 0
+    units = 0
+    for die_type, die_amt in config["dice"].items():
+        offset, pmf = sim_exact.die_value_pmf(die_type, config)
+        values = set((offset + np.flatnonzero(pmf)).tolist())
+        for _ in range(die_amt):
+            held = min(added, num_drops)
+            num_states = math.comb(len(seen) + held - 1, held) if seen else 1
+            units += num_states * len(values) * length
+            seen |= values
+            added += 1
+    return units
+
+
+def order_units(config):
+    """
+    Returns the work of the order statistic of the pool in config, in
+    multiply-adds: every die type's binomial is convolved into the count of
+    dice at or below each value.
+    """
+    low, high = sim_backend.die_value_range(config)
+    num_dice = sum(config["dice"].values())
+    return (high - low + 1) * (num_dice + 1) ** 2
+
+
+def identical_shifts(config):
+    """
+    Returns the number of sum arrays the state space of the pool in config,
+    which holds dice of one type, shifts: every pair of states a and a + c
+    is visited once per die value.
+    """
+    (die_type, num_dice), = config["dice"].items()
+    _, value_pmf = sim_exact.die_value_pmf(die_type, config)
+    pairs = (num_dice + 1) * (num_dice + 2) // 2
+    return int(np.count_nonzero(value_pmf)) * pairs
+
+
+def identical_units(config):
+    """
+    Returns the work of the state space of the pool in config, which holds
+    dice of one type, in sum array entries shifted.
+    Requires: identical_shifts()
+    """
+    length = sim_backend.outcome_bounds(config)[1] + 1
+    return identical_shifts(config) * length
+
+
+class Planner:
+    # Seconds per unit of work of each engine on this machine, measured by
+    #  calibrate(): per trial and per die roll of each sampler, per
+    #  comparison sorting rolls to drop dice, per multiply-add of a
+    #  convolution, per state table entry of the drop state space, and per
+    #  sum array and per sum entry shifted by the state space of dice of one
+    #  type
+    trial_cost = None
+    sample_cost = None
+    sort_cost = None
+    convolve_cost = None
+    state_cost = None
+    shift_cost = None
+    identical_cost = None
+
+    @classmethod
+    def calibrate(cls):
+        """
+        Times workloads of each engine on this machine and stores the cost
+        per unit of work, which later estimates are scaled by.  Each sampler
+        is timed on a pool of few dice and one of many, which separates what
+        a trial costs (drawing its outcome, tallying it) from what each of
+        its dice does; a single pool of either size mistakes one for the
+        other and misjudges pools of the other size several times over.
+        The state spaces are timed on pools of mid-sized state tables, since
+        small ones are dominated by the cost of setting them up.
+        Requires: fit_costs(), sample_units(), sort_units(),
+                  convolution_units(), state_units(), identical_shifts(),
+                  identical_units()
+        """
+        num_trials = cfg.PLANNER_CALIBRATION_TRIALS
+        # The pool of many dice rolls as many dice on a quarter of the trials
+        workloads = [
+            (sim_backend.canonical_config({"dice": {6: 3}}), num_trials),
+            (sim_backend.canonical_config({"dice": {6: 30}}), num_trials // 4),
+        ]
+        rng = np.random.default_rng(0)
+        runs = {
+            sampler: lambda config, trials, sampler=sampler: sim_backend.sample_with(
+                config, trials, sampler, rng
+            )
+            for sampler in SAMPLERS
+        }
+        # Plain runs of the Simulator tally every metric of the pool at once
+        runs["Metrics"] = sim_backend.sample_metrics_parts
+        cls.trial_cost = {}
+        cls.sample_cost = {}
+        for sampler, run in runs.items():
+            timings = [
+                (
+                    best_time(lambda: run(config, trials)),
+                    trials,
+                    sample_units(config, trials),
+                )
+                for config, trials in workloads
+            ]
+            cls.trial_cost[sampler], cls.sample_cost[sampler] = fit_costs(timings)
+
+        rolls = rng.integers(1, 7, (num_trials, 8))
+        seconds = best_time(lambda: np.sort(rolls, axis=1))
+        cls.sort_cost = seconds / (num_trials * 8 * 3)
+
+        pmf = np.full(2000, 1 / 2000)
+        seconds = best_time(lambda: np.convolve(pmf, pmf))
+        cls.convolve_cost = seconds / pmf.size**2
+
+        drop_config = sim_backend.canonical_config(
+            {"dice": {6: 10, 8: 5}, "mode_drop": "Drop lowest", "num_drops": 3}
+        )
+        seconds = best_time(lambda: sim_exact.drop_distribution(drop_config))
+        cls.state_cost = seconds / state_units(drop_config)
+
+        # As with the samplers, state spaces of short sums and of long sums
+        #  separate what shifting a sum array costs from what each of its
+        #  entries does
+        short_config, long_config = [
+            sim_backend.canonical_config(
+                {"dice": dice, "mode_drop": "Drop lowest", "num_drops": 3}
+            )
+            for dice in [{8: 20}, {50: 20}]
+        ]
+        timings = [
+            (
+                best_time(lambda: sim_exact.identical_drop_distribution(config)),
+                identical_shifts(config),
+                identical_units(config),
+            )
+            for config in [short_config, long_config]
+        ]
+        cls.shift_cost, cls.identical_cost = fit_costs(timings)
+
+    @classmethod
+    def plan(cls, config, num_trials, sampler="Plain", metrics=False):
+        """
+        Estimates the run time of each engine for the pool in config, the
+        Monte Carlo engine running num_trials trials with sampler (tallying
+        every metric, as Simulator.perform_sim() does for plain runs of dice
+        with few enough values, if metrics is set), and returns a dict of
+        the cheapest "engine" ('Exact' or 'Monte Carlo'), its "estimate" in
+        seconds, and the "exact_estimate" and "sample_estimate" of both;
+        exact_estimate is None when the exact
+        state space would not fit in PLANNER_EXACT_MAX_BYTES, and 0 when the
+        pool is in the precomputed tables.
+        Ties go to the exact engine, which is free of sampling error.
+        Estimates are rough: on pools unlike those calibrate() times they
+        can be off by a factor of two or three either way.
+        Calibrates on first use.
+        Requires: calibrate(), sim_tables.DistributionTables
+        """
+        if cls.sample_cost is None:
+            cls.calibrate()
+
+        low, high = sim_backend.die_value_range(config)
+        costs = sampler
+        if metrics and sampler == "Plain" and high - low < cfg.METRICS_MAX_VALUES:
+            costs = "Metrics"
+        sample_estimate = cls.trial_cost[costs] * num_trials
+        sample_estimate += cls.sample_cost[costs] * sample_units(config, num_trials)
+        sample_estimate += cls.sort_cost * sort_units(config, num_trials)
+        sample_estimate /= sim_backend.parallel_workers(sampler, num_trials)
+
+        exact_estimate = None
+        if sim_tables.DistributionTables.contains(config):
+            exact_estimate = 0.0
+        elif config["mode"] in ("Highest", "Lowest"):
+            exact_estimate = cls.convolve_cost * order_units(config)
+        elif sim_exact.has_exact_form(config):
+            exact_estimate = cls.convolve_cost * convolution_units(config)
+        elif len(config["dice"]) == 1:
+            exact_estimate = cls.shift_cost * identical_shifts(config)
+            exact_estimate += cls.identical_cost * identical_units(config)
+        else:
+            num_states, _, length = sim_exact.drop_state_space(config)
+            if num_states * length * 8 <= cfg.PLANNER_EXACT_MAX_BYTES:
+                exact_estimate = cls.state_cost * state_units(config)
+
+        sample_estimate = float(sample_estimate)
+        if exact_estimate is not None and exact_estimate <= sample_estimate:
+            engine, estimate = "Exact", exact_estimate
+        else:
+            engine, estimate = "Monte Carlo", sample_estimate
+        return {
+            "engine": engine,
+            "estimate": estimate,
+            "exact_estimate": exact_estimate,
+            "sample_estimate": sample_estimate,
+        }
+
+    @classmethod
+    def prefers_exact(cls, config, num_trials, sampler="Plain", metrics=False):
+        """
+        Returns True if the exact engine is the cheapest for the pool in
+        config against num_trials trials of sampler, tallying every metric
+        if metrics is set.
+        Requires: plan()
+        """
+        plan = cls.plan(config, num_trials, sampler, metrics)
+        return plan["engine"] == "Exact"
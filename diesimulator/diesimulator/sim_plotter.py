@@ -1,7 +1,12 @@
 # Plotter.  Handles everything graph related - labels, axes...
 #  also generates plot figure.
 
+import hashlib
+import io
+import json
 import math
+from collections import OrderedDict
+
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
@@ -11,12 +16,93 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 from . import sim_config as cfg
 from . import sim_backend
+from . import sim_exact
 
-matplotlib.use("TkAgg")
+try:
+    matplotlib.use("TkAgg")
+except ImportError:
+    # No display (e.g. the tests on a headless machine); figures
+    #  and statistics still work, they just can't be drawn on the GUI canvas
+    pass
 
 sim = sim_backend.Simulator
 
 
+class FigureCache:
+    # Rendered plot images, as (height x width x 4) RGBA uint8 arrays keyed by
+    #  Plotter.figure_key(), ordered from least to most recently used
+    entries = OrderedDict()
+
+    # Memory held by the cached images, and the most it may hold
+    size_bytes = 0
+    max_bytes = cfg.FIGURE_CACHE_MAX_BYTES
+
+    # Lookup statistics since the cache was last cleared
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    @classmethod
+    def get(cls, key):
+        """
+        Returns the cached image for key, marking it as most recently used,
+        or None if key is not cached.
+        """
+        image = cls.entries.get(key)
+        if image is None:
+            cls.misses += 1
+            return None
+        cls.hits += 1
+        cls.entries.move_to_end(key)
+        return image
+
+    @classmethod
+    def put(cls, key, image):
+        """
+        Caches image under key, then evicts least recently used images until
+        the cache is back within its memory bound.  The image is made
+        read-only, as it is shared by every plot drawn from it.
+        """
+        if key in cls.entries:
+            return
+        image.setflags(write=False)
+        cls.entries[key] = image
+        cls.size_bytes += image.nbytes
+
+        # Never evicts the image just added, even if it alone is over the bound
+        while cls.size_bytes > cls.max_bytes and len(cls.entries) > 1:
+            _, evicted = cls.entries.popitem(last=False)
+            cls.size_bytes -= evicted.nbytes
+            cls.evictions += 1
+
+    @classmethod
+    def clear(cls):
+        """
+        Empties the cache and resets its statistics.
+        """
+        cls.entries.clear()
+        cls.size_bytes = 0
+        cls.hits = 0
+        cls.misses = 0
+        cls.evictions = 0
+
+    @classmethod
+    def stats(cls):
+        """
+        Returns a dict of the cache's hit/miss statistics and memory use.
+        """
+        lookups = cls.hits + cls.misses
+        return {
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "hit_rate": cls.hits / lookups if lookups else 0,
+            "evictions": cls.evictions,
+            "entries": len(cls.entries),
+            "size_bytes": cls.size_bytes,
+            "max_bytes": cls.max_bytes,
+        }
+
+
 class Plotter:
     # Sorted x and y lists to generate histogram
     x_sorted = []
@@ -42,6 +128,22 @@ class Plotter:
     #  values reported at 25, 50, and 75 percent
     plt_cdf_prob_step = 25
 
+    # What the plot shows of each outcome: its probability as a bar, or as
+    #  one step curve its cumulative probability (CDF) or the chance of
+    #  rolling at least it (Survival); available {'Probability', 'CDF',
+    #  'Survival'}
+    plot_mode = "Probability"
+
+    # Cumulative probability (in percent) of each outcome in x_sorted, i.e.
+    #  p(x <= i), computed once per plot and shared by the quartiles and the
+    #  CDF and survival curves
+    cdf = np.zeros(0)
+
+    # Whether to draw per-outcome confidence intervals as error bars, and
+    #  which interval to draw; available methods {'Wilson', 'Clopper-Pearson'}
+    show_error_bars = False
+    ci_method = "Wilson"
+
     # Statistical variables - mean and standard deviation
     xbar = 0
     sx = 0
@@ -93,39 +195,42 @@ class Plotter:
         weighted_sq_sum -= xbar**2
         cls.sx = round(math.sqrt(weighted_sq_sum), cfg.ROUNDING_PREC)
 
+    @classmethod
+    def calc_cdf(cls, freq):
+        """
+        Calculates the cumulative distribution of the frequency dict, each
+        p(x <= i) in percent for i in sorted outcomes, in one vectorized pass
+        and rounds to places defined in cfg to truncate floating-point sums
+        Necessary for: calc_quartiles(), generate_cumulative_plot()
+        """
+        outcomes = sorted(freq.keys())
+        cls.cdf = np.round(
+            np.cumsum([freq[outcome] for outcome in outcomes]), cfg.ROUNDING_PREC
+        )
+
     @classmethod
     def calc_quartiles(cls, freq):
         """
         Generates a list of outcome values that correspond to the
-        location of the three quartiles (Q1, M, Q3) of the distribution
+        location of the three quartiles (Q1, M, Q3) of the distribution:
+        the first outcomes whose cumulative probability exceeds 25, 50 and 75
+        percent.  One outcome may hold several quartiles, e.g. Q1 and M of 2d2
+        Requires: calc_cdf()
         """
-
-        # List that will store cumulative distribution fcn, that is,
-        #  each p(x <= i) for i in [min outcome, max outcome]
-        #  as tuples in form (outcome, probability)
-        cdf = [(-1, 0)]
-
-        # Generate CDF
-        for outcome in sorted(freq.keys()):
-            cdf.append((outcome, round(freq[outcome] + cdf[-1][1], cfg.ROUNDING_PREC)))
+        cls.calc_cdf(freq)
+        outcomes = sorted(freq.keys())
 
         # Step size to generate CDF thresholds; for quartiles, use 25
         #  i.e. [25, 50, 75]
         step = 25
-        prob_threshold_current = step
-        # The outcomes that correspond to CDF values exceeding each step
-        #  as described above
-        new_quartiles = []
+        # Every rounded frequency is off by up to half a unit in the last
+        #  place, so cumulative values within that much per outcome of a
+        #  threshold (e.g. exactly 75) don't exceed it
+        tolerance = len(outcomes) * 10.0**-cfg.ROUNDING_PREC
+        thresholds = np.arange(step, 100, step) + tolerance
+        positions = np.searchsorted(cls.cdf, thresholds, side="right")
 
-        # Build quartiles list
-        i = 0
-        while prob_threshold_current < 100 and i < len(cdf):
-            if cdf[i][1] > prob_threshold_current:
-                new_quartiles.append(cdf[i][0])
-                prob_threshold_current += step
-            i += 1
-
-        cls.quartiles = new_quartiles
+        cls.quartiles = [outcomes[i] for i in positions if i < len(outcomes)]
 
     @classmethod
     def generate_x_axis(cls, ax):
@@ -356,41 +461,187 @@ class Plotter:
             color=color_dark
         )
 
+    @classmethod
+    def generate_error_bars(cls, ax, color_dark):
+        """
+        Draws the per-outcome confidence interval of each data bar, at the
+        Simulator's CI level, as error bars in color_dark.
+        Uses Simulator's raw result, so the intervals of the bars shown are
+        all computed in one vectorized pass over the count array.
+        """
+        result = sim.result
+        if result is None:
+            return
+
+        lower, upper = result.confidence_intervals(sim.CI_level, cls.ci_method)
+        shown = np.array(cls.x_sorted) - result.min_outcome
+        y_values = result.probabilities()[shown] * 100
+
+        ax.errorbar(
+            cls.x_sorted,
+            y_values,
+            yerr=[
+                np.maximum(y_values - lower[shown] * 100, 0),
+                np.maximum(upper[shown] * 100 - y_values, 0),
+            ],
+            fmt="none",
+            ecolor=color_dark,
+            elinewidth=1,
+            capsize=2,
+        )
+
     @staticmethod
-    def generate_title():
+    def generate_trim_note(ax, color_dark):
         """
-        Reads parameters from Simulator to dynamically generate title string
+        Notes in color_dark, in the top left corner of the plot, how much
+        probability was left out of the plot from each tail by sanitization.
+        Nothing is drawn if nothing was left out.
         """
-        mode_str = sim.mode
+        lower, upper = sim.trimmed_mass
+        if lower == 0 and upper == 0:
+            return
 
-        dice_str = sim.generate_dice_str_from_pool()
+        ax.text(
+            0.01,
+            0.98,
+            f"Not shown: {round(lower * 100, 3)}% below, "
+            f"{round(upper * 100, 3)}% above",
+            transform=ax.transAxes,
+            ha="left",
+            va="top",
+            fontsize="small",
+            color=color_dark,
+        )
+
+    @classmethod
+    def generate_cumulative_plot(cls, ax, color_dark, color_quartile):
+        """
+        Draws the CDF, or in 'Survival' plot mode the chance of rolling at
+        least each outcome, as a single step artist in color_dark, and marks
+        the quartiles on it in color_quartile.  Both curves come from the
+        cumulative array of calc_cdf(); probability trimmed off each tail by
+        sanitization is added back, so the curves still run from 0 to 100.
+        Requires: calc_cdf()
+        """
+        lower, upper = sim.trimmed_mass
+        x_values = np.array(cls.x_sorted)
+        x_steps = np.concatenate(([x_values[0] - 1], x_values, [x_values[-1] + 1]))
+        cdf = cls.cdf + lower * 100
+
+        # The CDF holds from each outcome up to the next; the chance of at
+        #  least an outcome holds from the one before up to it
+        if cls.plot_mode == "CDF":
+            y_steps = np.concatenate(([lower * 100], cdf, [cdf[-1]]))
+            where = "post"
+            ax.set_ylabel("Cumulative Probability (%)")
+        else:
+            at_least = 100 - cdf + np.array(cls.y_sorted)
+            y_steps = np.concatenate(([at_least[0]], at_least, [upper * 100]))
+            where = "pre"
+            ax.set_ylabel("Probability of at Least (%)")
+        ax.step(x_steps, y_steps, where=where, color=color_dark, linewidth=1.8)
+
+        # Quartile markers at the top of their outcome's step
+        quartile_idx = np.searchsorted(x_values, cls.quartiles)
+        quartile_y = y_steps[quartile_idx + 1]
+        ax.plot(cls.quartiles, quartile_y, "o", color=color_quartile)
+        for name, x, y in zip(["Q1", "M", "Q3"], cls.quartiles, quartile_y):
+            ax.annotate(
+                name,
+                xy=(x, y),
+                xytext=(-6, 6),
+                textcoords="offset points",
+                ha="right",
+                color=color_quartile,
+                fontweight="heavy",
+            )
+
+        # Gridlines at the quartile probabilities; room left above for notes
+        ax.set_ylim([0, 100 * cls.min_h])
+        ax.yaxis.set_major_locator(plttick.FixedLocator([0, 25, 50, 75, 100]))
+        ax.grid(axis="y", which="major", linewidth=0.7, color="0.7", linestyle="--")
+        ax.set_axisbelow(True)
+
+    @staticmethod
+    def describe_config(config):
+        """
+        Generates a string describing the pool configuration in config,
+        e.g. "Sum of 4d6, Drop lowest 1"
+        Necessary for: generate_title(), generate_comparison_plot()
+        """
+        mode_str = config["mode"]
+
+        # Exploding dice are marked with a trailing '!', e.g. 3d6!
+        dice_str = "+".join(
+            f"{die_amt}d{die_type}{'!' * (die_type in config['explode'])}"
+            for die_type, die_amt in config["dice"].items()
+        )
 
         success_threshold_str = ""
         # Doesn't make sense to print out success threshold if it's equal to 1
         #  (those are auto-successes)
-        if sim.success_threshold > 1:
-            success_threshold_str = f" (>= {sim.success_threshold})"
+        if config["mode"] == "Successes" and config["success_threshold"] > 1:
+            success_threshold_str = f" (>= {config['success_threshold']})"
 
         reroll_str = ""
         # Doesn't make sense to print out reroll threshold is it's equal to 0
         #  (there will be no rerolls)
-        if sim.reroll_threshold > 0:
-            reroll_str = f", Reroll <= {sim.reroll_threshold}"
+        if config["reroll_threshold"] > 0:
+            reroll_str = f", Reroll <= {config['reroll_threshold']}"
+
+        explode_str = ""
+        # Explosion depth only matters if some dice explode
+        if config["explode"]:
+            explode_str = f", Explode <= {config['explode_depth']}x"
 
         drop_str = ""
         # Doesn't make sense to print out number of drops if it's equal to 0
         #  (since we aren't dropping anything)
-        if sim.num_drops > 0:
-            drop_str = f", {sim.mode_drop} {sim.num_drops}"
+        if config["num_drops"] > 0:
+            drop_str = f", {config['mode_drop']} {config['num_drops']}"
 
-        trials_str = f", {sim.num_trials} Trials"
-
-        plt.title(
-            f"{mode_str}"
-            f"{success_threshold_str} of {dice_str}{reroll_str}"
-            f"{drop_str}{trials_str}"
+        return (
+            f"{mode_str}{success_threshold_str} of {dice_str}"
+            f"{reroll_str}{explode_str}{drop_str}"
         )
 
+    @classmethod
+    def generate_title(cls):
+        """
+        Generates the title string from the pool and trials of Simulator's
+        result, which may be a restored run whose settings aren't the ones
+        currently set
+        Requires: describe_config(), sim_exact.truncated_mass()
+        """
+        config = sim.get_config() if sim.result is None else sim.result.config
+        num_trials = sim.num_trials if sim.result is None else sim.result.num_trials
+        trials_str = f", {num_trials} Trials"
+        if sim.result is not None and num_trials is None:
+            trials_str = ", Exact"
+            # Approximations state how far off the normal approximation's
+            #  cumulative chances can be, which their own refine
+            if sim.result.metadata.get("engine") == "Approximate":
+                error_bound = sim.result.metadata["normal_error_bound"]
+                error_bound = round(error_bound * 100, 2)
+                trials_str = f", Approximate (Normal CDF Error <= {error_bound}%)"
+
+        # Every engine stops exploding dice at their depth, cutting off the
+        #  chance of any exploding further, which is stated when there is some
+        truncated_mass = 0
+        if config["explode"]:
+            truncated_mass = sim_exact.truncated_mass(config)
+        if truncated_mass > 0:
+            trials_str += f", {truncated_mass * 100:.3g}% Cut at Explode Depth"
+
+        # Seed and generator let anyone regenerate the exact same plot
+        seed_str = ""
+        if sim.result is not None and sim.result.metadata.get("seed") is not None:
+            seed_str = (
+                f", Seed {sim.result.metadata['seed']} ({sim.result.metadata['rng']})"
+            )
+
+        plt.title(f"{cls.describe_config(config)}{trials_str}{seed_str}")
+
     @classmethod
     def generate_plot(cls):
         """
@@ -425,30 +676,604 @@ class Plotter:
         color_annotate_dark = "#3B1D8F"  # dark violet
         color_annotate_light = "#D6C7FF"  # lavender
 
-        # Generate bar graph object with data; draw bars
-        bar_graph = ax.bar(
-            cls.x_sorted,
-            cls.y_sorted,
-            color=color_bar_light,
-            edgecolor=color_bar_dark,
-            linewidth=1.4,
-        )
+        if cls.plot_mode == "Probability":
+            # Generate bar graph object with data; draw bars
+            bar_graph = ax.bar(
+                cls.x_sorted,
+                cls.y_sorted,
+                color=color_bar_light,
+                edgecolor=color_bar_dark,
+                linewidth=1.4,
+            )
 
-        # Generate and format x- and y- axes
-        cls.generate_x_axis(ax)
-        cls.generate_y_axis(ax)
+            # Generate and format x- and y- axes
+            cls.generate_x_axis(ax)
+            cls.generate_y_axis(ax)
 
-        # Labels, annotations, and title
-        cls.generate_lbls_highlights(bar_graph, ax, color_quartile_dark, color_quartile_light)
+            if cls.show_error_bars:
+                cls.generate_error_bars(ax, color_bar_dark)
+
+            cls.generate_lbls_highlights(
+                bar_graph, ax, color_quartile_dark, color_quartile_light
+            )
+        else:
+            # One step curve instead of a bar per outcome; per-outcome labels
+            #  and error bars don't apply to cumulative probabilities
+            cls.generate_cumulative_plot(ax, color_bar_dark, color_quartile_dark)
+            cls.generate_x_axis(ax)
+
+        # Annotations and title
         cls.generate_annotations(ax, color_annotate_dark, color_annotate_light)
+        cls.generate_trim_note(ax, color_annotate_dark)
         cls.generate_title()
 
         plt.tight_layout()
         # Returns current figure
         return plt.gcf()
 
+    @classmethod
+    def figure_key(cls):
+        """
+        Returns the key the plot generate_plot() would draw for Simulator's
+        current result is cached under in FigureCache: a hash of the result
+        (its pool, outcomes, counts and metadata, arrays included) and of
+        every setting the plot reads, from its dimensions and plot mode to
+        the cutoff sensitivity and CI settings.  The title names the
+        result's own pool and trials, so the current ones don't enter it.
+        Necessary for: generate_cached_plot()
+        """
+        result = sim.result
+        digest = hashlib.blake2b(digest_size=16)
+        scalars = {}
+        for name, value in sorted(result.metadata.items()):
+            if isinstance(value, np.ndarray):
+                digest.update(name.encode())
+                digest.update(np.ascontiguousarray(value).tobytes())
+            else:
+                scalars[name] = value
+        digest.update(np.ascontiguousarray(result.counts).tobytes())
+        settings = {
+            "result": [result.config, result.min_outcome, result.num_trials],
+            "metadata": scalars,
+            "cutoff_sensitivity": sim.cutoff_sensitivity,
+            "CI_level": sim.CI_level,
+            "size": [cfg.PLT_WIDTH, cfg.PLT_HEIGHT, cfg.PLT_DPI],
+            "plot_mode": cls.plot_mode,
+            "error_bars": [cls.show_error_bars, cls.ci_method],
+        }
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def generate_raster_plot(image):
+        """
+        Returns a figure showing nothing but the rendered RGBA image, pixel
+        for pixel at PLT_DPI, so drawing (or saving) it is a single blit.
+        Necessary for: generate_cached_plot()
+        """
+        # Closes previous figures, if any
+        plt.close("all")
+
+        height, width = image.shape[:2]
+        fig = plt.figure(
+            figsize=(width / cfg.PLT_DPI, height / cfg.PLT_DPI), dpi=cfg.PLT_DPI
+        )
+        fig.figimage(image, origin="upper")
+        return fig
+
+    @classmethod
+    def generate_cached_plot(cls):
+        """
+        Returns the figure of the plot generate_plot() would draw for the
+        freq dictionary, drawn from its rendered image in FigureCache when
+        the same result was recently plotted with the same settings, e.g.
+        when flipping between session runs or redrawing.  Otherwise the plot
+        is generated, rendered once and cached.
+        Requires: figure_key(), generate_plot(), render_raster(),
+                  generate_raster_plot()
+        """
+        # Do not plot if no usable data
+        if not sim.freq:
+            return
+
+        key = cls.figure_key()
+        image = FigureCache.get(key)
+        if image is None:
+            image = render_raster(cls.generate_plot())
+            FigureCache.put(key, image)
+        return cls.generate_raster_plot(image)
+
+    @classmethod
+    def generate_comparison_plot(cls, results, style, seed=None):
+        """
+        Sets up matplotlib plot overlaying the distributions in the list of
+        SimResults results, one step curve per pool; returns figure of plot.
+        style is one of {'Step', 'CDF'}; CDF plots cumulative probabilities.
+        seed is the seed sampled pools were run with, noted in the title.
+        Each pool's legend entry carries its x-bar, s.d. and median.
+        Requires: describe_config()
+        """
+        # Do not plot if no usable data
+        if not results:
+            return
+        # Closes previous figures, if any
+        plt.close("all")
+
+        fig, ax = plt.subplots()
+        fig.set_size_inches(cfg.PLT_WIDTH, cfg.PLT_HEIGHT)
+
+        # Graph colors here, cycled through if there are more pools than colors
+        colors_pool = [
+            "#324A99",  # dark blue
+            "#104722",  # dark green
+            "#3B1D8F",  # dark violet
+            "#9C2F2F",  # brick red
+            "#B5702B",  # ochre
+            "#2B8A8A",  # teal
+        ]
+
+        for i, result in enumerate(results):
+            y_values = result.probabilities() * 100
+            # CDF steps up at each outcome; probability steps are centered on it
+            where = "mid"
+            if style == "CDF":
+                y_values = np.cumsum(y_values)
+                where = "post"
+
+            median = result.quartiles()[1]
+            ax.step(
+                result.outcomes(),
+                y_values,
+                where=where,
+                color=colors_pool[i % len(colors_pool)],
+                linewidth=1.6,
+                label=(
+                    f"{cls.describe_config(result.config)}\n"
+                    f"x-bar = {round(result.mean(), 1)}, "
+                    f"s.d. = {round(result.std(), 1)}, M = {median}"
+                ),
+            )
+
+        ax.set_xlabel("Outcome")
+        ax.xaxis.set_major_locator(
+            plttick.MaxNLocator(cfg.PLT_X_AX_LABELS_POP, integer=True)
+        )
+        if style == "CDF":
+            ax.set_ylim([0, 100])
+            ax.set_ylabel("Cumulative Probability (%)")
+        else:
+            ax.set_ylim(bottom=0)
+            ax.set_ylabel("Probability (%)")
+
+        ax.yaxis.set_major_locator(plttick.MaxNLocator(cfg.PLT_Y_GRIDLINES))
+        ax.grid(axis="y", which="major", linewidth=0.7, color="0.7", linestyle="--")
+        ax.set_axisbelow(True)
+        ax.legend(fontsize="small")
+
+        # Only sampled pools have a number of trials worth reporting
+        trials_str = ""
+        num_trials = [r.num_trials for r in results if r.num_trials is not None]
+        if num_trials:
+            trials_str = f", {max(num_trials)} Trials"
+            if seed is not None:
+                trials_str += f", Seed {seed} ({sim.rng_backend})"
+        plt.title(f"Comparison of {len(results)} Pools{trials_str}")
+
+        plt.tight_layout()
+        # Returns current figure
+        return plt.gcf()
+
+    @classmethod
+    def generate_contest_plot(cls, contest):
+        """
+        Sets up matplotlib bar plot of the margin of victory distribution of
+        the last run of Contest class contest, with bars colored by win, tie
+        and loss and the chance of each annotated; returns figure of plot.
+        Requires: describe_config()
+        """
+        # Do not plot if no usable data
+        if contest.margin is None:
+            return
+        # Closes previous figures, if any
+        plt.close("all")
+
+        fig, ax = plt.subplots()
+        fig.set_size_inches(cfg.PLT_WIDTH, cfg.PLT_HEIGHT)
+
+        # Graph colors here
+        color_win = "#86F7AA"  # lighter green
+        color_tie = "#D6C7FF"  # lavender
+        color_loss = "#FFB3B3"  # light red
+        color_edge = "#324A99"  # dark blue
+        color_annotate_dark = "#3B1D8F"  # dark violet
+
+        margins = contest.margin.outcomes()
+        y_values = contest.margin.probabilities() * 100
+        # Trim margins too unlikely to show up on the plot, as with sanitization
+        shown = y_values >= y_values.max() / sim.cutoff_sensitivity
+        shown_idx = np.flatnonzero(shown)
+        shown = slice(shown_idx[0], shown_idx[-1] + 1)
+        margins = margins[shown]
+        y_values = y_values[shown]
+
+        bar_colors = np.where(
+            margins > 0, color_win, np.where(margins == 0, color_tie, color_loss)
+        )
+        ax.bar(margins, y_values, color=bar_colors, edgecolor=color_edge, linewidth=1)
+
+        ax.set_xlabel("Margin of Victory (Attacker - Defender)")
+        ax.xaxis.set_major_locator(
+            plttick.MaxNLocator(cfg.PLT_X_AX_LABELS_POP, integer=True)
+        )
+        ax.set_ylim(bottom=0, top=y_values.max() * cls.min_h)
+        ax.set_ylabel("Probability (%)")
+        ax.grid(axis="y", which="major", linewidth=0.7, color="0.7", linestyle="--")
+        ax.set_axisbelow(True)
+
+        # Chances of each result in the top left corner of the plot
+        ax.text(
+            0.02,
+            0.96,
+            f"P(win) = {round(contest.p_win * 100, 2)}%\n"
+            f"P(tie) = {round(contest.p_tie * 100, 2)}%\n"
+            f"P(loss) = {round(contest.p_loss * 100, 2)}%",
+            transform=ax.transAxes,
+            va="top",
+            color=color_annotate_dark,
+        )
+
+        trials_str = ""
+        if contest.margin.metadata["num_trials"]:
+            trials_str = f", {contest.margin.metadata['num_trials']} Trials"
+            if contest.seed is not None:
+                trials_str += f", Seed {contest.seed} ({sim.rng_backend})"
+        plt.title(
+            f"{cls.describe_config(contest.attacker)}\n"
+            f"vs {cls.describe_config(contest.defender)}{trials_str}"
+        )
+
+        plt.tight_layout()
+        # Returns current figure
+        return plt.gcf()
+
+    @classmethod
+    def generate_joint_plot(cls, joint):
+        """
+        Sets up matplotlib heatmap of the joint distribution of the last run of
+        Joint class joint, with the marginal distribution of each metric as
+        bars along its axis and the correlation of the two annotated; returns
+        figure of plot.
+        Requires: describe_config()
+        """
+        # Do not plot if no usable data
+        if joint.result is None:
+            return
+        # Closes previous figures, if any
+        plt.close("all")
+        result = joint.result
+
+        fig = plt.figure()
+        fig.set_size_inches(cfg.PLT_WIDTH, cfg.PLT_HEIGHT)
+        grid = fig.add_gridspec(
+            2, 2, width_ratios=(4, 1), height_ratios=(1, 4), wspace=0.05, hspace=0.05
+        )
+        ax = fig.add_subplot(grid[1, 0])
+        ax_x = fig.add_subplot(grid[0, 0], sharex=ax)
+        ax_y = fig.add_subplot(grid[1, 1], sharey=ax)
+        ax_corner = fig.add_subplot(grid[0, 1])
+
+        # Graph colors here
+        color_light = "#D6C7FF"  # lavender
+        color_edge = "#324A99"  # dark blue
+        color_annotate_dark = "#3B1D8F"  # dark violet
+
+        # Trim values of either metric too unlikely to show up on the plot, as
+        #  with sanitization
+        probabilities = result.probabilities() * 100
+        shown = []
+        for axis in (0, 1):
+            marginal = probabilities.sum(axis=1 - axis)
+            shown_idx = np.flatnonzero(
+                marginal >= marginal.max() / sim.cutoff_sensitivity
+            )
+            shown.append(slice(shown_idx[0], shown_idx[-1] + 1))
+        probabilities = probabilities[shown[0], shown[1]]
+        x_values = result.outcomes(0)[shown[0]]
+        y_values = result.outcomes(1)[shown[1]]
+
+        # One mesh for the whole grid; cells are centered on their values
+        mesh = ax.pcolormesh(
+            np.append(x_values, x_values[-1] + 1) - 0.5,
+            np.append(y_values, y_values[-1] + 1) - 0.5,
+            probabilities.T,
+            cmap="Purples",
+            shading="flat",
+        )
+        ax_x.bar(
+            x_values,
+            probabilities.sum(axis=1),
+            width=1,
+            color=color_light,
+            edgecolor=color_edge,
+            linewidth=0.7,
+        )
+        ax_y.barh(
+            y_values,
+            probabilities.sum(axis=0),
+            height=1,
+            color=color_light,
+            edgecolor=color_edge,
+            linewidth=0.7,
+        )
+
+        labels = []
+        for metric in result.metrics:
+            if metric == "Successes" and result.config["success_threshold"] > 1:
+                metric = f"Successes (>= {result.config['success_threshold']})"
+            labels.append(metric)
+        ax.set_xlabel(labels[0])
+        ax.set_ylabel(labels[1])
+        for axis in (ax.xaxis, ax.yaxis):
+            axis.set_major_locator(
+                plttick.MaxNLocator(cfg.PLT_X_AX_LABELS_POP, integer=True)
+            )
+        ax_x.set_ylabel("%")
+        ax_y.set_xlabel("%")
+        ax_x.tick_params(axis="x", labelbottom=False)
+        ax_y.tick_params(axis="y", labelleft=False)
+
+        # Color scale and correlation in the corner between the marginals
+        ax_corner.axis("off")
+        cax = ax_corner.inset_axes([0.1, 0.7, 0.8, 0.15])
+        fig.colorbar(mesh, cax=cax, orientation="horizontal")
+        cax.tick_params(labelsize="x-small")
+        cax.set_title("Probability (%)", fontsize="small")
+        ax_corner.text(
+            0.5,
+            0.3,
+            f"r = {round(result.correlation(), 3)}",
+            transform=ax_corner.transAxes,
+            ha="center",
+            va="center",
+            color=color_annotate_dark,
+        )
+
+        trials_str = ", Exact"
+        if result.num_trials:
+            trials_str = f", {result.num_trials} Trials"
+            if joint.seed is not None:
+                trials_str += f", Seed {joint.seed} ({sim.rng_backend})"
+        pool_str = cls.describe_config(result.config).split(" of ", 1)[1]
+        fig.suptitle(f"{labels[0]} vs {labels[1]} of {pool_str}{trials_str}")
+
+        # Returns current figure
+        return fig
+
+    @classmethod
+    def generate_sweep_plot(cls, sweep):
+        """
+        Sets up matplotlib plot of the last run of Sweep class sweep: either a
+        heatmap of the chance of every outcome at every value of the swept
+        setting, with the mean at each marked, or small multiples of the
+        distribution at each value on shared axes; returns figure of plot.
+        Requires: describe_config()
+        """
+        # Do not plot if no usable data
+        if not sweep.results:
+            return
+        # Closes previous figures, if any
+        plt.close("all")
+
+        # Graph colors here
+        color_light = "#D6C7FF"  # lavender
+        color_edge = "#324A99"  # dark blue
+        color_annotate_dark = "#3B1D8F"  # dark violet
+
+        # Every distribution on one grid of outcomes
+        low = min(result.min_outcome for result in sweep.results)
+        high = max(result.outcomes()[-1] for result in sweep.results)
+        outcomes = np.arange(low, high + 1)
+        probabilities = np.zeros((len(sweep.results), len(outcomes)))
+        for row, result in zip(probabilities, sweep.results):
+            start = result.min_outcome - low
+            row[start : start + len(result.counts)] = result.probabilities() * 100
+        # Trim outcomes too unlikely to show up on the plot, as with
+        #  sanitization
+        shown_idx = np.flatnonzero(
+            probabilities.max(axis=0)
+            >= probabilities.max() / sim.cutoff_sensitivity
+        )
+        shown = slice(shown_idx[0], shown_idx[-1] + 1)
+        outcomes = outcomes[shown]
+        probabilities = probabilities[:, shown]
+
+        config = sweep.results[0].config
+        if sweep.parameter == "Threshold":
+            param_label = "Success Threshold"
+            pool_str = cls.describe_config(dict(config, success_threshold=1))
+        else:
+            param_label = f"Number of Dice Dropped ({config['mode_drop'][5:]})"
+            pool_str = cls.describe_config(dict(config, num_drops=0))
+        mode_str = pool_str.split(" of ", 1)[0]
+
+        if sweep.plot_style == "Heatmap":
+            fig, ax = plt.subplots()
+            fig.set_size_inches(cfg.PLT_WIDTH, cfg.PLT_HEIGHT)
+            values = np.array(sweep.values)
+            # One mesh for the whole grid; cells are centered on their values
+            mesh = ax.pcolormesh(
+                np.append(outcomes, outcomes[-1] + 1) - 0.5,
+                np.append(values, values[-1] + 1) - 0.5,
+                probabilities,
+                cmap="Purples",
+                shading="flat",
+            )
+            ax.plot(
+                [result.mean() for result in sweep.results],
+                values,
+                marker="o",
+                markersize=4,
+                linewidth=1,
+                color=color_annotate_dark,
+                label="Mean",
+            )
+            fig.colorbar(mesh, ax=ax, label="Probability (%)")
+            ax.legend(loc="upper right")
+            ax.set_xlabel(mode_str)
+            ax.set_ylabel(param_label)
+            ax.xaxis.set_major_locator(
+                plttick.MaxNLocator(cfg.PLT_X_AX_LABELS_POP, integer=True)
+            )
+            ax.yaxis.set_major_locator(plttick.MaxNLocator(integer=True))
+        else:
+            num_cols = math.ceil(math.sqrt(len(sweep.values)))
+            num_rows = math.ceil(len(sweep.values) / num_cols)
+            fig, axes = plt.subplots(
+                num_rows, num_cols, sharex=True, sharey=True, squeeze=False
+            )
+            fig.set_size_inches(cfg.PLT_WIDTH, cfg.PLT_HEIGHT)
+            for ax, value, row in zip(axes.flat, sweep.values, probabilities):
+                ax.bar(
+                    outcomes,
+                    row,
+                    width=1,
+                    color=color_light,
+                    edgecolor=color_edge,
+                    linewidth=0.5,
+                )
+                ax.set_title(f"{param_label.split(' (')[0]} {value}", fontsize="small")
+                ax.tick_params(labelsize="x-small")
+            # Panels past the last value stay empty, with the outcomes labeled
+            #  on the panels above them instead
+            for index in range(len(sweep.values), num_rows * num_cols):
+                axes.flat[index].axis("off")
+                axes.flat[index - num_cols].tick_params(labelbottom=True)
+            axes[0, 0].set_ylim(bottom=0, top=probabilities.max() * cls.min_h)
+            fig.supxlabel(mode_str)
+            fig.supylabel("Probability (%)")
+
+        trials_str = ""
+        if sweep.results[0].num_trials:
+            trials_str = f", {sweep.results[0].num_trials} Trials"
+            if sweep.seed is not None:
+                trials_str += f", Seed {sweep.seed} ({sim.rng_backend})"
+        fig.suptitle(f"{pool_str}, by {param_label}{trials_str}")
+
+        fig.tight_layout()
+        # Returns current figure
+        return fig
+
+    @classmethod
+    def generate_tail_plot(cls, tail):
+        """
+        Sets up matplotlib bar plot, on a log scale, of the distribution of the
+        last run of Tail class tail, with the outcomes in the tail highlighted,
+        error bars at Simulator's confidence level and the chance of the tail
+        annotated; returns figure of plot.
+        Outcomes are not trimmed by the cutoff sensitivity, as rare outcomes
+        are the point of the plot.
+        Requires: describe_config()
+        """
+        # Do not plot if no usable data
+        if tail.result is None:
+            return
+        # Closes previous figures, if any
+        plt.close("all")
+        result = tail.result
+
+        fig, ax = plt.subplots()
+        fig.set_size_inches(cfg.PLT_WIDTH, cfg.PLT_HEIGHT)
+
+        # Graph colors here
+        color_tail = "#FFB3B3"  # light red
+        color_rest = "#D6C7FF"  # lavender
+        color_edge = "#324A99"  # dark blue
+        color_annotate_dark = "#3B1D8F"  # dark violet
+
+        outcomes = result.outcomes()
+        probabilities = result.probabilities()
+        if tail.side == "At least":
+            in_tail = outcomes >= tail.target
+        else:
+            in_tail = outcomes <= tail.target
+        # Outcomes never seen (or impossible) have no height on a log scale
+        shown = probabilities > 0
+        y_values = probabilities[shown] * 100
+        ax.bar(
+            outcomes[shown],
+            y_values,
+            width=1,
+            color=np.where(in_tail[shown], color_tail, color_rest),
+            edgecolor=color_edge,
+            linewidth=0.5,
+        )
+        if result.num_trials:
+            lower, upper = result.confidence_intervals(sim.CI_level)
+            ax.errorbar(
+                outcomes[shown],
+                y_values,
+                yerr=[
+                    y_values - lower[shown] * 100,
+                    upper[shown] * 100 - y_values,
+                ],
+                fmt="none",
+                ecolor=color_annotate_dark,
+                elinewidth=0.7,
+                capsize=1.5,
+            )
+
+        ax.set_yscale("log")
+        ax.set_xlabel("Outcome")
+        ax.xaxis.set_major_locator(
+            plttick.MaxNLocator(cfg.PLT_X_AX_LABELS_POP, integer=True)
+        )
+        ax.set_ylabel("Probability (%)")
+        ax.grid(axis="y", which="major", linewidth=0.7, color="0.7", linestyle="--")
+        ax.set_axisbelow(True)
+
+        # Chance of the tail in the top left corner of the plot
+        sign = ">=" if tail.side == "At least" else "<="
+        tail_str = f"P(outcome {sign} {tail.target}) = "
+        tail_str += f"{result.metadata['tail_probability']:.4g}"
+        if result.num_trials:
+            half_width = cfg.ZSTAR_VALS[sim.CI_level]
+            half_width *= result.metadata["tail_std_error"]
+            tail_str += f"\n± {half_width:.2g} ({sim.CI_level}% CI)"
+        ax.text(
+            0.02,
+            0.96,
+            tail_str,
+            transform=ax.transAxes,
+            va="top",
+            color=color_annotate_dark,
+            # Rare outcomes can reach up behind the text on a log scale
+            bbox={"facecolor": "white", "alpha": 0.8, "edgecolor": "none"},
+        )
+
+        trials_str = ", Exact"
+        if result.num_trials:
+            trials_str = f", {result.num_trials} Trials, Importance Sampled"
+            if tail.seed is not None:
+                trials_str += f", Seed {tail.seed} ({sim.rng_backend})"
+        plt.title(f"{cls.describe_config(result.config)}{trials_str}")
+
+        plt.tight_layout()
+        # Returns current figure
+        return plt.gcf()
+
 
 # Matplotlib helper code from PySimpleGUI documentation
+def render_raster(figure):
+    """
+    Renders figure at PLT_DPI and returns the image as a (height x width x 4)
+    RGBA uint8 array.
+    """
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="rgba", dpi=cfg.PLT_DPI)
+    width, height = np.round(figure.get_size_inches() * cfg.PLT_DPI).astype(int)
+    return np.frombuffer(buffer.getvalue(), dtype=np.uint8).reshape(height, width, 4)
+
+
 def draw_figure(canvas, figure):
     figure_canvas_agg = FigureCanvasTkAgg(figure, canvas)
     figure_canvas_agg.draw()
@@ -0,0 +1,470 @@
+# Simulation service.  Serves outcome distributions over a small local
+#  HTTP/JSON interface, so tools can query the engines without the GUI.
+#
+#  POST /distribution with a JSON body
+#      {"config": {...}, "num_trials": N, "sampler": "Plain",
+#       "rng": "PCG64", "seed": S}
+#  where config takes the form get_config() returns (missing fields take
+#  their defaults) and every other field is optional.  The response streams
+#  newline-delimited JSON snapshots, each refining the last, until one with
+#  "final": true.  Pools the planner finds cheaper to compute exactly are
+#  answered with one final snapshot.  GET /status reports what the service is doing.
+#
+#  Run with:  python -m diesimulator.sim_service [--host H] [--port P]
+
+import argparse
+import asyncio
+import json
+import math
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import sim_config as cfg
+from . import sim_backend
+from . import sim_exact
+from . import sim_planner
+
+SAMPLERS = ["Plain", "Antithetic", "Stratified", "Sobol"]
+RNG_BACKENDS = ["stdlib", "PCG64", "Philox", "SFC64"]
+
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = 64 * 1024
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Not Allowed"}
+
+
+def compute_exact(config):
+    """
+    Worker task returning a tuple (min_outcome, probabilities, metadata) of
+    the exact distribution of the pool in config.
+    """
+    result = sim_exact.exact_distribution(config)
+    return result.min_outcome, np.array(result.counts), result.metadata
+
+
+def compute_batch(config, num_trials, sampler, rng_backend, seed):
+    """
+    Worker task sampling one batch of num_trials trials of the pool in config.
+    Returns a tuple (min_outcome, counts, std_error) of the batch.
+    """
+    rng = sim_backend.make_rng(rng_backend, seed)
+    result = sim_backend.sample_with(config, num_trials, sampler, rng)
+    return result.min_outcome, result.counts, result.metadata["std_error"]
+
+
+def parse_request(body):
+    """
+    Validates the JSON body of a distribution request and returns a dict of
+    its parameters in canonical form.
+    Raises ValueError describing the first problem found.
+    Requires: sim_backend.canonical_config(), sim_planner.Planner
+    """
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        raise ValueError("Request body is not valid JSON")
+    if not isinstance(request, dict) or not isinstance(request.get("config"), dict):
+        raise ValueError("Request must be a JSON object with a config object")
+
+    params = {
+        "config": sim_backend.canonical_config(request["config"]),
+        "num_trials": request.get("num_trials", 1000000),
+        "sampler": request.get("sampler", "Plain"),
+        "rng": request.get("rng", "PCG64"),
+        "seed": request.get("seed"),
+    }
+    if not isinstance(params["num_trials"], int) or not (
+        1 <= params["num_trials"] <= cfg.SERVICE_MAX_TRIALS
+    ):
+        raise ValueError(f"num_trials must be in [1, {cfg.SERVICE_MAX_TRIALS}]")
+    if params["sampler"] not in SAMPLERS:
+        raise ValueError(f"sampler must be one of {SAMPLERS}")
+    if params["rng"] not in RNG_BACKENDS:
+        raise ValueError(f"rng must be one of {RNG_BACKENDS}")
+    if params["seed"] is not None and (
+        not isinstance(params["seed"], int) or params["seed"] < 0
+    ):
+        raise ValueError("seed must be a non-negative integer")
+
+    # Requests cheaper to answer exactly are, and then the settings that
+    #  can't change an exact result don't tell them apart
+    if sim_planner.Planner.prefers_exact(
+        params["config"], params["num_trials"], params["sampler"]
+    ):
+        params.update(num_trials=None, sampler=None, rng=None, seed=None)
+    return params
+
+
+def request_key(params):
+    """
+    Returns the canonical key of a parsed request; requests with equal keys
+    produce the same result and share one computation.
+    """
+    return json.dumps(params, sort_keys=True, separators=(",", ":"))
+
+
+def make_snapshot(params, min_outcome, probabilities, std_error, **fields):
+    """
+    Returns a JSON-ready dict describing a (possibly partial) result for the
+    request params, with summary statistics, plus any extra fields.
+    """
+    result = sim_backend.SimResult(params["config"], min_outcome, probabilities)
+    snapshot = {
+        "config": params["config"],
+        "min_outcome": int(min_outcome),
+        "probabilities": probabilities.tolist(),
+        "std_error": std_error.tolist(),
+        "mean": result.mean(),
+        "std": result.std(),
+        "quartiles": result.quartiles(),
+    }
+    snapshot.update(fields)
+    return snapshot
+
+
+class Job:
+    """
+    One computation, shared by every request in flight with the same key.
+    Snapshots are kept as they are published, so requests that join a job
+    late replay what they missed before following along.
+    """
+
+    def __init__(self):
+        self.snapshots = []
+        self.done = False
+        self.updated = asyncio.Condition()
+
+    async def publish(self, snapshot, final=False):
+        async with self.updated:
+            self.snapshots.append(snapshot)
+            self.done = final
+            self.updated.notify_all()
+
+    async def follow(self):
+        """
+        Yields every snapshot of the job in order, waiting for new ones until
+        the final snapshot has been yielded.
+        """
+        seen = 0
+        while True:
+            async with self.updated:
+                await self.updated.wait_for(
+                    lambda: len(self.snapshots) > seen or self.done
+                )
+                new_snapshots = self.snapshots[seen:]
+                done = self.done
+            for snapshot in new_snapshots:
+                yield snapshot
+            seen += len(new_snapshots)
+            if done and seen == len(self.snapshots):
+                return
+
+
+class SimService:
+    # Jobs currently being computed, keyed by request_key()
+    in_flight = {}
+
+    # Process pool the engines run in, created when the service starts
+    pool = None
+    max_workers = cfg.SERVICE_MAX_WORKERS
+
+    # Requests served by starting a computation, and by joining one in flight
+    computations = 0
+    coalesced = 0
+
+    @classmethod
+    def subscribe(cls, params):
+        """
+        Returns the job computing the request params, joining the one in
+        flight with the same key if there is one, starting it otherwise.
+        Requires: compute()
+        """
+        key = request_key(params)
+        job = cls.in_flight.get(key)
+        if job is not None:
+            cls.coalesced += 1
+            return job
+
+        job = Job()
+        cls.in_flight[key] = job
+        cls.computations += 1
+        asyncio.ensure_future(cls.compute(key, params, job))
+        return job
+
+    @classmethod
+    async def compute(cls, key, params, job):
+        """
+        Computes the request params in the process pool, publishing snapshots
+        to job, and retires the job once its final snapshot is out.
+        Requires: compute_exact(), compute_sampled()
+        """
+        try:
+            if params["num_trials"] is None:
+                loop = asyncio.get_running_loop()
+                min_outcome, probabilities, metadata = await loop.run_in_executor(
+                    cls.pool, compute_exact, params["config"]
+                )
+                snapshot = make_snapshot(
+                    params,
+                    min_outcome,
+                    probabilities,
+                    np.zeros(len(probabilities)),
+                    engine="Exact",
+                    num_trials=None,
+                    truncated_mass=metadata.get("truncated_mass", 0),
+                    final=True,
+                )
+                await job.publish(snapshot, final=True)
+            else:
+                await cls.compute_sampled(params, job)
+        except Exception as error:
+            await job.publish({"error": str(error), "final": True}, final=True)
+        finally:
+            del cls.in_flight[key]
+
+    @classmethod
+    async def compute_sampled(cls, params, job):
+        """
+        Samples the request params in batches of SERVICE_BATCH_TRIALS trials,
+        keeping at most max_workers batches of the job in the pool at once so
+        that concurrent jobs interleave rather than queue behind each other.
+        Whenever batches finish, the merged counts are published as a snapshot.
+        Batch standard errors combine as those of a trial-weighted average.
+        Requires: compute_batch(), sim_backend.spawn_seed()
+        """
+        loop = asyncio.get_running_loop()
+        num_trials = params["num_trials"]
+        seed = params["seed"]
+        if seed is None:
+            seed = secrets.randbits(32)
+
+        num_batches = math.ceil(num_trials / cfg.SERVICE_BATCH_TRIALS)
+        batch_sizes = [cfg.SERVICE_BATCH_TRIALS] * (num_batches - 1)
+        batch_sizes.append(num_trials - sum(batch_sizes))
+
+        pending = {}
+        next_batch = 0
+        trials_done = 0
+        counts = None
+        variance = None
+        while next_batch < num_batches or pending:
+            while next_batch < num_batches and len(pending) < cls.max_workers:
+                future = loop.run_in_executor(
+                    cls.pool,
+                    compute_batch,
+                    params["config"],
+                    batch_sizes[next_batch],
+                    params["sampler"],
+                    params["rng"],
+                    sim_backend.spawn_seed(seed, next_batch),
+                )
+                pending[future] = batch_sizes[next_batch]
+                next_batch += 1
+
+            finished, _ = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in finished:
+                batch_trials = pending.pop(future)
+                min_outcome, batch_counts, batch_std_error = future.result()
+                if counts is None:
+                    counts = np.zeros(len(batch_counts))
+                    variance = np.zeros(len(batch_counts))
+                counts += batch_counts
+                variance += (batch_trials * batch_std_error) ** 2
+                trials_done += batch_trials
+
+            final = trials_done == num_trials
+            snapshot = make_snapshot(
+                params,
+                min_outcome,
+                counts / trials_done,
+                np.sqrt(variance) / trials_done,
+                engine="Monte Carlo",
+                sampler=params["sampler"],
+                rng=params["rng"],
+                seed=seed,
+                num_trials=trials_done,
+                target_trials=num_trials,
+                final=final,
+            )
+            await job.publish(snapshot, final=final)
+
+    @classmethod
+    def status(cls):
+        """
+        Returns a dict describing the service's current load.
+        """
+        return {
+            "in_flight": len(cls.in_flight),
+            "computations": cls.computations,
+            "coalesced": cls.coalesced,
+            "max_workers": cls.max_workers,
+        }
+
+    @classmethod
+    async def handle_connection(cls, reader, writer):
+        """
+        Serves one HTTP/1.1 request on the connection, then closes it.
+        Requires: subscribe(), parse_request()
+        """
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            if len(request_line) != 3:
+                await write_json(writer, 400, {"error": "Malformed request line"})
+                return
+            method, path, _ = request_line
+            length = int(headers.get("content-length", 0))
+            if length > MAX_BODY_BYTES:
+                await write_json(writer, 400, {"error": "Request body too large"})
+                return
+            body = await reader.readexactly(length)
+
+            if path == "/status":
+                await write_json(writer, 200, cls.status())
+            elif path != "/distribution":
+                await write_json(writer, 404, {"error": f"No such path {path}"})
+            elif method != "POST":
+                await write_json(writer, 405, {"error": "Use POST"})
+            else:
+                try:
+                    params = parse_request(body)
+                except ValueError as error:
+                    await write_json(writer, 400, {"error": str(error)})
+                    return
+                writer.write(response_head(200, "application/x-ndjson", None))
+                async for snapshot in cls.subscribe(params).follow():
+                    line = json.dumps(snapshot).encode() + b"\n"
+                    writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+                    await writer.drain()
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Client went away or sent garbage; whatever job it was following
+            #  carries on for anyone else subscribed to it
+            pass
+        finally:
+            writer.close()
+
+    @classmethod
+    async def start(cls, host=cfg.SERVICE_HOST, port=cfg.SERVICE_PORT):
+        """
+        Starts the process pool and the server listening on host:port.
+        Port 0 picks a free port, which the returned asyncio Server reports.
+        """
+        cls.pool = ProcessPoolExecutor(max_workers=cls.max_workers)
+        return await asyncio.start_server(cls.handle_connection, host, port)
+
+    @classmethod
+    def shutdown(cls):
+        """
+        Stops the process pool, abandoning any batches not yet started.
+        """
+        if cls.pool is not None:
+            cls.pool.shutdown(wait=False, cancel_futures=True)
+            cls.pool = None
+
+
+def response_head(status, content_type, content_length):
+    """
+    Returns the status line and headers of a response; a content_length of
+    None makes the body chunked.
+    """
+    head = f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+    head += f"Content-Type: {content_type}\r\nConnection: close\r\n"
+    if content_length is None:
+        head += "Transfer-Encoding: chunked\r\n"
+    else:
+        head += f"Content-Length: {content_length}\r\n"
+    return (head + "\r\n").encode("latin-1")
+
+
+async def write_json(writer, status, obj):
+    """
+    Writes a complete response with obj as its JSON body.
+    """
+    body = json.dumps(obj).encode()
+    writer.write(response_head(status, "application/json", len(body)) + body)
+    await writer.drain()
+
+
+async def fetch_distribution(request, host=cfg.SERVICE_HOST, port=cfg.SERVICE_PORT):
+    """
+    Client for the service: sends the distribution request (a dict, as
+    described at the top of this module) and yields each snapshot as it
+    arrives.  Raises ValueError with the service's message if refused.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        body = json.dumps(request).encode()
+        writer.write(
+            b"POST /distribution HTTP/1.1\r\nHost: %s\r\n"
+            b"Content-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+            % (host.encode(), len(body), body)
+        )
+        await writer.drain()
+
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if status != 200:
+            length = int(headers.get("content-length", 0))
+            message = json.loads(await reader.readexactly(length))
+            raise ValueError(message["error"])
+
+        buffer = b""
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            if size == 0:
+                return
+            buffer += await reader.readexactly(size)
+            await reader.readexactly(2)
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield json.loads(line)
+    finally:
+        writer.close()
+
+
+async def serve(host, port):
+    server = await SimService.start(host, port)
+    print(f"Serving dice distributions on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        SimService.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local dice simulation service")
+    parser.add_argument("--host", default=cfg.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=cfg.SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=cfg.SERVICE_MAX_WORKERS)
+    args = parser.parse_args()
+
+    SimService.max_workers = args.workers
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
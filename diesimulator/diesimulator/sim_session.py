@@ -0,0 +1,264 @@
+# Session persistence.  Keeps the results of recent runs and saves them, with
+#  the Simulator's settings, to a compact binary file read back lazily.
+#
+#  File layout, little-endian throughout:
+#   magic b"DSSN", u32 format version, u32 header length
+#   header: JSON of the settings and, for each run, its pool configuration,
+#    outcome range and trials, scalar metadata, and the dtype, offset (from
+#    the start of the data block) and size of each of its arrays
+#   data: the arrays of every run back to back; integer count arrays are
+#    stored in the smallest unsigned dtype that holds their tallies, others
+#    (exact probabilities, weighted tallies) as float64
+#  Opening a session only reads the header; a run's arrays are read when the
+#  run is first asked for.
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from . import sim_config as cfg
+from . import sim_backend
+
+sim = sim_backend.Simulator
+
+MAGIC = b"DSSN"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<4sII")
+
+# Simulator attributes saved with a session and restored on opening it
+SETTINGS = [
+    "dice",
+    "custom_dice",
+    "mode",
+    "success_threshold",
+    "mode_drop",
+    "num_drops",
+    "reroll_threshold",
+    "explode_dice",
+    "explode_depth",
+    "num_trials",
+    "rng_backend",
+    "seed",
+    "sampler",
+    "approximate",
+    "CI_level",
+    "cutoff_sensitivity",
+]
+
+
+def session_path():
+    """
+    Returns the path of the session file, in the user's home directory.
+    """
+    return os.path.expanduser(cfg.SESSION_FILE)
+
+
+def int_keyed(dice):
+    """
+    Returns a copy of the dice dict dice with standard die types as ints;
+    JSON object keys come back as strings.
+    """
+    return {
+        sim_backend.parse_die_type(die_type): die_amt
+        for die_type, die_amt in dice.items()
+    }
+
+
+def compact_counts(result):
+    """
+    Returns the counts of SimResult result in the smallest dtype that holds
+    them exactly: an unsigned int dtype for integer tallies, float64 for
+    probabilities and the weighted tallies of variance-reduction samplers.
+    """
+    if result.counts.dtype.kind != "i":
+        return np.asarray(result.counts, dtype="<f8")
+    dtype = np.min_scalar_type(int(result.counts.max(initial=0)))
+    return result.counts.astype(dtype.newbyteorder("<"))
+
+
+class Session:
+    # Runs of this session, most recent first, as dicts holding the run's
+    #  "config", "num_trials" and its SimResult as "result"; runs opened from
+    #  a session file hold None there, and the "arrays" locating their data
+    #  in the file at "path", until first asked for
+    runs = []
+
+    @classmethod
+    def add_result(cls, result):
+        """
+        Records SimResult result as the most recent run of the session,
+        replacing any earlier run of the same configuration, and forgets
+        runs past the SESSION_MAX_RUNS most recent.
+        """
+        cls.runs = [run for run in cls.runs if run["config"] != result.config]
+        cls.runs.insert(
+            0,
+            {
+                "config": result.config,
+                "num_trials": result.num_trials,
+                "result": result,
+            },
+        )
+        del cls.runs[cfg.SESSION_MAX_RUNS :]
+
+    @classmethod
+    def result(cls, index):
+        """
+        Returns the SimResult of run index of the session, reading its arrays
+        from the session file if they haven't been read yet.
+        """
+        run = cls.runs[index]
+        if run["result"] is None:
+            arrays = {}
+            with open(run["path"], "rb") as file:
+                for name, (dtype, offset, size) in run["arrays"].items():
+                    file.seek(run["data_start"] + offset)
+                    arrays[name] = np.fromfile(file, dtype=dtype, count=size)
+
+            counts = arrays.pop("counts")
+            if counts.dtype.kind == "u":
+                counts = counts.astype(np.int64)
+            result = sim_backend.SimResult(
+                run["config"], run["min_outcome"], counts, run["num_trials"]
+            )
+            result.metadata.update(run["metadata"])
+            result.metadata.update(arrays)
+            run["result"] = result
+        return run["result"]
+
+    @classmethod
+    def save(cls, path=None):
+        """
+        Writes the Simulator's settings and every run of the session to the
+        session file at path (by default session_path()).  The file is
+        written beside path and renamed over it once complete, so a failed
+        save leaves the last session intact.
+        Requires: result(), compact_counts()
+        """
+        if path is None:
+            path = session_path()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        settings = {name: getattr(sim, name) for name in SETTINGS}
+        header_runs = []
+        blocks = []
+        offset = 0
+        for index in range(len(cls.runs)):
+            result = cls.result(index)
+            arrays = {"counts": compact_counts(result)}
+            metadata = {}
+            for key, value in result.metadata.items():
+                if isinstance(value, np.ndarray):
+                    arrays[key] = np.asarray(value, dtype="<f8")
+                elif isinstance(value, (np.integer, np.floating)):
+                    metadata[key] = value.item()
+                else:
+                    metadata[key] = value
+
+            locations = {}
+            for name, array in arrays.items():
+                locations[name] = [array.dtype.str, offset, array.size]
+                offset += array.nbytes
+                blocks.append(array)
+            header_runs.append(
+                {
+                    "config": result.config,
+                    "min_outcome": int(result.min_outcome),
+                    "num_trials": result.num_trials,
+                    "metadata": metadata,
+                    "arrays": locations,
+                }
+            )
+
+        header = json.dumps({"settings": settings, "runs": header_runs}).encode()
+
+        partial = path + ".partial"
+        with open(partial, "wb") as file:
+            file.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+            file.write(header)
+            for array in blocks:
+                file.write(array.tobytes())
+        os.replace(partial, path)
+
+        # Runs now live in the new file
+        for run, header_run in zip(cls.runs, header_runs):
+            run["path"] = path
+            run["data_start"] = PREAMBLE.size + len(header)
+            run["arrays"] = header_run["arrays"]
+
+    @classmethod
+    def open(cls, path=None):
+        """
+        Reads the header of the session file at path (by default
+        session_path()), restoring the Simulator's settings and listing the
+        saved runs without reading their arrays.  Returns True if a session
+        was opened; a missing, corrupt or other-version file, or one whose
+        header isn't laid out as save() writes it, opens nothing and leaves
+        the settings and runs as they were.
+        Requires: int_keyed(), sim_backend.canonical_config()
+        """
+        if path is None:
+            path = session_path()
+        try:
+            with open(path, "rb") as file:
+                magic, version, header_length = PREAMBLE.unpack(
+                    file.read(PREAMBLE.size)
+                )
+                if magic != MAGIC or version != FORMAT_VERSION:
+                    return False
+                header = json.loads(file.read(header_length))
+
+            settings = dict(header["settings"])
+            settings["dice"] = int_keyed(settings["dice"])
+            runs = []
+            for run in header["runs"]:
+                arrays = {
+                    name: [np.dtype(dtype).str, int(offset), int(size)]
+                    for name, (dtype, offset, size) in run["arrays"].items()
+                }
+                if "counts" not in arrays:
+                    return False
+                runs.append(
+                    {
+                        "config": sim_backend.canonical_config(run["config"]),
+                        "min_outcome": int(run["min_outcome"]),
+                        "num_trials": run["num_trials"],
+                        "metadata": dict(run["metadata"]),
+                        "arrays": arrays,
+                        "path": path,
+                        "data_start": PREAMBLE.size + header_length,
+                        "result": None,
+                    }
+                )
+        except (
+            OSError,
+            ValueError,
+            struct.error,
+            KeyError,
+            TypeError,
+            AttributeError,
+        ):
+            return False
+
+        for name in SETTINGS:
+            if name in settings:
+                setattr(sim, name, settings[name])
+        cls.runs = runs
+        return True
+
+    @staticmethod
+    def restore_config(config):
+        """
+        Sets the Simulator's pool settings to those of configuration config.
+        """
+        sim.dice = dict(config["dice"])
+        sim.mode = config["mode"]
+        sim.success_threshold = config["success_threshold"]
+        sim.mode_drop = config["mode_drop"]
+        sim.num_drops = config["num_drops"]
+        sim.reroll_threshold = config["reroll_threshold"]
+        sim.explode_dice = list(config["explode"])
+        sim.explode_depth = config["explode_depth"]
+        sim.custom_dice.update(config.get("custom_dice", {}))
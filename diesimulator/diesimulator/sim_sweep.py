@@ -0,0 +1,150 @@
+# Parameter sweeps.  Evaluates a pool at every value of one setting, its
+#  success threshold or its number of drops, from a single set of rolls
+#  instead of one simulation run per value.
+
+import numpy as np
+
+from . import sim_backend
+
+sim = sim_backend.Simulator
+
+# Settings a pool can be swept over
+PARAMETERS = ["Threshold", "Drops"]
+
+
+def sweep_thresholds(config, num_trials, rng=None):
+    """
+    Plain Monte Carlo run of num_trials trials for the pool in config, in
+    Successes mode, at every success threshold from 1 to the highest face
+    of its dice.  sample_metrics() already derives every threshold from one pass:
+    a roll has at least s successes at threshold t exactly when its s-th
+    highest kept die shows at least t, a cumulative comparison over the
+    tallies of its sorted columns.
+    Returns a tuple (thresholds, results) of lists.
+    Requires: sim_backend.sample_metrics()
+    """
+    config = sim_backend.canonical_config(dict(config, mode="Successes"))
+    metrics = sim_backend.sample_metrics(config, num_trials, rng)
+    thresholds = list(range(1, max(sim_backend.top_face(config), 1) + 1))
+    return thresholds, [metrics[("Successes", t)] for t in thresholds]
+
+
+def drop_sweep_outcomes(config, mode_drop, rolls):
+    """
+    Returns a (trials x dice) int64 array whose column d holds the outcome
+    of each row of the sorted (trials x dice) matrix rolls with d dice
+    dropped as given by mode_drop.  Sums and successes of every drop count
+    come from one prefix sum over the sorted columns: with prefix[k] the sum
+    of the k lowest dice, dropping the d lowest leaves prefix[n] - prefix[d]
+    and dropping the d highest leaves prefix[n - d].  The highest and lowest
+    kept die are a column of rolls itself.
+    Necessary for: sweep_drops()
+    """
+    num_dice = rolls.shape[1]
+    mode = config["mode"]
+    if mode in ["Sum", "Successes"]:
+        if mode == "Successes":
+            rolls = rolls >= config["success_threshold"]
+        prefix = np.zeros((len(rolls), num_dice + 1), dtype=np.int64)
+        np.cumsum(rolls, axis=1, out=prefix[:, 1:])
+        if mode_drop == "Drop lowest":
+            return prefix[:, num_dice:] - prefix[:, :num_dice]
+        return prefix[:, num_dice:0:-1].copy()
+
+    # Dropping dice from the end a mode doesn't look at changes nothing
+    if (mode == "Highest") == (mode_drop == "Drop lowest"):
+        column = rolls[:, -1:] if mode == "Highest" else rolls[:, :1]
+        return np.repeat(column.astype(np.int64), num_dice, axis=1)
+    if mode == "Highest":
+        return rolls[:, ::-1].astype(np.int64)
+    return rolls.astype(np.int64)
+
+
+def sweep_drops(config, num_trials, rng=None):
+    """
+    Plain Monte Carlo run of num_trials trials for the pool in config at
+    every number of drops from 0 to one less than its number of dice, in its
+    drop mode (dropping the lowest if it drops nothing).  Each chunk is
+    sorted once; the outcome of every drop count is then a column of
+    drop_sweep_outcomes(), and all of them are tallied by one bincount over
+    outcomes offset by drop count.  Those outcomes, and the prefix sums and
+    success flags they come from, grow with the number of dice, so chunks
+    are sized to leave room for them within SAMPLE_MEMORY_CAP.
+    Returns a tuple (drop counts, results) of lists.
+    Requires: drop_sweep_outcomes(), sim_backend.plain_result()
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    config = sim_backend.canonical_config(config)
+    mode_drop = config["mode_drop"]
+    if mode_drop == "Do not drop":
+        mode_drop = "Drop lowest"
+    drop_counts = list(range(sum(config["dice"].values())))
+    configs = [
+        sim_backend.canonical_config(dict(config, mode_drop=mode_drop, num_drops=d))
+        for d in drop_counts
+    ]
+    bounds = [sim_backend.outcome_bounds(c) for c in configs]
+    low = min(lowest for lowest, _ in bounds)
+    width = max(highest for _, highest in bounds) - low + 1
+
+    counts = np.zeros(len(drop_counts) * width, dtype=np.int64)
+    # Outcome o with d dice dropped is tallied at d * width + o - low
+    offsets = np.arange(len(drop_counts)) * width - low
+    # Per trial: num_dice + 1 prefix sums, num_dice outcomes plus as much
+    #  again for the temporaries NumPy makes (summing into a strided view)
+    #  and num_dice success flags; other modes take less
+    num_dice = len(drop_counts)
+    extra_bytes = 8 * (num_dice + 1) + 16 * num_dice + num_dice
+    buffers = sim_backend.RollBuffers(
+        dict(config, num_drops=0), num_trials, extra_bytes=extra_bytes
+    )
+    for _, size in buffers.chunks(num_trials):
+        rolls = buffers.roll_dice(buffers.draw_uniforms(rng, size), rng)
+        rolls.sort(axis=1)
+        outcomes = drop_sweep_outcomes(config, mode_drop, rolls)
+        outcomes += offsets
+        counts += np.bincount(outcomes.ravel(), minlength=len(counts))
+
+    counts = counts.reshape(len(drop_counts), width)
+    results = [
+        sim_backend.plain_result(
+            c, lowest, counts[d, lowest - low : highest - low + 1].copy(), num_trials
+        )
+        for d, c, (lowest, highest) in zip(drop_counts, configs, bounds)
+    ]
+    return drop_counts, results
+
+
+class Sweep:
+    # Setting swept over, one of PARAMETERS, and how the sweep is plotted
+    #  available plot styles are 'Heatmap' and 'Small multiples'
+    parameter = "Threshold"
+    plot_style = "Heatmap"
+
+    # Values of the swept setting in the last sweep run and the SimResult of
+    #  the pool at each
+    values = []
+    results = []
+
+    # Seed the random number generator of the last sweep run was created
+    #  with, if created here rather than passed in
+    seed = None
+
+    @classmethod
+    def run(cls, num_trials, rng=None):
+        """
+        Sweeps the Simulator's current pool over the chosen setting, sampling
+        num_trials trials once for every value.  If no rng is passed in, one
+        is created from Simulator's RNG settings.
+        Requires: sweep_thresholds(), sweep_drops()
+        """
+        cls.seed = None
+        if rng is None:
+            rng, cls.seed = sim.new_rng()
+
+        config = sim.get_config()
+        if cls.parameter == "Threshold":
+            cls.values, cls.results = sweep_thresholds(config, num_trials, rng)
+        else:
+            cls.values, cls.results = sweep_drops(config, num_trials, rng)
@@ -0,0 +1,254 @@
+# Precomputed distribution tables.  Exact distributions of the common pools
+#  are built once into a single indexed binary file, which is memory-mapped
+#  and answers any pool on its grid with a lookup instead of a computation.
+#  The file is built per user, in their home directory, once installed:
+#      python -m diesimulator.sim_tables
+#
+#  File layout, little-endian throughout:
+#   magic b"DSTB", u32 format version, u32 header length
+#   header: JSON describing the grid (die types, max dice, max drops)
+#   padding to a multiple of 8 bytes
+#   index: one INDEX_DTYPE record per slot of the grid, in slot order
+#   data: the float64 probabilities of every pool, back to back
+#  A pool's slot is computed arithmetically from its die type, number of
+#  dice, drop mode and number of drops, so a lookup reads one index record.
+
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+from . import sim_config as cfg
+from . import sim_backend
+from . import sim_exact
+
+MAGIC = b"DSTB"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<4sII")
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("min_outcome", "<i4")])
+
+
+def table_path():
+    """
+    Returns the path of the table file, in the user's home directory.
+    """
+    return os.path.expanduser(cfg.TABLE_FILE)
+
+
+def slot_drops(grid, slot):
+    """
+    Returns the (mode_drop, num_drops) of drop slot slot of grid: slot 0
+    drops nothing, the next max_drops slots drop the lowest 1, 2, ... dice and
+    the last max_drops drop the highest.
+    """
+    if slot == 0:
+        return "Do not drop", 0
+    if slot <= grid["max_drops"]:
+        return "Drop lowest", slot
+    return "Drop highest", slot - grid["max_drops"]
+
+
+def grid_slots(grid):
+    """
+    Yields the slot number and canonical config of every pool on grid, in
+    slot order, including slots that drop every die (which hold no pool).
+    Requires: slot_drops()
+    """
+    drop_slots = 2 * grid["max_drops"] + 1
+    slot = 0
+    for die_type in grid["die_types"]:
+        for die_amt in range(1, grid["max_dice"] + 1):
+            for drop_slot in range(drop_slots):
+                mode_drop, num_drops = slot_drops(grid, drop_slot)
+                config = None
+                if num_drops < die_amt:
+                    config = sim_backend.canonical_config(
+                        {
+                            "dice": {die_type: die_amt},
+                            "mode_drop": mode_drop,
+                            "num_drops": num_drops,
+                        }
+                    )
+                yield slot, config
+                slot += 1
+
+
+def build_tables(path=None, grid=None, report=print):
+    """
+    Computes the exact distribution of every pool on grid with the engines
+    and writes them, indexed, to the table file at path (by default the grid
+    in sim_config and table_path()).  The file is written beside path and
+    renamed over it once complete, so a running app never maps a half
+    written file.
+    Requires: grid_slots(), sim_exact.compute_distribution()
+    """
+    if path is None:
+        path = table_path()
+    if grid is None:
+        grid = {
+            "die_types": list(cfg.TABLE_DIE_TYPES),
+            "max_dice": cfg.TABLE_MAX_DICE,
+            "max_drops": cfg.TABLE_MAX_DROPS,
+        }
+    header = json.dumps(grid, sort_keys=True).encode()
+    padding = -(PREAMBLE.size + len(header)) % 8
+
+    slots = list(grid_slots(grid))
+    index = np.zeros(len(slots), dtype=INDEX_DTYPE)
+    start = time.perf_counter()
+    offset = 0
+    pmfs = []
+    for slot, config in slots:
+        if config is None:
+            continue
+        result = sim_exact.compute_distribution(config)
+        index[slot] = (offset, result.counts.size, result.min_outcome)
+        offset += result.counts.size
+        pmfs.append(result.counts)
+    report(
+        f"Built {len(pmfs)} distributions ({offset * 8 / 1e6:.1f} MB) "
+        f"in {time.perf_counter() - start:.1f} s"
+    )
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial = path + ".partial"
+    with open(partial, "wb") as file:
+        file.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        file.write(header + bytes(padding))
+        file.write(index.tobytes())
+        for pmf in pmfs:
+            file.write(np.ascontiguousarray(pmf, dtype="<f8").tobytes())
+    os.replace(partial, path)
+    DistributionTables.close()
+    return path
+
+
+class DistributionTables:
+    # Memory map of the table file, the grid its header describes, and views
+    #  of its index and data; opened on first lookup.  loaded is set once an
+    #  open was attempted, so a missing or unreadable file is only tried once
+    mapping = None
+    grid = None
+    index = None
+    data = None
+    loaded = False
+
+    @classmethod
+    def open(cls, path=None):
+        """
+        Memory-maps the table file at path (by default table_path()) and
+        checks its magic and version.  Leaves the tables empty, so every
+        lookup falls back to the engines, if the file is missing or isn't a
+        table file of this version.
+        Requires: table_path()
+        """
+        cls.close()
+        cls.loaded = True
+        if path is None:
+            path = table_path()
+        try:
+            mapping = np.memmap(path, dtype=np.uint8, mode="r")
+        except (OSError, ValueError):
+            return
+        if mapping.size < PREAMBLE.size:
+            return
+        magic, version, header_length = PREAMBLE.unpack_from(mapping, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return
+        header_end = PREAMBLE.size + header_length
+        grid = json.loads(bytes(mapping[PREAMBLE.size : header_end]))
+        index_start = header_end + -header_end % 8
+        num_slots = len(grid["die_types"]) * grid["max_dice"]
+        num_slots *= 2 * grid["max_drops"] + 1
+        data_start = index_start + num_slots * INDEX_DTYPE.itemsize
+
+        cls.mapping = mapping
+        cls.grid = grid
+        cls.index = mapping[index_start:data_start].view(INDEX_DTYPE)
+        cls.data = mapping[data_start:].view("<f8")
+
+    @classmethod
+    def close(cls):
+        """
+        Drops the memory map; the next lookup opens the file again.
+        """
+        cls.mapping = cls.grid = cls.index = cls.data = None
+        cls.loaded = False
+
+    @classmethod
+    def slot(cls, config):
+        """
+        Returns the slot of the pool in config in the tables, or None if the
+        pool is off the grid: only sums of one type of plain die (no rerolls
+        or explosions) are tabulated.  Opens the tables on first use.
+        Requires: open()
+        """
+        if not cls.loaded:
+            cls.open()
+        grid = cls.grid
+        if grid is None or len(config["dice"]) != 1:
+            return None
+        if config["mode"] != "Sum" or config["reroll_threshold"] > 0:
+            return None
+        if config["explode"] or config["num_drops"] > grid["max_drops"]:
+            return None
+        (die_type, die_amt), = config["dice"].items()
+        if die_type not in grid["die_types"] or die_amt > grid["max_dice"]:
+            return None
+
+        drop_slot = config["num_drops"]
+        if drop_slot > 0 and config["mode_drop"] == "Drop highest":
+            drop_slot += grid["max_drops"]
+        slot = grid["die_types"].index(die_type) * grid["max_dice"] + die_amt - 1
+        return slot * (2 * grid["max_drops"] + 1) + drop_slot
+
+    @classmethod
+    def contains(cls, config):
+        """
+        Returns True if the pool in config has a precomputed distribution.
+        Requires: slot()
+        """
+        slot = cls.slot(config)
+        return slot is not None and cls.index[slot]["length"] > 0
+
+    @classmethod
+    def lookup(cls, config):
+        """
+        Returns the precomputed exact distribution of the pool in config as a
+        SimResult, or None if the pool is off the grid.  The probabilities
+        are a read-only view into the memory map; nothing is computed.
+        Requires: slot()
+        """
+        slot = cls.slot(config)
+        if slot is None:
+            return None
+        offset, length, min_outcome = cls.index[slot].tolist()
+        if length == 0:
+            return None
+        pmf = cls.data[offset : offset + length]
+        result = sim_backend.SimResult(config, min_outcome, pmf)
+        result.metadata["engine"] = "Exact"
+        result.metadata["table"] = True
+        return result
+
+
+def main():
+    """
+    Builds the table file for the grid in sim_config.
+    Requires: build_tables()
+    """
+    parser = argparse.ArgumentParser(
+        description="Precompute exact distributions of the common dice pools."
+    )
+    parser.add_argument(
+        "--output", default=None, help="Path of the table file to write."
+    )
+    args = parser.parse_args()
+    print(f"Wrote {build_tables(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# Tail estimation.  Estimates the chances of outcomes far out in a tail of a
+#  pool's distribution, too rare for plain sampling to ever see, by importance
+#  sampling: dice are rolled from exponentially tilted face distributions that
+#  make the tail common, and every trial is weighted by its likelihood ratio.
+
+import math
+
+import numpy as np
+
+from . import sim_config as cfg
+from . import sim_backend
+from . import sim_exact
+from . import sim_planner
+
+sim = sim_backend.Simulator
+
+# Sides of the target outcome a tail can lie on
+SIDES = ["At least", "At most"]
+
+
+def tilt_scores(config, values):
+    """
+    Returns the score each of the die values values is tilted by: whether it
+    is a success in Successes mode, the value itself otherwise.  Outcomes of
+    every mode grow with the scores of their dice.
+    """
+    if config["mode"] == "Successes":
+        return (values >= config["success_threshold"]).astype(np.float64)
+    return values.astype(np.float64)
+
+
+def tilted_dice(config, tilt):
+    """
+    Returns a list with a tuple (values, cdf, log_ratio) for each die type of
+    the pool in config: the values a die can show, the cumulative
+    distribution of the tilted die, q(v) ∝ p(v) * exp(tilt * score(v)), and
+    the log likelihood ratio log(p(v) / q(v)) of the die showing each value.
+    Requires: tilt_scores(), sim_exact.die_value_pmf()
+    """
+    dice = []
+    for die_type in config["dice"]:
+        offset, pmf = sim_exact.die_value_pmf(die_type, config)
+        possible = np.flatnonzero(pmf)
+        values = offset + possible
+        log_p = np.log(pmf[possible])
+        log_q = log_p + tilt * tilt_scores(config, values)
+        # Normalized in log space so that large tilts don't overflow
+        log_q -= np.logaddexp.reduce(log_q)
+        dice.append((values, np.cumsum(np.exp(log_q)), log_p - log_q))
+    return dice
+
+
+def roll_tilted(config, dice, uniforms):
+    """
+    Maps a (trials x dice) array of uniforms in [0, 1) onto rolls of the
+    tilted dice by inverse transform, one column per die in the order of
+    config's dice dictionary.
+    Returns a tuple of the (trials x dice) rolls and the log likelihood ratio
+    of each trial, the sum of those of its dice.
+    """
+    rolls = np.empty(uniforms.shape, dtype=np.int64)
+    log_ratios = np.zeros(len(uniforms))
+    col = 0
+    for (values, cdf, log_ratio), die_amt in zip(dice, config["dice"].values()):
+        block = slice(col, col + die_amt)
+        indices = np.searchsorted(cdf, uniforms[:, block], side="right")
+        # Guards against rounding leaving the last cumulative just below 1
+        np.minimum(indices, len(values) - 1, out=indices)
+        rolls[:, block] = values[indices]
+        log_ratios += log_ratio[indices].sum(axis=1)
+        col += die_amt
+    return rolls, log_ratios
+
+
+def choose_tilt(config, target, side, rng):
+    """
+    Returns the tilt importance sampling of the tail on side of target rolls
+    the pool in config with, from a pilot run of TAIL_PILOT_TRIALS trials.
+    Bisection first finds the tilt centering the pilot's mean outcome on
+    target, the best tilt for plain sums; dropped dice are tilted along with
+    kept ones though, so smaller tilts often do better, and the fraction of
+    that tilt in TAIL_TILT_FRACTIONS whose pilot estimates the tail with the
+    smallest relative variance is returned.  Every tilt tried rolls the same
+    pilot uniforms, so the pilot mean grows steadily with the tilt.  Tilts
+    only lean towards the tail: a target short of the mean takes none.
+    Requires: tilted_dice(), roll_tilted()
+    """
+    uniforms = rng.random((cfg.TAIL_PILOT_TRIALS, sum(config["dice"].values())))
+
+    def pilot(tilt):
+        rolls, log_ratios = roll_tilted(config, tilted_dice(config, tilt), uniforms)
+        return sim_backend.reduce_rolls(config, rolls), log_ratios
+
+    # Leaning the other way, excess() is negated so it grows towards the tail
+    sign = 1 if side == "At least" else -1
+
+    def excess(tilt):
+        return sign * (pilot(sign * tilt)[0].mean() - target)
+
+    if excess(0.0) >= 0:
+        return 0.0
+    low, high = 0.0, cfg.TAIL_MAX_TILT
+    if excess(high) < 0:
+        return sign * high
+    for _ in range(30):
+        middle = (low + high) / 2
+        if excess(middle) < 0:
+            low = middle
+        else:
+            high = middle
+
+    best_tilt, best_variance = sign * high, math.inf
+    for fraction in cfg.TAIL_TILT_FRACTIONS:
+        tilt = sign * high * fraction
+        outcomes, log_ratios = pilot(tilt)
+        in_tail = sign * (outcomes - target) >= 0
+        # Too few pilot trials in the tail to judge the tilt by
+        if in_tail.sum() < 10:
+            continue
+        weights = np.exp(log_ratios[in_tail] - log_ratios[in_tail].max())
+        # One more than the relative variance of a trial's estimate of the
+        #  tail, E[w^2] / E[w]^2 over trials in it; unchanged by scaling w
+        variance = len(outcomes) * np.dot(weights, weights) / weights.sum() ** 2
+        if variance < best_variance:
+            best_tilt, best_variance = tilt, variance
+    return best_tilt
+
+
+def tail_mask(result, target, side):
+    """
+    Returns a boolean array marking the outcomes of SimResult result that
+    lie in the tail on side of target.
+    """
+    if side == "At least":
+        return result.outcomes() >= target
+    return result.outcomes() <= target
+
+
+def sample_tail(config, num_trials, target, side="At least", rng=None):
+    """
+    Importance sampling run of num_trials trials for the pool in config,
+    aimed at the tail of outcomes on side of target.  Dice are rolled from
+    faces tilted by choose_tilt(), and each trial counts for its likelihood
+    ratio w rather than 1, so each outcome's estimated probability, the sum
+    of w over trials showing it divided by num_trials, is unbiased; its
+    standard error comes from the sum of w^2 over the same trials.  Outcomes
+    near target are estimated to within a few percent from trials that
+    plain sampling would need orders of magnitude more of to see them once.
+    Returns a SimResult whose metadata also holds the "tilt", and the
+    estimated "tail_probability" of the tail with its "tail_std_error".
+    Requires: choose_tilt(), tilted_dice(), roll_tilted(), tail_mask(),
+              sim_backend.estimated_result()
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    config = sim_backend.canonical_config(config)
+    min_outcome, max_outcome = sim_backend.outcome_bounds(config)
+    num_outcomes = max_outcome - min_outcome + 1
+    num_dice = sum(config["dice"].values())
+
+    tilt = choose_tilt(config, target, side, rng)
+    dice = tilted_dice(config, tilt)
+    weight_sums = np.zeros(num_outcomes)
+    weight_squares = np.zeros(num_outcomes)
+    chunk = min(num_trials, sim_backend.chunk_size(config))
+    for start in range(0, num_trials, chunk):
+        size = min(chunk, num_trials - start)
+        rolls, log_ratios = roll_tilted(config, dice, rng.random((size, num_dice)))
+        outcomes = sim_backend.reduce_rolls(config, rolls) - min_outcome
+        weights = np.exp(log_ratios)
+        weight_sums += np.bincount(outcomes, weights, num_outcomes)
+        weight_squares += np.bincount(outcomes, weights**2, num_outcomes)
+
+    probabilities = weight_sums / num_trials
+    result = sim_backend.estimated_result(
+        config, min_outcome, probabilities, num_trials, "Importance"
+    )
+    variance = np.maximum(weight_squares / num_trials - probabilities**2, 0)
+    result.metadata["std_error"] = np.sqrt(variance / (num_trials - 1))
+
+    tail = tail_mask(result, target, side)
+    tail_probability = float(probabilities[tail].sum())
+    tail_variance = weight_squares[tail].sum() / num_trials - tail_probability**2
+    result.metadata["tilt"] = tilt
+    result.metadata["tail_probability"] = tail_probability
+    result.metadata["tail_std_error"] = math.sqrt(
+        max(tail_variance, 0) / (num_trials - 1)
+    )
+    return result
+
+
+class Tail:
+    # Outcome the tail starts from, and the side of it the tail lies on, one
+    #  of SIDES; no target has been entered while target is None
+    target = None
+    side = "At least"
+
+    # SimResult of the last tail run
+    result = None
+
+    # Seed the random number generator of the last tail run was created
+    #  with, if created here rather than passed in
+    seed = None
+
+    @classmethod
+    def run(cls, num_trials, rng=None):
+        """
+        Estimates the chance of the Simulator's current pool landing in the
+        tail on side of target.  The tail is read off the exact distribution
+        if the planner finds that cheaper than sampling num_trials trials,
+        and estimated by importance sampling otherwise.  If no rng is passed
+        in, one is created from Simulator's RNG settings.
+        Requires: sample_tail(), tail_mask()
+        """
+        config = sim_backend.canonical_config(sim.get_config())
+        cls.seed = None
+        if sim_planner.Planner.prefers_exact(config, num_trials):
+            result = sim_exact.exact_distribution(config)
+            tail = tail_mask(result, cls.target, cls.side)
+            result.metadata["tail_probability"] = float(
+                result.probabilities()[tail].sum()
+            )
+            result.metadata["tail_std_error"] = 0.0
+            cls.result = result
+            return
+        if rng is None:
+            rng, cls.seed = sim.new_rng()
+        cls.result = sample_tail(config, num_trials, cls.target, cls.side, rng)
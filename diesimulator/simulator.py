@@ -1,5 +1,7 @@
 # Simulator frontend.  Activates PSG and runs main program.
 
+import argparse
+
 import PySimpleGUI as sg
 
 import diesimulator.sim_config as cfg
@@ -7,8 +9,34 @@ import diesimulator.sim_backend
 import diesimulator.sim_layout as slay
 import diesimulator.sim_gui_element_ops as sops
 import diesimulator.sim_icon as sicon
+import diesimulator.sim_session
 
 sim = diesimulator.sim_backend.Simulator
+session = diesimulator.sim_session.Session
+
+
+def parse_args():
+    """
+    Parses command line arguments for options that are also settable in GUI
+    """
+    parser = argparse.ArgumentParser(description="Aerie Dice Roll Simulator")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="seed for the random number generator (default: new seed every run)",
+    )
+    parser.add_argument(
+        "--rng",
+        choices=["stdlib", "PCG64", "Philox", "SFC64"],
+        help=f"random number generator backend (default: {sim.rng_backend}, "
+        "or the last session's)",
+    )
+    parser.add_argument(
+        "--benchmark",
+        metavar="DICE",
+        help="time a run of DICE (e.g. 10d6) on every generator backend and exit",
+    )
+    return parser.parse_args()
 
 
 def create_window():
@@ -21,7 +49,36 @@ def create_window():
     )
 
 
+args = parse_args()
+# Restores settings and recent runs of the last session, except for benchmarks;
+#  options given on the command line take precedence
+if not args.benchmark:
+    session.open()
+if args.seed is not None:
+    sim.seed = args.seed
+if args.rng is not None:
+    sim.rng_backend = args.rng
+
+if args.benchmark:
+    bench_dice, bench_exploding = sops.parse_input(args.benchmark)
+    if not bench_dice:
+        raise SystemExit(f"Unable to parse dice string {args.benchmark}")
+    sim.dice = bench_dice
+    sim.explode_dice = bench_exploding
+    timings = diesimulator.sim_backend.benchmark_rngs(
+        sim.get_config(), sim.num_trials, sim.sampler, args.seed or 0
+    )
+    for backend, seconds in timings.items():
+        print(f"{backend:>7}: {seconds:.4f} s for {sim.num_trials} trials")
+    raise SystemExit
+
 window = create_window()
+# Reflects restored settings and command line options in their GUI elements,
+#  and redraws the most recent run of the last session (only its data is read)
+sops.sync_elements(window)
+sops.session_update(window)
+if session.runs:
+    sops.restore_run(window, 0)
 
 while True:
     # In PSG, events are keys; values is a returned dict corresponding to
@@ -51,6 +108,11 @@ while True:
     if event[1:5] == "MODE":
         sops.mode_ops(window, event[6:-1])
 
+    # Handle events dealing with the explode frame
+    #  slices the string to pass "sub-event" into explode_ops()
+    if event[1:8] == "EXPLODE":
+        sops.explode_ops(window, event[9:-1], values)
+
     # Handle events dealing with the drop selection frame,
     #  passes in current state of dropdown in values dictionary
     if event[1:5] == "DROP":
@@ -66,14 +128,56 @@ while True:
     if event[1:11] == "NUM_TRIALS":
         sops.num_trials_ops(window, event[12:-1], values)
 
-    # Update dice pool text
+    # Handle events dealing with the display frame
+    #  slices the string to pass "sub-event" into display_ops()
+    if event[1:8] == "DISPLAY":
+        sops.display_ops(window, event[9:-1], values)
+
+    # Handle events dealing with the session frame
+    #  slices the string to pass "sub-event" into session_ops()
+    if event[1:8] == "SESSION":
+        sops.session_ops(window, event[9:-1], values)
+
+    # Handle events dealing with the comparison frame
+    #  slices the string to pass "sub-event" into compare_ops()
+    if event[1:8] == "COMPARE":
+        sops.compare_ops(window, event[9:-1], values)
+
+    # Handle events dealing with the opposed roll frame
+    #  slices the string to pass "sub-event" into contest_ops()
+    if event[1:8] == "CONTEST":
+        sops.contest_ops(window, event[9:-1])
+
+    # Handle events dealing with the joint distribution frame
+    #  slices the string to pass "sub-event" into joint_ops()
+    if event[1:6] == "JOINT":
+        sops.joint_ops(window, event[7:-1], values)
+
+    # Handle events dealing with the sweep frame
+    #  slices the string to pass "sub-event" into sweep_ops()
+    if event[1:6] == "SWEEP":
+        sops.sweep_ops(window, event[7:-1], values)
+
+    # Handle events dealing with the rare outcomes frame
+    #  slices the string to pass "sub-event" into tail_ops()
+    if event[1:5] == "TAIL":
+        sops.tail_ops(window, event[6:-1], values)
+
+    # Update dice pool text, die types available to explode and engine plan
     sops.pool_update(window)
+    sops.explode_update(window)
+    sops.plan_update(window)
+    sops.session_update(window)
 
     # Element updates that must be checked/performed for *any* event
     # If input errors detected, flag will equal 1; 0 else
     # Input error flag checked immediately below if ENGAGE event is triggered
     input_error_flag = sops.element_update(window, values)
 
+    # Switches the plot to the mode and threshold now selected, if the last
+    #  run already tallied them
+    sops.metric_update(window)
+
     # Runs simulation sequence (simulate, sanitize, plot, draw)
     if event == "-ENGAGE-":
         sops.engage_ops(window, input_error_flag)
@@ -88,4 +192,10 @@ while True:
 
     window.refresh()
 
+# Saves settings and recent runs for the next session
+try:
+    session.save()
+except OSError:
+    pass
+
 window.close()
@@ -0,0 +1,300 @@
+# Shared pools, statistical tests and engine wrappers of the test suite.
+#  Engines are checked against exact reference distributions with
+#  goodness-of-fit tests at fixed seeds, so the suite is deterministic; a
+#  check fails if its p-value is below ALPHA.
+
+import itertools
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from diesimulator import sim_backend
+from diesimulator import sim_plotter
+
+sim = sim_backend.Simulator
+plotter = sim_plotter.Plotter
+
+# Trials every sampling engine runs per pool, the seed every run is seeded
+#  from and the significance level of the statistical checks
+NUM_TRIALS = 200000
+SEED = 2022
+ALPHA = 1e-3
+
+# Pools every engine is checked on, covering sums, successes, highest and
+#  lowest dice, drops, rerolls, explosions and custom dice, as (name,
+#  configuration) tuples
+POOLS = [
+    ("3d6", {"dice": {6: 3}}),
+    ("2d4+2d10", {"dice": {4: 2, 10: 2}}),
+    ("4d6 drop lowest", {"dice": {6: 4}, "mode_drop": "Drop lowest", "num_drops": 1}),
+    (
+        "5d8 drop highest 2",
+        {"dice": {8: 5}, "mode_drop": "Drop highest", "num_drops": 2},
+    ),
+    (
+        "6d10 successes >= 7",
+        {"dice": {10: 6}, "mode": "Successes", "success_threshold": 7},
+    ),
+    (
+        "8d6 successes >= 5, drop lowest 2",
+        {
+            "dice": {6: 8},
+            "mode": "Successes",
+            "success_threshold": 5,
+            "mode_drop": "Drop lowest",
+            "num_drops": 2,
+        },
+    ),
+    ("4d8 reroll <= 2", {"dice": {8: 4}, "reroll_threshold": 2}),
+    (
+        "3d6+1d8 reroll <= 1, drop lowest",
+        {
+            "dice": {6: 3, 8: 1},
+            "reroll_threshold": 1,
+            "mode_drop": "Drop lowest",
+            "num_drops": 1,
+        },
+    ),
+    ("2d6! explode", {"dice": {6: 2}, "explode": [6]}),
+    ("highest of 3d6+1d8", {"dice": {6: 3, 8: 1}, "mode": "Highest"}),
+    (
+        "lowest of 5d6 drop lowest 2",
+        {"dice": {6: 5}, "mode": "Lowest", "mode_drop": "Drop lowest", "num_drops": 2},
+    ),
+    ("4dF", {"dice": {"F": 4}, "custom_dice": {"F": {"faces": [-1, 0, 1]}}}),
+    (
+        "3d{2,2,3,3,4,6}+1d6 drop lowest",
+        {
+            "dice": {6: 1, "A": 3},
+            "custom_dice": {"A": {"faces": [2, 2, 3, 3, 4, 6]}},
+            "mode_drop": "Drop lowest",
+            "num_drops": 1,
+        },
+    ),
+    (
+        "4dF+2d4 drop highest 2",
+        {
+            "dice": {4: 2, "F": 4},
+            "custom_dice": {"F": {"faces": [-1, 0, 1]}},
+            "mode_drop": "Drop highest",
+            "num_drops": 2,
+        },
+    ),
+    (
+        "5 loaded d6 successes >= 5",
+        {
+            "dice": {"L": 5},
+            "custom_dice": {
+                "L": {"faces": [1, 2, 3, 4, 5, 6], "weights": [1, 1, 1, 1, 1, 3]}
+            },
+            "mode": "Successes",
+            "success_threshold": 5,
+        },
+    ),
+    ("30d{0,5,10}", {"dice": {"Z": 30}, "custom_dice": {"Z": {"faces": [0, 5, 10]}}}),
+]
+
+# Largest number of rolls brute-force enumeration walks through
+MAX_ENUMERATED_ROLLS = 50000
+
+# Tolerance of comparisons between exact quantities; results to_freq()
+#  rounds to ROUNDING_PREC places of a percent lose about this much
+EXACT_TOLERANCE = 1e-4
+
+
+def pool_ids(pools):
+    """
+    Returns the names of the pools in pools, a list of tuples starting with
+    a name, as test ids.
+    """
+    return [pool[0] for pool in pools]
+
+
+def regularized_gamma_q(a, x):
+    """
+    Returns the regularized upper incomplete gamma function Q(a, x), by its
+    series for x < a + 1 and by its continued fraction (Lentz) otherwise.
+    Necessary for: chi_square_test()
+    """
+    if x <= 0:
+        return 1.0
+    log_prefactor = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        term = total = 1 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1 - total * math.exp(log_prefactor))
+
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return math.exp(log_prefactor) * h
+
+
+def chi_square_test(counts, probabilities):
+    """
+    Pearson's chi-square goodness-of-fit test of multinomial counts against
+    the exact probabilities.  Outcomes are merged, in order, into bins
+    expected to hold at least 5 trials each.
+    Returns a tuple (statistic, degrees of freedom, p-value).
+    Requires: regularized_gamma_q()
+    """
+    num_trials = counts.sum()
+    observed_bins, expected_bins = [], []
+    observed = expected = 0
+    for count, probability in zip(counts, probabilities):
+        observed += count
+        expected += probability * num_trials
+        if expected >= 5:
+            observed_bins.append(observed)
+            expected_bins.append(expected)
+            observed = expected = 0
+    if expected_bins:
+        observed_bins[-1] += observed
+        expected_bins[-1] += expected
+
+    observed_bins = np.array(observed_bins, dtype=float)
+    expected_bins = np.array(expected_bins)
+    statistic = float(((observed_bins - expected_bins) ** 2 / expected_bins).sum())
+    dof = len(expected_bins) - 1
+    if dof < 1:
+        return statistic, dof, 1.0
+    return statistic, dof, regularized_gamma_q(dof / 2, statistic / 2)
+
+
+def ks_test(estimated, probabilities, num_trials):
+    """
+    Kolmogorov-Smirnov test of estimated outcome probabilities against the
+    exact ones, taking the estimate to come from num_trials i.i.d. trials.
+    Outcomes are discrete, so the test is conservative; it is more so still
+    for variance-reduction samplers, which vary less than i.i.d. trials.
+    Returns a tuple (statistic D, p-value), the p-value from the asymptotic
+    Kolmogorov distribution with Stephens' correction.
+    """
+    distance = float(np.abs(np.cumsum(estimated) - np.cumsum(probabilities)).max())
+    root_n = math.sqrt(num_trials)
+    scaled = (root_n + 0.12 + 0.11 / root_n) * distance
+    if scaled < 0.2:
+        return distance, 1.0
+    p_value = 2 * sum(
+        (-1) ** (k - 1) * math.exp(-2 * k**2 * scaled**2) for k in range(1, 101)
+    )
+    return distance, min(max(p_value, 0.0), 1.0)
+
+
+def critical_value(alpha, dof=None):
+    """
+    Returns the two-sided critical value at significance alpha of the
+    standard normal distribution, or of Student's t with dof degrees of
+    freedom, from P(|T| > t) = I_x(dof / 2, 1 / 2) at x = dof / (dof + t^2).
+    Requires: sim_backend.beta_quantile()
+    """
+    if dof is None:
+        return NormalDist().inv_cdf(1 - alpha / 2)
+    x = sim_backend.beta_quantile(alpha, np.array([dof / 2]), np.array([0.5]))[0]
+    return math.sqrt(dof * (1 / x - 1))
+
+
+def check_sampled(result, exact, multinomial, dof=None):
+    """
+    Asserts that SimResult result, sampled by an engine, fits the exact
+    SimResult exact: by the chi-square test if the engine tallies i.i.d.
+    trials (multinomial), by the KS test, and by the z-score of its mean if
+    it has a standard error, against Student's t with dof degrees of freedom
+    if given.
+    Requires: chi_square_test(), ks_test(), critical_value()
+    """
+    probabilities = exact.probabilities()
+    if multinomial:
+        statistic, dof_chi, p_value = chi_square_test(result.counts, probabilities)
+        assert p_value >= ALPHA, f"chi2 {statistic:.1f} dof {dof_chi} p {p_value:.3f}"
+
+    estimated = result.probabilities()
+    distance, p_value = ks_test(estimated, probabilities, result.num_trials)
+    assert p_value >= ALPHA, f"KS D {distance:.5f} p {p_value:.3f}"
+
+    if "mean_std_error" in result.metadata:
+        z = abs(result.mean() - exact.mean()) / max(
+            result.metadata["mean_std_error"], 1e-12
+        )
+        assert z <= critical_value(ALPHA, dof), (
+            f"mean {result.mean():.5f} vs {exact.mean():.5f}, z {z:.2f}"
+        )
+
+
+def load_config(config, num_trials):
+    """
+    Sets Simulator's pool settings to those of config, for the engines that
+    read the Simulator rather than a configuration.
+    """
+    sim.dice = dict(config["dice"])
+    sim.mode = config["mode"]
+    sim.success_threshold = config["success_threshold"]
+    sim.mode_drop = config["mode_drop"]
+    sim.num_drops = config["num_drops"]
+    sim.reroll_threshold = config["reroll_threshold"]
+    sim.explode_dice = list(config["explode"])
+    sim.explode_depth = config["explode_depth"]
+    sim.custom_dice = dict(config["custom_dice"])
+    sim.num_trials = num_trials
+
+
+def enumerate_distribution(config):
+    """
+    Returns the exact pmf of the pool in config over its outcome bounds by
+    walking through every possible roll, each weighted by its chance, or
+    None if there are more than MAX_ENUMERATED_ROLLS of them or dice explode.
+    Shares nothing with the exact engine but get_die_faces(),
+    custom_die_pmf() and reduce_rolls().
+    """
+    if config["explode"]:
+        return None
+    faces, chances = [], []
+    for die_type, die_amt in config["dice"].items():
+        if sim_backend.is_custom_die(die_type):
+            values, probabilities = sim_backend.custom_die_pmf(die_type, config)
+        else:
+            values = sim_backend.get_die_faces(die_type, config["reroll_threshold"])
+            probabilities = np.full(len(values), 1 / len(values))
+        faces += [values] * die_amt
+        chances += [probabilities] * die_amt
+    if math.prod(len(f) for f in faces) > MAX_ENUMERATED_ROLLS:
+        return None
+
+    rolls = np.array(list(itertools.product(*faces)))
+    weights = np.array(list(itertools.product(*chances))).prod(axis=1)
+    outcomes = sim_backend.reduce_rolls(config, rolls)
+    min_outcome, max_outcome = sim_backend.outcome_bounds(config)
+    return np.bincount(
+        outcomes - min_outcome, weights, minlength=max_outcome - min_outcome + 1
+    )
+
+
+def plotter_statistics(result):
+    """
+    Returns a tuple (mean, standard deviation, quartiles) of the result as
+    the plotter computes them from its frequency dict.
+    """
+    freq = result.to_freq()
+    plotter.calc_xbar(freq)
+    plotter.calc_sx(freq, plotter.xbar)
+    plotter.calc_quartiles(freq)
+    return plotter.xbar, plotter.sx, plotter.quartiles
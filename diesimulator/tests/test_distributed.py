@@ -0,0 +1,92 @@
+# Distributed sampling across worker processes on localhost, against the
+#  exact distributions of POOLS and against sampling every part locally.
+
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from diesimulator import sim_backend
+from diesimulator import sim_distributed
+from diesimulator import sim_exact
+
+from helpers import NUM_TRIALS, POOLS, SEED, check_sampled, pool_ids
+
+pytestmark = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="local workers are forked",
+)
+
+
+@pytest.fixture(scope="module")
+def addresses():
+    """
+    Addresses of two local workers, running for the tests of the module.
+    """
+    workers, addresses = sim_distributed.start_local_workers(2)
+    yield addresses
+    sim_distributed.stop_local_workers(workers)
+
+
+@pytest.mark.parametrize("pool_index", range(len(POOLS)), ids=pool_ids(POOLS))
+def test_distributed_fits_exact(addresses, pool_index):
+    config = sim_backend.canonical_config(POOLS[pool_index][1])
+    exact = sim_exact.exact_distribution(config)
+    seed = sim_backend.spawn_seed(SEED, pool_index * 100 + 50)
+    result = sim_distributed.sample_distributed(
+        config, NUM_TRIALS, addresses, "PCG64", seed
+    )
+    check_sampled(result, exact, multinomial=True)
+
+
+def test_counts_independent_of_workers(addresses):
+    # A run's counts are those of sampling its parts on one machine, however
+    #  many workers are listed
+    config = sim_backend.canonical_config(POOLS[2][1])
+    expected = sim_backend.sample_parts(config, NUM_TRIALS, "PCG64", 7).counts
+    for workers in [addresses[:1], addresses]:
+        result = sim_distributed.sample_distributed(
+            config, NUM_TRIALS, workers, "PCG64", 7
+        )
+        assert np.array_equal(result.counts, expected)
+
+
+def test_lost_worker_reassigned(addresses):
+    # A worker lost after its first part must leave the run's counts exactly
+    #  those of sampling every part locally
+    lossy, lossy_addresses = sim_distributed.start_local_workers(1, max_parts=1)
+    try:
+        config = sim_backend.canonical_config(POOLS[0][1])
+        seed = sim_backend.spawn_seed(SEED, 40000)
+        result = sim_distributed.sample_distributed(
+            config, NUM_TRIALS, lossy_addresses + addresses, "PCG64", seed
+        )
+    finally:
+        sim_distributed.stop_local_workers(lossy)
+
+    expected = sim_backend.sample_parts(config, NUM_TRIALS, "PCG64", seed).counts
+    assert result.metadata["lost_workers"] == 1
+    assert np.array_equal(result.counts, expected)
+
+
+def test_oversized_part_rejected():
+    header = {
+        "type": "part",
+        "config": POOLS[0][1],
+        "seed": 0,
+        "part": 0,
+        "num_trials": sim_distributed.cfg.DISTRIBUTED_PART_TRIALS + 1,
+    }
+    with pytest.raises(ValueError):
+        sim_distributed.sample_part(header)
+
+
+def test_counts_must_add_up_to_part():
+    counts = np.array([3, 4, 5], dtype=np.uint8)
+    header = {"type": "counts", "part": 2, "min_outcome": 3, "dtype": counts.dtype.str}
+    offset, unpacked = sim_distributed.unpack_counts(
+        header, counts.tobytes(), (2, 12, 0.0), 3, 16
+    )
+    assert offset == 0 and np.array_equal(unpacked, counts)
+    with pytest.raises(ValueError):
+        sim_distributed.unpack_counts(header, counts.tobytes(), (2, 13, 0.0), 3, 16)
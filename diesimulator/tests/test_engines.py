@@ -0,0 +1,432 @@
+# Sampling engines against the exact distributions of POOLS, the plotter's
+#  summary statistics against exact ones, confidence intervals against their
+#  closed forms, and comparisons and contests of several pools.
+
+import math
+import multiprocessing
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from diesimulator import sim_backend
+from diesimulator import sim_compare
+from diesimulator import sim_contest
+from diesimulator import sim_exact
+from diesimulator import sim_planner
+
+from helpers import (
+    EXACT_TOLERANCE,
+    NUM_TRIALS,
+    POOLS,
+    SEED,
+    check_sampled,
+    load_config,
+    plotter_statistics,
+    pool_ids,
+    sim,
+)
+
+can_fork = "fork" in multiprocessing.get_all_start_methods()
+
+
+def run_sampler(sampler):
+    """
+    Returns a run(config, trials, seed) of sim_backend.sample_with() with
+    sampler on a PCG64 generator seeded with seed.
+    """
+
+    def run(config, trials, seed):
+        rng = sim_backend.make_rng("PCG64", seed)
+        return sim_backend.sample_with(config, trials, sampler, rng)
+
+    return run
+
+
+def run_metrics(config, trials, seed):
+    """
+    Samples config with sample_metrics() and returns the result of its mode.
+    """
+    rng = sim_backend.make_rng("PCG64", seed)
+    metrics = sim_backend.sample_metrics(config, trials, rng)
+    return metrics[sim_backend.metric_key(config)]
+
+
+def run_parallel(config, trials, seed):
+    """
+    Samples config with sample_parallel() over two worker processes.
+    """
+    return sim_backend.sample_parallel(config, trials, 2, "PCG64", seed)
+
+
+def run_loop(config, trials, seed):
+    """
+    Runs the original one-roll-at-a-time engine (perform_roll(), drop_dice()
+    and get_successes()) on the pool in config.
+    """
+    load_config(config, trials)
+    return sim.perform_sim_loop(seed)
+
+
+# Engines checked, as (name, run, trials, multinomial) tuples, run(config,
+#  trials, seed) returning a SimResult.  Multinomial engines tally i.i.d.
+#  trials and get the chi-square test.  The loop engine gets a fraction of
+#  the trials, being far slower
+ENGINES = [
+    ("Plain", run_sampler("Plain"), NUM_TRIALS, True),
+    ("Antithetic", run_sampler("Antithetic"), NUM_TRIALS, False),
+    ("Stratified", run_sampler("Stratified"), NUM_TRIALS, False),
+    ("Sobol", run_sampler("Sobol"), NUM_TRIALS, False),
+    ("Parallel", run_parallel, NUM_TRIALS, True),
+    ("Metrics", run_metrics, NUM_TRIALS, True),
+    ("Loop", run_loop, NUM_TRIALS // 20, True),
+]
+
+
+@pytest.mark.parametrize("engine_index", range(len(ENGINES)), ids=pool_ids(ENGINES))
+@pytest.mark.parametrize("pool_index", range(len(POOLS)), ids=pool_ids(POOLS))
+def test_engine_fits_exact(pool_index, engine_index):
+    engine, run, trials, multinomial = ENGINES[engine_index]
+    if engine == "Parallel" and not can_fork:
+        pytest.skip("worker processes can't be forked here")
+    config = sim_backend.canonical_config(POOLS[pool_index][1])
+    exact = sim_exact.exact_distribution(config)
+    seed = sim_backend.spawn_seed(SEED, pool_index * 100 + engine_index)
+    result = run(config, trials, seed)
+    # Sobol standard errors come from the spread of its replicates
+    dof = sim_backend.cfg.QMC_REPLICATES - 1 if engine == "Sobol" else None
+    check_sampled(result, exact, multinomial, dof)
+
+
+@pytest.mark.parametrize("name, partial_config", POOLS, ids=pool_ids(POOLS))
+def test_plotter_statistics(name, partial_config):
+    exact = sim_exact.exact_distribution(sim_backend.canonical_config(partial_config))
+    xbar, sx, quartiles = plotter_statistics(exact)
+    assert abs(xbar - exact.mean()) < EXACT_TOLERANCE
+    assert abs(sx - exact.std()) < EXACT_TOLERANCE
+    assert quartiles == exact.quartiles()
+
+
+@pytest.mark.parametrize("name, partial_config", POOLS[:3], ids=pool_ids(POOLS[:3]))
+def test_plain_run_independent_of_workers(name, partial_config):
+    # A seed reproduces a plain run whether its parts are sampled here or
+    #  spread over any number of processes, and whichever metrics it tallies
+    config = sim_backend.canonical_config(partial_config)
+    expected = sim_backend.sample_parts(config, 400000, "PCG64", 7).counts
+    metrics = sim_backend.sample_metrics_parts(config, 400000, "PCG64", 7)
+    assert np.array_equal(metrics[sim_backend.metric_key(config)].counts, expected)
+    if not can_fork:
+        pytest.skip("worker processes can't be forked here")
+    for num_workers in [2, 3, 4]:
+        result = sim_backend.sample_parallel(config, 400000, num_workers, "PCG64", 7)
+        assert np.array_equal(result.counts, expected)
+        parallel_metrics = sim_backend.sample_metrics_parallel(
+            config, 400000, num_workers, "PCG64", 7
+        )
+        assert parallel_metrics.keys() == metrics.keys()
+        for key, result in metrics.items():
+            assert np.array_equal(parallel_metrics[key].counts, result.counts)
+
+
+@pytest.mark.parametrize("sampler", ["Plain", "Antithetic", "Stratified", "Sobol"])
+@pytest.mark.parametrize("trials", [1, 3, 7, 11, 1001])
+def test_sampler_runs_no_more_trials_than_asked(sampler, trials):
+    config = sim_backend.canonical_config(POOLS[1][1])
+    result = run_sampler(sampler)(config, trials, SEED)
+    assert result.num_trials <= trials
+    assert abs(result.counts.sum() - result.num_trials) < 1e-6
+
+
+def test_stratified_large_die_within_memory():
+    # Histograms of every stratum of a d100000 would take about 149 GiB
+    config = sim_backend.canonical_config({"dice": {100000: 2}})
+    result = run_sampler("Stratified")(config, 1000, SEED)
+    assert result.metadata["sampler"] == "Plain"
+    assert result.num_trials == 1000
+
+
+def traced_peak(task):
+    """
+    Returns the most memory, in bytes, allocated at once while task runs.
+    """
+    tracemalloc.start()
+    try:
+        task()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize(
+    "name, partial_config",
+    [POOLS[i] for i in [0, 2, 8, 12]],
+    ids=pool_ids([POOLS[i] for i in [0, 2, 8, 12]]),
+)
+def test_sampling_within_memory_cap(monkeypatch, name, partial_config):
+    # Working arrays are sized to the cap whatever the number of trials; what
+    #  comes on top is the result and NumPy's temporaries of the reduction
+    cap = 1024 * 1024
+    monkeypatch.setattr(sim_backend.cfg, "SAMPLE_MEMORY_CAP", cap)
+    config = sim_backend.canonical_config(partial_config)
+    buffers = sim_backend.RollBuffers(config, 10**9)
+    arrays = [buffers.uniforms, buffers.rolls, buffers.outcomes]
+    assert 1 < buffers.chunk < 10**9
+    assert sum(array.nbytes for array in arrays) <= cap
+    assert sim_backend.RollBuffers(config, 10).chunk == 10
+
+    rng = sim_backend.make_rng("PCG64", SEED)
+    sim_backend.sample_pool(config, 1000, rng)
+    for trials in [100000, 1000000]:
+        peak = traced_peak(lambda: sim_backend.sample_pool(config, trials, rng))
+        assert peak < 1.5 * cap, f"{trials} trials peaked at {peak} bytes"
+
+
+def test_chunks_leave_counts_alone(monkeypatch):
+    # Uniforms are drawn row by row, so the chunks a run is split into don't
+    #  change what it rolls
+    config = sim_backend.canonical_config(POOLS[2][1])
+    expected = run_sampler("Plain")(config, 100000, SEED).counts
+    monkeypatch.setattr(sim_backend.cfg, "SAMPLE_MEMORY_CAP", 64 * 1024)
+    assert sim_backend.RollBuffers(config, 100000).chunk < 100000
+    assert np.array_equal(run_sampler("Plain")(config, 100000, SEED).counts, expected)
+
+
+@pytest.fixture
+def sim_state(monkeypatch):
+    """
+    Restores every Simulator setting and result a run touches after the test.
+    """
+    for name in [
+        "dice",
+        "mode",
+        "success_threshold",
+        "mode_drop",
+        "num_drops",
+        "reroll_threshold",
+        "explode_dice",
+        "explode_depth",
+        "custom_dice",
+        "num_trials",
+        "sampler",
+        "seed",
+        "result",
+        "metrics",
+    ]:
+        monkeypatch.setattr(sim, name, getattr(sim, name))
+    monkeypatch.setattr(sim, "freq", {})
+
+
+@pytest.mark.parametrize("sampler", ["Plain", "Antithetic", "Stratified", "Sobol"])
+def test_mode_switch_without_run(sim_state, sampler):
+    # Plain runs tally every metric, so switching mode needs no new run;
+    #  other runs tally only the one shown and say their result is outdated
+    load_config(sim_backend.canonical_config(POOLS[2][1]), 20000)
+    sim.sampler = sampler
+    sim.seed = SEED
+    sim.perform_sim()
+    assert not sim.result_outdated()
+
+    sim.mode = "Successes"
+    sim.success_threshold = 4
+    switched = sim.switch_metric()
+    assert switched == (sampler == "Plain")
+    assert sim.result_outdated() != switched
+    if switched:
+        assert sim.result.config["mode"] == "Successes"
+
+
+def binomial_cdf(k, n, p):
+    """
+    Returns the chance of at most k successes in n trials of chance p.
+    """
+    return sum(math.comb(n, i) * p**i * (1 - p) ** (n - i) for i in range(k + 1))
+
+
+@pytest.mark.parametrize("ci_level", [90, 95, 99])
+def test_clopper_pearson_bounds(ci_level):
+    # The bounds are the chances at which seeing at least (at most) the
+    #  count seen has chance alpha / 2; with none (all) seen, 1 - (alpha /
+    #  2)^(1 / n) bounds the chance from above (below) in closed form
+    num_trials = 20
+    alpha = 1 - ci_level / 100
+    counts = np.arange(num_trials + 1)
+    lower, upper = sim_backend.clopper_pearson_intervals(counts, num_trials, ci_level)
+    assert lower[0] == 0 and upper[-1] == 1
+    assert abs(upper[0] - (1 - (alpha / 2) ** (1 / num_trials))) < 1e-9
+    assert abs(lower[-1] - (alpha / 2) ** (1 / num_trials)) < 1e-9
+    for k in counts[1:]:
+        assert abs(1 - binomial_cdf(k - 1, num_trials, lower[k]) - alpha / 2) < 1e-9
+    for k in counts[:-1]:
+        assert abs(binomial_cdf(k, num_trials, upper[k]) - alpha / 2) < 1e-9
+
+
+@pytest.mark.parametrize("ci_level", [90, 95, 99])
+def test_wilson_bounds(ci_level):
+    # The bounds are the chances p at which the count seen lies zstar
+    #  standard errors of p away, (p_hat - p)^2 = zstar^2 p (1 - p) / n;
+    #  with none (all) seen they are 0 and zstar^2 / (n + zstar^2) (1 less
+    #  those)
+    num_trials = 20
+    zstar = sim_backend.cfg.ZSTAR_VALS[ci_level]
+    counts = np.arange(num_trials + 1)
+    lower, upper = sim_backend.wilson_intervals(counts, num_trials, zstar)
+    edge = zstar**2 / (num_trials + zstar**2)
+    assert abs(lower[0]) < 1e-12 and abs(upper[0] - edge) < 1e-12
+    assert abs(upper[-1] - 1) < 1e-12 and abs(lower[-1] - (1 - edge)) < 1e-12
+    p_hat = counts / num_trials
+    for bound in [lower, upper]:
+        residual = (p_hat - bound) ** 2 - zstar**2 * bound * (1 - bound) / num_trials
+        assert np.abs(residual).max() < 1e-12
+    assert np.all(lower <= p_hat + 1e-12) and np.all(p_hat <= upper + 1e-12)
+
+
+def test_confidence_intervals_by_result(monkeypatch):
+    config = sim_backend.canonical_config(POOLS[0][1])
+    exact = sim_exact.exact_distribution(config)
+    lower, upper = exact.confidence_intervals(95)
+    assert np.array_equal(lower, exact.probabilities())
+    assert np.array_equal(upper, exact.probabilities())
+
+    # Variance-reduction runs get normal intervals from their standard errors
+    antithetic = run_sampler("Antithetic")(config, 20000, SEED)
+    half_width = 1.96 * antithetic.metadata["std_error"]
+    lower, upper = antithetic.confidence_intervals(95, "Clopper-Pearson")
+    probabilities = antithetic.probabilities()
+    assert np.allclose(lower, np.clip(probabilities - half_width, 0, 1))
+    assert np.allclose(upper, np.clip(probabilities + half_width, 0, 1))
+
+    # Clopper-Pearson gives way to Wilson for runs too long to invert betas on
+    plain = run_sampler("Plain")(config, 20000, SEED)
+    wilson = sim_backend.wilson_intervals(plain.counts, plain.num_trials, 1.96)
+    exact_bounds = sim_backend.clopper_pearson_intervals(
+        plain.counts, plain.num_trials, 95
+    )
+    for method, expected in [("Wilson", wilson), ("Clopper-Pearson", exact_bounds)]:
+        for got, bound in zip(plain.confidence_intervals(95, method), expected):
+            assert np.array_equal(got, bound)
+    monkeypatch.setattr(sim_backend.cfg, "CLOPPER_PEARSON_MAX_TRIALS", 10000)
+    for got, bound in zip(plain.confidence_intervals(95, "Clopper-Pearson"), wilson):
+        assert np.array_equal(got, bound)
+
+
+@pytest.fixture
+def comparison(monkeypatch):
+    """
+    Gives the test a Comparison of no pools, and puts back the one there
+    was after the test.
+    """
+    comparison = sim_compare.Comparison
+    monkeypatch.setattr(comparison, "pools", [])
+    monkeypatch.setattr(comparison, "results", [])
+    monkeypatch.setattr(comparison, "seed", None)
+    return comparison
+
+
+def test_comparison_adds_each_pool_once(sim_state, comparison):
+    sim.dice = {}
+    assert not comparison.add_current_pool()
+    for index in [0, 2, 0]:
+        load_config(sim_backend.canonical_config(POOLS[index][1]), 1000)
+        comparison.add_current_pool()
+    assert comparison.pools == [
+        sim_backend.canonical_config(POOLS[index][1]) for index in [0, 2]
+    ]
+    comparison.clear_pools()
+    assert comparison.pools == [] and comparison.results == []
+
+
+def test_comparison_samples_on_common_random_numbers(comparison, monkeypatch):
+    # The success threshold is no part of a sum, so pools differing only in
+    #  it roll the same outcomes on the same uniforms
+    pools = [
+        sim_backend.canonical_config(POOLS[2][1]),
+        sim_backend.canonical_config(dict(POOLS[2][1], success_threshold=3)),
+        sim_backend.canonical_config(POOLS[0][1]),
+        sim_backend.canonical_config(POOLS[1][1]),
+    ]
+    comparison.pools = pools
+    exact_pools = [pools[2]]
+    monkeypatch.setattr(
+        sim_planner.Planner,
+        "prefers_exact",
+        classmethod(lambda cls, config, num_trials: config in exact_pools),
+    )
+    comparison.run(NUM_TRIALS, sim_backend.make_rng("PCG64", SEED))
+
+    results = comparison.results
+    assert [result.config for result in results] == pools
+    assert results[2].metadata["engine"] == "Exact"
+    assert np.array_equal(results[0].counts, results[1].counts)
+    for result in [results[0], results[3]]:
+        assert result.num_trials == NUM_TRIALS
+        check_sampled(result, sim_exact.exact_distribution(result.config), True)
+
+
+@pytest.fixture
+def contest(monkeypatch):
+    """
+    Gives the test a Contest of no sides, and puts back the one there was
+    after the test.
+    """
+    contest = sim_contest.Contest
+    for name in ["attacker", "defender", "margin", "seed"]:
+        monkeypatch.setattr(contest, name, None)
+    for name in ["p_win", "p_tie", "p_loss"]:
+        monkeypatch.setattr(contest, name, 0)
+    return contest
+
+
+def test_contest_sides(sim_state, contest):
+    sim.dice = {}
+    assert not contest.set_side("Attacker")
+    load_config(sim_backend.canonical_config(POOLS[0][1]), 1000)
+    assert contest.set_side("Attacker")
+    load_config(sim_backend.canonical_config(POOLS[2][1]), 1000)
+    assert contest.set_side("Defender")
+    assert contest.attacker == sim_backend.canonical_config(POOLS[0][1])
+    assert contest.defender == sim_backend.canonical_config(POOLS[2][1])
+
+
+def test_contest_of_exact_sides(contest):
+    # Margins of 2d6 against 1d8, tallied over every pair of rolls
+    contest.attacker = sim_backend.canonical_config({"dice": {6: 2}})
+    contest.defender = sim_backend.canonical_config({"dice": {8: 1}})
+    contest.run(NUM_TRIALS, sim_backend.make_rng("PCG64", SEED))
+    margins = np.zeros(11 + 7)
+    for a in range(1, 7):
+        for b in range(1, 7):
+            for d in range(1, 9):
+                margins[a + b - d + 6] += 1 / 288
+    assert contest.margin.min_outcome == -6
+    assert np.abs(contest.margin.probabilities() - margins).max() < 1e-12
+    assert abs(contest.p_win - margins[7:].sum()) < 1e-12
+    assert abs(contest.p_tie - margins[6]) < 1e-12
+    assert abs(contest.p_loss - margins[:6].sum()) < 1e-12
+    assert contest.margin.metadata["engine"] == "Exact"
+
+
+def test_contest_of_sampled_side(contest, monkeypatch):
+    # A sampled attacker against an exact defender; the margin distribution
+    #  is the sampled one shifted by every defender outcome in turn
+    contest.attacker = sim_backend.canonical_config(POOLS[2][1])
+    contest.defender = sim_backend.canonical_config(POOLS[0][1])
+    monkeypatch.setattr(
+        sim_planner.Planner,
+        "prefers_exact",
+        classmethod(lambda cls, config, num_trials: config == contest.defender),
+    )
+    contest.run(NUM_TRIALS, sim_backend.make_rng("PCG64", SEED))
+    assert contest.margin.metadata["engine"] == "Exact + Monte Carlo"
+    assert contest.margin.metadata["num_trials"] == NUM_TRIALS
+    assert abs(contest.p_win + contest.p_tie + contest.p_loss - 1) < 1e-12
+
+    attack = sim_exact.exact_distribution(contest.attacker).probabilities()
+    defense = sim_exact.exact_distribution(contest.defender).probabilities()
+    margins = np.convolve(attack, defense[::-1])
+    # Each chance is the average over sampled trials of a bounded chance, so
+    #  it is off by a few of its standard errors at most
+    outcomes = contest.margin.outcomes()
+    assert contest.margin.min_outcome == 3 - 18
+    p_win = margins[outcomes > 0].sum()
+    std_error = math.sqrt(p_win * (1 - p_win) / NUM_TRIALS)
+    assert abs(contest.p_win - p_win) < 5 * std_error
@@ -0,0 +1,186 @@
+# Exact engine against known values and brute-force enumeration, its cache
+#  of per-die-type distributions, the precomputed tables against the
+#  engines, and the approximate engine against the error bound of the normal
+#  approximation it refines.
+
+import math
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from diesimulator import sim_approx
+from diesimulator import sim_backend
+from diesimulator import sim_exact
+from diesimulator import sim_tables
+
+from helpers import EXACT_TOLERANCE, POOLS, enumerate_distribution, pool_ids
+
+cache = sim_exact.ConvolutionCache
+
+# Pools with exact statistics known independently of any engine, as
+#  (name, configuration, mean, standard deviation, quartiles) tuples
+KNOWN_VALUES = [
+    ("3d6", {"dice": {6: 3}}, 10.5, math.sqrt(3 * 35 / 12), [8, 11, 13]),
+    ("2d2", {"dice": {2: 2}}, 3, math.sqrt(0.5), [3, 3, 4]),
+    (
+        "4d6 drop lowest",
+        {"dice": {6: 4}, "mode_drop": "Drop lowest", "num_drops": 1},
+        15869 / 1296,
+        2.846844,
+        [10, 12, 14],
+    ),
+]
+
+
+@pytest.mark.parametrize(
+    "name, partial_config, mean, std, quartiles",
+    KNOWN_VALUES,
+    ids=pool_ids(KNOWN_VALUES),
+)
+def test_known_values(name, partial_config, mean, std, quartiles):
+    exact = sim_exact.exact_distribution(sim_backend.canonical_config(partial_config))
+    assert abs(exact.mean() - mean) < EXACT_TOLERANCE
+    assert abs(exact.std() - std) < EXACT_TOLERANCE
+    assert exact.quartiles() == quartiles
+
+
+@pytest.mark.parametrize("name, partial_config", POOLS, ids=pool_ids(POOLS))
+def test_exact_matches_enumeration(name, partial_config):
+    config = sim_backend.canonical_config(partial_config)
+    enumerated = enumerate_distribution(config)
+    if enumerated is None:
+        pytest.skip("too many rolls to enumerate")
+    exact = sim_exact.exact_distribution(config).probabilities()
+    assert np.abs(enumerated - exact).max() < 1e-12
+
+
+@pytest.fixture
+def empty_cache(monkeypatch):
+    """
+    Empties the ConvolutionCache and its statistics for the test, and puts
+    back what it held after.
+    """
+    monkeypatch.setattr(cache, "entries", OrderedDict())
+    for name in ["size_bytes", "hits", "misses", "evictions"]:
+        monkeypatch.setattr(cache, name, 0)
+    monkeypatch.setattr(cache, "max_bytes", cache.max_bytes)
+
+
+def test_cache_shares_powers_of_two(empty_cache):
+    config = sim_backend.canonical_config({"dice": {6: 1}})
+    # 12 dice are 6 squared, 6 are 3 squared, and 3 are 2 (1 squared) and 1
+    #  more, a hit
+    offset, pmf = sim_exact.die_group_pmf(6, 12, config)
+    assert (cache.hits, cache.misses, len(cache.entries)) == (1, 5, 5)
+    assert [key[2] for key in cache.entries] == [2, 1, 3, 6, 12]
+    # 14 dice square 7, which are 4 (2 squared, a hit) and 3 (a hit); hits
+    #  move to the back of the eviction order
+    sim_exact.die_group_pmf(6, 14, config)
+    assert (cache.hits, cache.misses, len(cache.entries)) == (3, 8, 8)
+    assert [key[2] for key in cache.entries] == [1, 6, 12, 2, 4, 3, 7, 14]
+
+    expected = np.ones(1)
+    for _ in range(12):
+        expected = np.convolve(expected, np.full(6, 1 / 6))
+    assert offset == 12 and np.abs(pmf - expected).max() < 1e-15
+    assert not pmf.flags.writeable
+    assert cache.size_bytes == sum(pmf.nbytes for _, pmf in cache.entries.values())
+    stats = cache.stats()
+    assert stats["hit_rate"] == 3 / 11 and stats["entries"] == 8
+
+
+def test_cache_evicts_least_recently_used(empty_cache):
+    # Room for two pmfs of 100 values
+    cache.max_bytes = 2000
+    cache.put("a", (0, np.zeros(100)))
+    cache.put("b", (0, np.zeros(100)))
+    assert cache.get("a") is not None
+    cache.put("c", (0, np.zeros(100)))
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 1, 1)
+    assert cache.size_bytes == 1600
+
+    # Putting a key again changes nothing; a pmf over the bound on its own
+    #  is still kept, alone
+    cache.put("a", (0, np.zeros(100)))
+    assert cache.size_bytes == 1600
+    cache.put("d", (0, np.zeros(300)))
+    assert list(cache.entries) == ["d"] and cache.size_bytes == 2400
+    assert cache.stats()["evictions"] == 3
+
+    cache.clear()
+    assert cache.stats() == {
+        "hits": 0,
+        "misses": 0,
+        "hit_rate": 0,
+        "evictions": 0,
+        "entries": 0,
+        "size_bytes": 0,
+        "max_bytes": 2000,
+    }
+
+
+@pytest.mark.parametrize("name, partial_config", POOLS, ids=pool_ids(POOLS))
+def test_table_matches_computed(name, partial_config):
+    config = sim_backend.canonical_config(partial_config)
+    if not sim_tables.DistributionTables.contains(config):
+        pytest.skip("pool isn't in the precomputed tables")
+    table = sim_exact.exact_distribution(config).probabilities()
+    computed = sim_exact.compute_distribution(config).probabilities()
+    assert np.abs(computed - table).max() < 1e-12
+
+
+def test_built_table_matches_computed(tmp_path):
+    # A small grid built from scratch, so the tables are checked whether or
+    #  not the user's table file has been built
+    grid = {"die_types": [4, 6], "max_dice": 5, "max_drops": 2}
+    path = sim_tables.build_tables(
+        str(tmp_path / "tables" / "sim_tables.bin"), grid, report=lambda _: None
+    )
+    tables = sim_tables.DistributionTables
+    try:
+        tables.open(path)
+        for slot, config in sim_tables.grid_slots(grid):
+            if config is None:
+                continue
+            assert tables.slot(config) == slot
+            table = tables.lookup(config)
+            computed = sim_exact.compute_distribution(config)
+            assert table.min_outcome == computed.min_outcome
+            assert np.abs(computed.counts - table.counts).max() < 1e-12
+        assert tables.lookup(sim_backend.canonical_config({"dice": {8: 2}})) is None
+    finally:
+        tables.close()
+
+
+@pytest.mark.parametrize("name, partial_config", POOLS, ids=pool_ids(POOLS))
+def test_approximate_within_normal_bound(name, partial_config):
+    # The Edgeworth terms refine the normal approximation, so the pools here
+    #  come within the bound on its error, though nothing guarantees they do
+    config = sim_backend.canonical_config(partial_config)
+    if not sim_approx.has_approximate_form(config):
+        pytest.skip("pool has no approximate form")
+    exact = sim_exact.exact_distribution(config)
+    probabilities = exact.probabilities()
+    approximate = sim_approx.approximate_distribution(config)
+    cdf = np.zeros(len(probabilities))
+    start = approximate.min_outcome - exact.min_outcome
+    cdf[start : start + len(approximate.counts)] = approximate.counts
+    distance = float(np.abs(np.cumsum(cdf) - np.cumsum(probabilities)).max())
+    assert distance <= approximate.metadata["normal_error_bound"]
+
+
+@pytest.mark.parametrize("name, partial_config", POOLS, ids=pool_ids(POOLS))
+def test_approximate_only_on_possible_outcomes(name, partial_config):
+    # Sums of dice whose faces are spaced more than 1 apart only land on a
+    #  lattice, and outcomes off it must get no mass
+    config = sim_backend.canonical_config(partial_config)
+    if not sim_approx.has_approximate_form(config):
+        pytest.skip("pool has no approximate form")
+    exact = sim_exact.exact_distribution(config)
+    approximate = sim_approx.approximate_distribution(config)
+    start = approximate.min_outcome - exact.min_outcome
+    impossible = exact.probabilities()[start : start + len(approximate.counts)] == 0
+    assert not approximate.probabilities()[impossible].any()
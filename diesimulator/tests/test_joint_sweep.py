@@ -0,0 +1,108 @@
+# Joint distributions of the sum and the successes, and sweeps over every
+#  number of drops, against exact distributions.
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from diesimulator import sim_backend
+from diesimulator import sim_exact
+from diesimulator import sim_joint
+from diesimulator import sim_sweep
+
+from helpers import ALPHA, NUM_TRIALS, SEED, chi_square_test, pool_ids
+
+# Pools the exact joint distribution of the sum and the successes is checked
+#  on, as (name, configuration) tuples
+JOINT_POOLS = [
+    ("4d6 successes >= 5", {"dice": {6: 4}, "success_threshold": 5}),
+    (
+        "3d6+2d10 reroll <= 1 successes >= 6",
+        {"dice": {6: 3, 10: 2}, "reroll_threshold": 1, "success_threshold": 6},
+    ),
+    (
+        "2d6! explode successes >= 6",
+        {"dice": {6: 2}, "explode": [6], "success_threshold": 6},
+    ),
+]
+
+# Pools swept over every number of drops, as (name, configuration) tuples
+SWEEP_POOLS = [
+    ("6d6", {"dice": {6: 6}}),
+    (
+        "3d6+2d8 successes >= 5, drop highest",
+        {
+            "dice": {6: 3, 8: 2},
+            "mode": "Successes",
+            "success_threshold": 5,
+            "mode_drop": "Drop highest",
+            "num_drops": 1,
+        },
+    ),
+    ("lowest of 5d10", {"dice": {10: 5}, "mode": "Lowest"}),
+]
+
+METRICS = ["Sum", "Successes"]
+
+
+@pytest.mark.parametrize("name, partial_config", JOINT_POOLS, ids=pool_ids(JOINT_POOLS))
+def test_joint_marginals_match_exact(name, partial_config):
+    config = sim_joint.joint_config(partial_config, METRICS)
+    exact = sim_joint.exact_joint(config, METRICS)
+    for axis, mode in enumerate(METRICS):
+        marginal = sim_exact.exact_distribution(dict(config, mode=mode))
+        assert np.abs(exact.marginal(axis).counts - marginal.counts).max() < 1e-12
+
+
+@pytest.mark.parametrize(
+    "pool_index", range(len(JOINT_POOLS)), ids=pool_ids(JOINT_POOLS)
+)
+def test_sampled_joint_fits_exact(pool_index):
+    config = sim_joint.joint_config(JOINT_POOLS[pool_index][1], METRICS)
+    exact = sim_joint.exact_joint(config, METRICS)
+    rng = np.random.default_rng(sim_backend.spawn_seed(SEED, 10000 + pool_index))
+    sampled = sim_joint.sample_joint(config, METRICS, NUM_TRIALS, rng)
+    # Sampled cells placed on the grid of the exact ones
+    counts = np.zeros_like(exact.counts, dtype=np.int64)
+    x = sampled.min_x - exact.min_x
+    y = sampled.min_y - exact.min_y
+    counts[x : x + sampled.counts.shape[0], y : y + sampled.counts.shape[1]] = (
+        sampled.counts
+    )
+    statistic, dof, p_value = chi_square_test(
+        counts.ravel(), exact.probabilities().ravel()
+    )
+    assert p_value >= ALPHA, f"chi2 {statistic:.1f} dof {dof} p {p_value:.3f}"
+
+
+@pytest.mark.parametrize(
+    "pool_index", range(len(SWEEP_POOLS)), ids=pool_ids(SWEEP_POOLS)
+)
+def test_drop_sweep_fits_exact(pool_index):
+    config = sim_backend.canonical_config(SWEEP_POOLS[pool_index][1])
+    rng = np.random.default_rng(sim_backend.spawn_seed(SEED, 20000 + pool_index))
+    drop_counts, swept = sim_sweep.sweep_drops(config, NUM_TRIALS, rng)
+    for num_drops, result in zip(drop_counts, swept):
+        exact = sim_exact.exact_distribution(result.config)
+        statistic, dof, p_value = chi_square_test(result.counts, exact.probabilities())
+        assert p_value >= ALPHA, (
+            f"drop {num_drops}: chi2 {statistic:.1f} dof {dof} p {p_value:.3f}"
+        )
+
+
+def test_drop_sweep_within_memory(monkeypatch):
+    # Every count of drops of a large pool is tallied from the same chunk, so
+    #  the chunk must leave room for all of their outcomes within the cap;
+    #  the results themselves come on top
+    cap = 4 * 1024 * 1024
+    monkeypatch.setattr(sim_backend.cfg, "SAMPLE_MEMORY_CAP", cap)
+    config = sim_backend.canonical_config({"dice": {6: 24}})
+    rng = np.random.default_rng(sim_backend.spawn_seed(SEED, 30000))
+    tracemalloc.start()
+    try:
+        sim_sweep.sweep_drops(config, 100000, rng)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 1.25 * cap
@@ -0,0 +1,146 @@
+# Engine planner: run-time estimates against timed runs of the engines, and
+#  the engine picked for pools in the tables, pools too large to compute
+#  exactly and runs of many trials.
+
+import numpy as np
+import pytest
+
+from diesimulator import sim_backend
+from diesimulator import sim_exact
+from diesimulator import sim_planner
+from diesimulator import sim_tables
+
+from helpers import SEED, pool_ids
+
+planner = sim_planner.Planner
+
+# Most an estimate may be off from the timed run, either way; estimates
+#  come within a factor of two or three of it
+ESTIMATE_FACTOR = 5
+
+# Pools sampled, as (name, configuration, number of trials, sampler) tuples
+SAMPLED_WORKLOADS = [
+    ("20d6", {"dice": {6: 20}}, 300000, "Plain"),
+    ("3d6", {"dice": {6: 3}}, 1000000, "Plain"),
+    (
+        "10d6+5d8 drop lowest 3",
+        {"dice": {6: 10, 8: 5}, "mode_drop": "Drop lowest", "num_drops": 3},
+        300000,
+        "Plain",
+    ),
+    ("6d10! explode", {"dice": {10: 6}, "explode": [10]}, 300000, "Plain"),
+    ("30d6 antithetic", {"dice": {6: 30}}, 300000, "Antithetic"),
+    ("5d6 Sobol", {"dice": {6: 5}}, 300000, "Sobol"),
+]
+
+# Pools sampled in plain runs tallying every metric, as (name,
+#  configuration) tuples
+METRIC_WORKLOADS = [(name, config) for name, config, _, _ in SAMPLED_WORKLOADS[:4]]
+
+# Pools computed by the state spaces of the exact engine, as (name,
+#  configuration) tuples
+EXACT_WORKLOADS = [
+    (
+        "15d6+6d10 drop lowest 4",
+        {"dice": {6: 15, 10: 6}, "mode_drop": "Drop lowest", "num_drops": 4},
+    ),
+    (
+        "40d12 drop highest 5",
+        {"dice": {12: 40}, "mode_drop": "Drop highest", "num_drops": 5},
+    ),
+    (
+        "30d20 drop lowest 10",
+        {"dice": {20: 30}, "mode_drop": "Drop lowest", "num_drops": 10},
+    ),
+]
+
+# A pool of mixed dice that drops dice, computed exactly by the state space
+DROP_POOL = {"dice": {6: 10, 8: 5}, "mode_drop": "Drop lowest", "num_drops": 3}
+
+
+@pytest.fixture(scope="module")
+def calibrated():
+    """
+    Calibrates the planner afresh, so its costs are those of the machine
+    as loaded while the estimates are checked.
+    """
+    planner.calibrate()
+
+
+def within_factor(estimate, seconds):
+    """
+    Returns True if estimate is within ESTIMATE_FACTOR of seconds.
+    """
+    return seconds / ESTIMATE_FACTOR <= estimate <= seconds * ESTIMATE_FACTOR
+
+
+@pytest.mark.parametrize(
+    "name, partial_config, num_trials, sampler",
+    SAMPLED_WORKLOADS,
+    ids=pool_ids(SAMPLED_WORKLOADS),
+)
+def test_sample_estimate_near_run_time(
+    calibrated, name, partial_config, num_trials, sampler
+):
+    config = sim_backend.canonical_config(partial_config)
+    rng = np.random.default_rng(SEED)
+    seconds = sim_planner.best_time(
+        lambda: sim_backend.sample_with(config, num_trials, sampler, rng)
+    )
+    # The estimate is of the run split across workers, timed here in one
+    estimate = planner.plan(config, num_trials, sampler)["sample_estimate"]
+    estimate *= sim_backend.parallel_workers(sampler, num_trials)
+    assert within_factor(estimate, seconds), f"{estimate:.3f} s for {seconds:.3f} s"
+
+
+@pytest.mark.parametrize(
+    "name, partial_config", METRIC_WORKLOADS, ids=pool_ids(METRIC_WORKLOADS)
+)
+def test_metrics_estimate_near_run_time(calibrated, name, partial_config):
+    config = sim_backend.canonical_config(partial_config)
+    num_trials = 300000
+    seconds = sim_planner.best_time(
+        lambda: sim_backend.sample_metrics_parts(config, num_trials)
+    )
+    workers = sim_backend.parallel_workers("Plain", num_trials)
+    estimate = planner.plan(config, num_trials, metrics=True)["sample_estimate"]
+    assert within_factor(estimate * workers, seconds)
+    # Tallying every metric costs more than tallying the pool's own
+    assert estimate > planner.plan(config, num_trials)["sample_estimate"]
+
+
+@pytest.mark.parametrize(
+    "name, partial_config", EXACT_WORKLOADS, ids=pool_ids(EXACT_WORKLOADS)
+)
+def test_exact_estimate_near_run_time(calibrated, name, partial_config):
+    config = sim_backend.canonical_config(partial_config)
+    seconds = sim_planner.best_time(
+        lambda: sim_exact.compute_distribution(config), repeats=1
+    )
+    estimate = planner.plan(config, 1)["exact_estimate"]
+    assert within_factor(estimate, seconds), f"{estimate:.3f} s for {seconds:.3f} s"
+
+
+def test_exact_preferred_for_many_trials():
+    config = sim_backend.canonical_config(DROP_POOL)
+    few = planner.plan(config, 100)
+    many = planner.plan(config, 10000000)
+    assert few["engine"] == "Monte Carlo" and few["estimate"] == few["sample_estimate"]
+    assert many["engine"] == "Exact" and many["estimate"] == many["exact_estimate"]
+    assert few["exact_estimate"] == many["exact_estimate"]
+    assert planner.prefers_exact(config, 10000000)
+    assert not planner.prefers_exact(config, 100)
+
+
+def test_tabled_pool_costs_nothing(monkeypatch):
+    monkeypatch.setattr(
+        sim_tables.DistributionTables, "contains", classmethod(lambda cls, c: True)
+    )
+    plan = planner.plan(sim_backend.canonical_config(DROP_POOL), 100)
+    assert plan["exact_estimate"] == 0 and plan["engine"] == "Exact"
+
+
+def test_state_space_over_cap_sampled(monkeypatch):
+    monkeypatch.setattr(sim_planner.cfg, "PLANNER_EXACT_MAX_BYTES", 1024)
+    plan = planner.plan(sim_backend.canonical_config(DROP_POOL), 10000000)
+    assert plan["exact_estimate"] is None and plan["engine"] == "Monte Carlo"
@@ -0,0 +1,220 @@
+# Plot titles, and the cache of rendered plots, for results drawn after the
+#  Simulator's settings have moved on, the outcomes sanitization leaves in
+#  the plot, and the cumulative plot modes.
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+from diesimulator import sim_backend
+from diesimulator import sim_exact
+from diesimulator import sim_plotter
+
+from helpers import POOLS, SEED, plotter, sim
+
+cache = sim_plotter.FigureCache
+
+
+@pytest.fixture
+def plot_state(monkeypatch):
+    """
+    Empties the figure cache and restores the Simulator's pool, trials,
+    result and sanitization after the test.
+    """
+    for name in [
+        "dice",
+        "num_trials",
+        "result",
+        "freq",
+        "cutoff_sensitivity",
+        "trimmed_mass",
+    ]:
+        monkeypatch.setattr(sim, name, getattr(sim, name))
+    monkeypatch.setattr(sim, "freq", {})
+    cache.clear()
+    yield
+    cache.clear()
+    plt.close("all")
+
+
+def show(result):
+    """
+    Makes result the Simulator's result, as a finished run or restored
+    session run does, ready to plot.
+    """
+    sim.result = result
+    sim.sanitize_outcomes()
+
+
+def sampled_result(pool_index, trials=20000):
+    """
+    Returns a plain run of trials trials of pool pool_index of POOLS.
+    """
+    config = sim_backend.canonical_config(POOLS[pool_index][1])
+    rng = sim_backend.make_rng("PCG64", SEED)
+    return sim_backend.sample_pool(config, trials, rng)
+
+
+def plot_title():
+    """
+    Returns the title of the plot generate_plot() draws for the result.
+    """
+    plotter.generate_plot()
+    return plt.gca().get_title()
+
+
+def test_title_names_result_not_settings(plot_state):
+    show(sampled_result(2, 12345))
+    sim.dice = {20: 7}
+    sim.num_trials = 999
+    title = plot_title()
+    assert plotter.describe_config(sim.result.config) in title
+    assert "12345 Trials" in title
+    assert "7d20" not in title and "999" not in title
+
+
+def test_figure_cache_hits_and_misses(plot_state):
+    first, second = sampled_result(0), sampled_result(1)
+    show(first)
+    plotter.generate_cached_plot()
+    plotter.generate_cached_plot()
+    assert (cache.hits, cache.misses, len(cache.entries)) == (1, 1, 1)
+
+    # Changing the pool being set up doesn't change the plot of the result
+    sim.dice = {20: 7}
+    sim.num_trials = 999
+    plotter.generate_cached_plot()
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    show(second)
+    plotter.generate_cached_plot()
+    assert (cache.hits, cache.misses, len(cache.entries)) == (2, 2, 2)
+    show(first)
+    plotter.generate_cached_plot()
+    assert cache.stats()["hits"] == 3 and cache.stats()["hit_rate"] == 0.6
+
+
+def test_figure_cache_evicts_least_recently_used(plot_state, monkeypatch):
+    results = [sampled_result(0), sampled_result(1), sampled_result(2)]
+    show(results[0])
+    plotter.generate_cached_plot()
+    # Room for two images
+    monkeypatch.setattr(cache, "max_bytes", 2 * cache.size_bytes)
+    show(results[1])
+    plotter.generate_cached_plot()
+    show(results[0])
+    plotter.generate_cached_plot()
+    show(results[2])
+    plotter.generate_cached_plot()
+    assert cache.evictions == 1 and len(cache.entries) == 2
+
+    show(results[0])
+    plotter.generate_cached_plot()
+    show(results[1])
+    plotter.generate_cached_plot()
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_exact_title(plot_state):
+    show(sim_exact.exact_distribution(sim_backend.canonical_config(POOLS[0][1])))
+    title = plot_title()
+    assert title.endswith("Exact")
+
+
+def test_title_states_mass_cut_at_explode_depth(plot_state):
+    config = sim_backend.canonical_config(POOLS[8][1])
+    mass = sim_exact.truncated_mass(config)
+    exact = sim_exact.exact_distribution(config)
+    assert exact.metadata["truncated_mass"] == mass > 0
+    show(exact)
+    assert f"{mass * 100:.3g}% Cut at Explode Depth" in plot_title()
+    show(sampled_result(8))
+    assert f"{mass * 100:.3g}% Cut at Explode Depth" in plot_title()
+    show(sampled_result(0))
+    assert "Explode" not in plot_title()
+
+
+def test_sanitize_trims_tails_and_keeps_result(plot_state):
+    # 3 and 18 are the only outcomes of 3d6 below a tenth of the likeliest
+    sim.cutoff_sensitivity = 10
+    exact = sim_exact.exact_distribution(sim_backend.canonical_config(POOLS[0][1]))
+    counts = exact.counts.copy()
+    show(exact)
+    assert sorted(sim.freq) == list(range(4, 18))
+    assert abs(sim.freq[10] - 27 / 216 * 100) < 1e-6
+    assert all(abs(mass - 1 / 216) < 1e-12 for mass in sim.trimmed_mass)
+    assert abs(sum(sim.freq.values()) + 100 * sum(sim.trimmed_mass) - 100) < 1e-6
+    assert np.array_equal(exact.counts, counts)
+
+    plotter.generate_plot()
+    notes = [text.get_text() for text in plt.gca().texts]
+    assert "Not shown: 0.463% below, 0.463% above" in notes
+
+    # The result is untouched, so it can be sanitized again with another cutoff
+    sim.cutoff_sensitivity = 120
+    sim.sanitize_outcomes()
+    assert sorted(sim.freq) == list(range(3, 19))
+    assert sim.trimmed_mass == (0, 0)
+    plotter.generate_plot()
+    assert not any(text.get_text().startswith("Not shown") for text in plt.gca().texts)
+
+
+def test_sanitize_splits_tails_at_likeliest(plot_state):
+    # Successes of 6d10 at >= 7 peak at 2; a sixth of that trims 0 below it
+    #  and 5 and 6 above it
+    sim.cutoff_sensitivity = 6
+    exact = sim_exact.exact_distribution(sim_backend.canonical_config(POOLS[4][1]))
+    show(exact)
+    probabilities = exact.probabilities()
+    peak = int(np.argmax(probabilities))
+    kept = [outcome - exact.min_outcome for outcome in sim.freq]
+    trimmed = np.delete(probabilities, kept)
+    trimmed_at = np.delete(np.arange(len(probabilities)), kept)
+    lower, upper = sim.trimmed_mass
+    assert abs(lower - trimmed[trimmed_at < peak].sum()) < 1e-12
+    assert abs(upper - trimmed[trimmed_at >= peak].sum()) < 1e-12
+    assert sorted(sim.freq) == [1, 2, 3, 4]
+    # Below lies only the chance of no die of six succeeding
+    assert abs(lower - 0.6**6) < 1e-12
+
+
+def test_calc_cdf_of_unordered_freq():
+    plotter.calc_cdf({12: 30.0, 10: 50.0, 11: 20.0})
+    assert list(plotter.cdf) == [50.0, 70.0, 100.0]
+
+
+@pytest.mark.parametrize("cutoff_sensitivity", [120, 10])
+def test_cumulative_modes_follow_result(plot_state, monkeypatch, cutoff_sensitivity):
+    # Both curves give the exact chances, of at most and of at least each
+    #  outcome shown, even with tails trimmed off the plot
+    monkeypatch.setattr(plotter, "plot_mode", "CDF")
+    sim.cutoff_sensitivity = cutoff_sensitivity
+    exact = sim_exact.exact_distribution(sim_backend.canonical_config(POOLS[0][1]))
+    show(exact)
+    probabilities = exact.probabilities() * 100
+    shown = [outcome - exact.min_outcome for outcome in sorted(sim.freq)]
+    at_most = np.cumsum(probabilities)[shown]
+    at_least = np.cumsum(probabilities[::-1])[::-1][shown]
+    lower, upper = sim.trimmed_mass
+
+    plotter.generate_plot()
+    assert plt.gca().get_ylabel() == "Cumulative Probability (%)"
+    steps = plt.gca().lines[0].get_ydata()
+    assert np.abs(steps[1:-1] - at_most).max() < 1e-4
+    assert abs(steps[0] - lower * 100) < 1e-4 and steps[-1] == steps[-2]
+
+    # Switching mode redraws the same result, without sanitizing it again
+    freq = dict(sim.freq)
+    plotter.plot_mode = "Survival"
+    plotter.generate_plot()
+    assert sim.freq == freq
+    assert plt.gca().get_ylabel() == "Probability of at Least (%)"
+    steps = plt.gca().lines[0].get_ydata()
+    assert np.abs(steps[1:-1] - at_least).max() < 1e-4
+    assert abs(steps[-1] - upper * 100) < 1e-4 and steps[0] == steps[1]
+
+    # Quartile markers sit on the curve, at the result's quartiles
+    markers = plt.gca().lines[1]
+    assert list(markers.get_xdata()) == exact.quartiles()
+    indices = [shown.index(q - exact.min_outcome) for q in exact.quartiles()]
+    assert np.abs(markers.get_ydata() - at_least[indices]).max() < 1e-4
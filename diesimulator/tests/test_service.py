@@ -0,0 +1,151 @@
+# The simulation service, run on a free port of localhost: coalescing of
+#  identical requests, snapshots streamed until a final one, and refusal of
+#  malformed requests.
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from diesimulator import sim_service
+
+service = sim_service.SimService
+
+HOST = "127.0.0.1"
+
+# A pool the planner samples rather than computes exactly at the trials the
+#  tests request, each split into batches of BATCH_TRIALS
+SAMPLED_REQUEST = {
+    "config": {"dice": {6: 30}, "mode_drop": "Drop lowest", "num_drops": 10},
+    "num_trials": 2000,
+    "seed": 7,
+}
+BATCH_TRIALS = 250
+
+# Bodies the service must refuse, as (name, body) tuples
+MALFORMED_BODIES = [
+    ("not JSON", b"{config: 3d6}"),
+    ("no config", b'{"num_trials": 1000}'),
+    ("config not an object", b'{"config": "3d6"}'),
+    ("no dice", b'{"config": {"dice": {}}}'),
+    ("unknown field", b'{"config": {"dice": {"6": 3}, "dice_count": 3}}'),
+    ("unknown mode", b'{"config": {"dice": {"6": 3}, "mode": "Average"}}'),
+    ("undefined custom die", b'{"config": {"dice": {"F": 4}}}'),
+    (
+        "too many drops",
+        b'{"config": {"dice": {"6": 3}, "mode_drop": "Drop lowest", "num_drops": 3}}',
+    ),
+    ("no trials", b'{"config": {"dice": {"6": 3}}, "num_trials": 0}'),
+    ("unknown sampler", b'{"config": {"dice": {"6": 3}}, "sampler": "Magic"}'),
+    ("negative seed", b'{"config": {"dice": {"6": 3}}, "seed": -1}'),
+]
+
+
+@pytest.fixture
+def one_batch_at_a_time(monkeypatch):
+    """
+    Splits sampled requests into small batches computed one at a time, so
+    that each batch publishes a snapshot of its own.
+    """
+    monkeypatch.setattr(sim_service.cfg, "SERVICE_BATCH_TRIALS", BATCH_TRIALS)
+    monkeypatch.setattr(service, "max_workers", 1)
+
+
+def run_with_service(client):
+    """
+    Starts the service on a free port of localhost, awaits client(port) and
+    returns what it returns once the service is shut down again.
+    """
+
+    async def main():
+        server = await service.start(HOST, 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            async with server:
+                return await client(port)
+        finally:
+            service.shutdown()
+
+    return asyncio.run(main())
+
+
+async def collect(request, port):
+    """
+    Returns the list of every snapshot the service streams for request.
+    """
+    return [
+        snapshot
+        async for snapshot in sim_service.fetch_distribution(request, HOST, port)
+    ]
+
+
+async def post(body, port):
+    """
+    Posts the raw body to /distribution and returns the response status.
+    """
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        writer.write(
+            b"POST /distribution HTTP/1.1\r\nHost: %s\r\nContent-Length: %d\r\n\r\n%s"
+            % (HOST.encode(), len(body), body)
+        )
+        await writer.drain()
+        return int((await reader.readline()).split()[1])
+    finally:
+        writer.close()
+
+
+def test_snapshots_refine_until_final(one_batch_at_a_time):
+    snapshots = run_with_service(lambda port: collect(SAMPLED_REQUEST, port))
+
+    num_trials = SAMPLED_REQUEST["num_trials"]
+    assert [s["num_trials"] for s in snapshots] == list(
+        range(BATCH_TRIALS, num_trials + 1, BATCH_TRIALS)
+    )
+    assert [s["final"] for s in snapshots] == [False] * (len(snapshots) - 1) + [True]
+    assert all(s["engine"] == "Monte Carlo" for s in snapshots)
+    std_errors = [max(s["std_error"]) for s in snapshots]
+    assert all(later < earlier for earlier, later in zip(std_errors, std_errors[1:]))
+    assert abs(sum(snapshots[-1]["probabilities"]) - 1) < 1e-12
+
+
+def test_identical_requests_share_computation(one_batch_at_a_time):
+    computations, coalesced = service.computations, service.coalesced
+    other_seed = dict(SAMPLED_REQUEST, seed=SAMPLED_REQUEST["seed"] + 1)
+
+    async def client(port):
+        return await asyncio.gather(
+            collect(SAMPLED_REQUEST, port),
+            collect(SAMPLED_REQUEST, port),
+            collect(other_seed, port),
+        )
+
+    first, second, other = run_with_service(client)
+
+    # The two identical requests are served by one computation and see every
+    #  one of its snapshots; the request with another seed gets its own
+    assert service.computations - computations == 2
+    assert service.coalesced - coalesced == 1
+    assert first == second
+    assert first[-1]["final"] and other[-1]["final"]
+    assert not np.array_equal(first[-1]["probabilities"], other[-1]["probabilities"])
+    assert not service.in_flight
+
+
+def test_exact_request_answered_once():
+    request = {"config": {"dice": {6: 3}}, "num_trials": 1000000}
+    snapshots = run_with_service(lambda port: collect(request, port))
+
+    assert len(snapshots) == 1 and snapshots[0]["final"]
+    assert snapshots[0]["engine"] == "Exact"
+    assert abs(snapshots[0]["mean"] - 10.5) < 1e-9
+
+
+@pytest.mark.parametrize(
+    "name, body", MALFORMED_BODIES, ids=[name for name, _ in MALFORMED_BODIES]
+)
+def test_malformed_request_refused(name, body):
+    computations = service.computations
+    status = run_with_service(lambda port: post(body, port))
+    assert 400 <= status < 500
+    assert service.computations == computations
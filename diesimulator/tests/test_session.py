@@ -0,0 +1,163 @@
+# Session files: runs and settings saved and opened again, and files that
+#  must open nothing.
+
+import json
+
+import numpy as np
+import pytest
+
+from diesimulator import sim_backend
+from diesimulator import sim_exact
+from diesimulator import sim_session
+
+from helpers import POOLS, SEED, sim
+
+session = sim_session.Session
+
+# Headers of session files that must open nothing, as (name, header) tuples
+CORRUPT_HEADERS = [
+    ("not an object", []),
+    ("no settings", {"runs": []}),
+    ("settings not an object", {"settings": [], "runs": []}),
+    ("no dice", {"settings": {}, "runs": []}),
+    ("no runs", {"settings": {"dice": {}}}),
+    ("run not an object", {"settings": {"dice": {}}, "runs": [3]}),
+    ("run without config", {"settings": {"dice": {}}, "runs": [{"arrays": {}}]}),
+    (
+        "run with invalid config",
+        {
+            "settings": {"dice": {}},
+            "runs": [
+                {
+                    "config": {"dice": {"6": 0}},
+                    "min_outcome": 0,
+                    "num_trials": 10,
+                    "metadata": {},
+                    "arrays": {"counts": ["<u1", 0, 1]},
+                }
+            ],
+        },
+    ),
+    (
+        "run without counts",
+        {
+            "settings": {"dice": {}},
+            "runs": [
+                {
+                    "config": {"dice": {"6": 1}},
+                    "min_outcome": 1,
+                    "num_trials": 10,
+                    "metadata": {},
+                    "arrays": {},
+                }
+            ],
+        },
+    ),
+    (
+        "run with bad dtype",
+        {
+            "settings": {"dice": {}},
+            "runs": [
+                {
+                    "config": {"dice": {"6": 1}},
+                    "min_outcome": 1,
+                    "num_trials": 10,
+                    "metadata": {},
+                    "arrays": {"counts": ["no such dtype", 0, 6]},
+                }
+            ],
+        },
+    ),
+]
+
+
+@pytest.fixture
+def saved_state():
+    """
+    Restores the Simulator's saved settings and the session's runs after
+    the test.
+    """
+    settings = {name: getattr(sim, name) for name in sim_session.SETTINGS}
+    runs = session.runs
+    session.runs = []
+    yield
+    for name, value in settings.items():
+        setattr(sim, name, value)
+    session.runs = runs
+
+
+def write_session(path, header):
+    """
+    Writes a session file at path with the JSON header header and no data.
+    """
+    header = json.dumps(header).encode()
+    with open(path, "wb") as file:
+        file.write(
+            sim_session.PREAMBLE.pack(
+                sim_session.MAGIC, sim_session.FORMAT_VERSION, len(header)
+            )
+        )
+        file.write(header)
+
+
+def test_saved_session_opens_as_saved(saved_state, tmp_path):
+    sampled = sim_backend.sample_with(
+        sim_backend.canonical_config(POOLS[1][1]),
+        10000,
+        "Antithetic",
+        sim_backend.make_rng("PCG64", SEED),
+    )
+    plain = sim_backend.sample_pool(
+        sim_backend.canonical_config(POOLS[12][1]),
+        10000,
+        sim_backend.make_rng("PCG64", SEED),
+    )
+    exact = sim_exact.exact_distribution(sim_backend.canonical_config(POOLS[2][1]))
+    for result in [sampled, plain, exact]:
+        session.add_result(result)
+    sim.dice = {6: 2, 8: 1}
+    sim.mode = "Highest"
+    path = str(tmp_path / "session.bin")
+    session.save(path)
+
+    session.runs = []
+    sim.dice = {}
+    sim.mode = "Sum"
+    assert session.open(path)
+    assert sim.dice == {6: 2, 8: 1} and sim.mode == "Highest"
+
+    assert len(session.runs) == 3
+    for index, expected in enumerate([exact, plain, sampled]):
+        result = session.result(index)
+        assert result.config == expected.config
+        assert result.min_outcome == expected.min_outcome
+        assert result.num_trials == expected.num_trials
+        assert np.array_equal(result.counts, expected.counts)
+        for key, value in expected.metadata.items():
+            if isinstance(value, np.ndarray):
+                assert np.array_equal(result.metadata[key], value)
+            else:
+                assert result.metadata[key] == value
+
+
+@pytest.mark.parametrize(
+    "name, header", CORRUPT_HEADERS, ids=[name for name, _ in CORRUPT_HEADERS]
+)
+def test_corrupt_session_opens_nothing(saved_state, tmp_path, name, header):
+    path = str(tmp_path / "session.bin")
+    write_session(path, header)
+    sim.dice = {6: 3}
+    runs = session.runs = [{"config": {}, "result": None}]
+
+    assert not session.open(path)
+    assert sim.dice == {6: 3}
+    assert session.runs is runs
+
+
+def test_missing_or_foreign_session_opens_nothing(saved_state, tmp_path):
+    path = tmp_path / "session.bin"
+    assert not session.open(str(path))
+    path.write_bytes(b"DSTB" + bytes(8))
+    assert not session.open(str(path))
+    path.write_bytes(b"DS")
+    assert not session.open(str(path))
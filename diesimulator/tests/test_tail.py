@@ -0,0 +1,50 @@
+# Importance sampling of tails far beyond what plain sampling sees, against
+#  the exact tail probabilities.
+
+import numpy as np
+import pytest
+
+from diesimulator import sim_backend
+from diesimulator import sim_exact
+from diesimulator import sim_tail
+
+from helpers import ALPHA, NUM_TRIALS, SEED, critical_value, pool_ids
+
+# Tails estimated by importance sampling, as (name, configuration, target,
+#  side) tuples
+TAIL_POOLS = [
+    (
+        "20d6 all succeed >= 6",
+        {"dice": {6: 20}, "mode": "Successes", "success_threshold": 6},
+        20,
+        "At least",
+    ),
+    ("20d6 at least 110", {"dice": {6: 20}}, 110, "At least"),
+    ("20d6 at most 30", {"dice": {6: 20}}, 30, "At most"),
+    (
+        "6d6+4d8 drop lowest 3, at least 48",
+        {"dice": {6: 6, 8: 4}, "mode_drop": "Drop lowest", "num_drops": 3},
+        48,
+        "At least",
+    ),
+    ("4d6! at least 50", {"dice": {6: 4}, "explode": [6]}, 50, "At least"),
+    (
+        "8dF at most -7",
+        {"dice": {"F": 8}, "custom_dice": {"F": {"faces": [-1, 0, 1]}}},
+        -7,
+        "At most",
+    ),
+]
+
+
+@pytest.mark.parametrize("pool_index", range(len(TAIL_POOLS)), ids=pool_ids(TAIL_POOLS))
+def test_tail_estimate_fits_exact(pool_index):
+    _, partial_config, target, side = TAIL_POOLS[pool_index]
+    config = sim_backend.canonical_config(partial_config)
+    exact = sim_exact.exact_distribution(config)
+    exact_tail = exact.probabilities()[sim_tail.tail_mask(exact, target, side)].sum()
+    rng = np.random.default_rng(sim_backend.spawn_seed(SEED, 30000 + pool_index))
+    result = sim_tail.sample_tail(config, NUM_TRIALS, target, side, rng)
+    estimate = result.metadata["tail_probability"]
+    z = abs(estimate - exact_tail) / max(result.metadata["tail_std_error"], 1e-300)
+    assert z <= critical_value(ALPHA), f"{estimate:.4e} vs {exact_tail:.4e}, z {z:.2f}"